@@ -1,5 +1,6 @@
-from ninja import Router
-from usuario.permisions import require_manage_purchases, _get_user_from_request, get_allowed_tiendas, require_edit_purchases, has_permission
+from ninja import File, Router
+from ninja.files import UploadedFile
+from usuario.permisions import require_manage_purchases, get_permission_context, require_edit_purchases, require_view_inventory, TiendaVia
 from compra.schemas import (
     CompraSchema,
     CompraInSchema,
@@ -8,24 +9,82 @@ from compra.schemas import (
     DetalleCompraUpdateSchema,
     CompraWithDetailsSchema,
     CompraUpdateSchema,
+    DetalleCompraLoteSchema,
+    DetalleCompraLoteResultadoSchema,
+    ReporteConsumoSchema,
+    SugerenciasSchema,
+    ImportacionResultadoSchema,
+    CambiosSchema,
+    MatrizComprasSchema,
 )
 from core.schemas import ErrorSchema
+from core.pagination import paginate_keyset, set_cursor_headers
+from core.versiones import etag_por_version
 from compra.models import Compra, DetalleCompra
+from compra.reportes import CONSUMO_COLUMNAS, consumo_por_producto
+from compra import cambios, exportar, importar, sugerencias
+from compra.escrituras import registrar_escritura
 from proveedor.models import Proveedor
 from producto.models import Producto
-from django.db.models import Sum, Prefetch
+from tienda.models import Tienda
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from ninja.responses import NinjaJSONEncoder
 from datetime import date
-from typing import Optional
+from typing import Literal, Optional
 from ninja.errors import HttpError
+import io
 import logging
 
 logger = logging.getLogger(__name__)
 # Límite superior aceptable para cantidades e inventarios (evita overflow en SQLite)
 MAX_ALLOWED = 10 ** 9
 
+# Máximo de compras (columnas) de la matriz de un proveedor
+MATRIZ_MAX_COMPRAS = 366
+
+# Campos de DetalleCompra que se pueden editar (individualmente o en lote)
+DETALLE_CAMPOS_EDITABLES = ("cantidad", "inventario_anterior")
+
 compra_router = Router(tags=["Compras"])
 
 
+def _coerce_int(val, default=0):
+    # Acepta int, str numérica, float; valores vacíos o None devuelven default
+    if val is None:
+        return default
+    if isinstance(val, int):
+        return val
+    try:
+        # strings: strip and try int, then float
+        if isinstance(val, str):
+            s = val.strip()
+            if s == "":
+                return default
+            return int(s)
+        # floats
+        if isinstance(val, float):
+            return int(val)
+        # other types fallback
+        return int(val)
+    except Exception:
+        return default
+
+
+def _sanear_valor(campo: str, raw, detalle_id: int) -> int:
+    """Coerciona `raw` a entero y lo limita a [0, MAX_ALLOWED]."""
+    coerced = _coerce_int(raw, default=0)
+    if coerced < 0:
+        logger.warning("%s negativo recibido (%r) para detalle_id=%s — ajustando a 0", campo, raw, detalle_id)
+        coerced = 0
+    if coerced > MAX_ALLOWED:
+        logger.warning("%s excesivo recibido (%r) para detalle_id=%s — limitando a %s", campo, raw, detalle_id, MAX_ALLOWED)
+        coerced = MAX_ALLOWED
+    logger.debug("coercing %s raw=%r -> %r for detalle_id=%s", campo, raw, coerced, detalle_id)
+    return coerced
+
+
 def _detalle_to_dict(detalle: DetalleCompra, request) -> dict:
     # Decidir visibilidad de inventario a partir del request y la tienda asociada
     tienda_id = None
@@ -34,9 +93,8 @@ def _detalle_to_dict(detalle: DetalleCompra, request) -> dict:
     except Exception:
         tienda_id = detalle.compra.proveedor.tienda_id if hasattr(detalle, 'compra') and hasattr(detalle.compra, 'proveedor') else None
     show_inventario = False
-    user = _get_user_from_request(request)
     if tienda_id is not None:
-        show_inventario = has_permission(user, tienda_id, "puede_ver_inventario_compras")
+        show_inventario = get_permission_context(request).has_permission(tienda_id, "puede_ver_inventario_compras")
     # Resolver nombre de producto robustamente (en caso de que no esté cargado por select_related)
     producto_nombre = None
     try:
@@ -61,15 +119,83 @@ def _detalle_to_dict(detalle: DetalleCompra, request) -> dict:
     }
 
 
-def _compra_to_dict(compra: Compra, detalles_list: list[DetalleCompra], request) -> dict:
+def _compras_to_dicts(compras: list[dict], show_inventario: bool) -> list[dict]:
+    """Serializa una página de compras (de un mismo proveedor) con una sola consulta de detalles.
+
+    `compras` son dicts con `id`, `proveedor` y `fecha_compra`; se les agrega `detalles`
+    ordenados por el `orden` del producto. El resultado ya tiene la forma de
+    `CompraWithDetailsSchema`, así que puede devolverse sin volver a validarlo.
+    """
+    por_compra = {}
+    for compra in compras:
+        compra["detalles"] = []
+        por_compra[compra["id"]] = compra["detalles"]
+    rows = (
+        DetalleCompra.objects.filter(compra_id__in=por_compra)
+        .order_by("producto__orden", "id")
+        .values_list("id", "compra_id", "producto_id", "cantidad", "inventario_anterior", "producto__nombre")
+    )
+    for detalle_id, compra_id, producto_id, cantidad, inventario_anterior, producto_nombre in rows:
+        por_compra[compra_id].append({
+            "id": detalle_id,
+            "compra_id": compra_id,
+            "producto_id": producto_id,
+            "cantidad": cantidad,
+            # si no puede ver inventario, devolver el marcador '?'
+            "inventario_anterior": inventario_anterior if show_inventario else "?",
+            "producto_nombre": producto_nombre,
+        })
+    return compras
+
+
+def _matriz(compras: list[tuple], show_inventario: bool) -> dict:
+    """Arma la matriz producto x fecha de `compras` (`(id, fecha_compra)` en orden) con
+    una sola consulta de detalles, ordenada por el `orden` del producto.
+
+    Las celdas sin detalle quedan en `None`; el inventario oculto, con el marcador '?'.
+    """
+    columnas = {compra_id: i for i, (compra_id, _) in enumerate(compras)}
+    ancho = len(compras)
+    producto_ids, productos = [], []
+    detalle_ids, cantidades, inventarios = [], [], []
+    rows = (
+        DetalleCompra.objects.filter(compra_id__in=columnas)
+        .order_by("producto__orden", "producto_id")
+        .values_list("producto_id", "producto__nombre", "compra_id", "id", "cantidad", "inventario_anterior")
+    )
+    base = 0
+    for producto_id, nombre, compra_id, detalle_id, cantidad, inventario in rows:
+        if not producto_ids or producto_ids[-1] != producto_id:
+            # nueva fila: reservar todas sus celdas
+            base = len(detalle_ids)
+            producto_ids.append(producto_id)
+            productos.append(nombre)
+            detalle_ids.extend([None] * ancho)
+            cantidades.extend([None] * ancho)
+            inventarios.extend([None] * ancho)
+        celda = base + columnas[compra_id]
+        detalle_ids[celda] = detalle_id
+        cantidades[celda] = cantidad
+        # si no puede ver inventario, devolver el marcador '?'
+        inventarios[celda] = inventario if show_inventario else "?"
     return {
-        "id": compra.id,
-        "proveedor_id": compra.proveedor_id,
-        "fecha_compra": compra.fecha_compra,
-        "detalles": [_detalle_to_dict(d, request) for d in detalles_list],
+        "producto_ids": producto_ids,
+        "productos": productos,
+        "compra_ids": list(columnas),
+        "fechas": [fecha for _, fecha in compras],
+        "detalle_ids": detalle_ids,
+        "cantidad": cantidades,
+        "inventario_anterior": inventarios,
     }
 
+
+def _json_response(data) -> JsonResponse:
+    # Respuesta ya serializada: Ninja la devuelve tal cual, sin revalidar cada campo
+    return JsonResponse(data, safe=False, encoder=NinjaJSONEncoder)
+
+
 @compra_router.get("/rango/{proveedor_id}/", response={200: list[CompraWithDetailsSchema], 400: ErrorSchema, 404: ErrorSchema})
+@etag_por_version("proveedor", "proveedor_id")
 def compras_por_rango(
     request,
     proveedor_id: int,
@@ -77,22 +203,26 @@ def compras_por_rango(
     fecha_fin: Optional[date] = None,
     limit: int = 3,
     order: str = "asc",
+    cursor: Optional[str] = None,
 ):
     """Devuelve hasta `limit` compras con detalles.
 
     - Si no se pasa `fecha_inicio` ni `fecha_fin`, devuelve las últimas `limit` compras.
     - Si se pasa un rango (`fecha_inicio` y `fecha_fin`), devuelve las últimas `limit` compras dentro de ese rango.
     - Parámetro `order`: `asc` para ascendente (fecha antigua->nueva), `desc` para descendente (por defecto).
+    - Paginación por keyset sobre (proveedor, fecha_compra): las cabeceras `X-Next-Cursor` /
+      `X-Prev-Cursor` traen el `cursor` para pedir la página siguiente / anterior.
+    - GET condicional: con `If-None-Match` igual al `ETag` anterior responde 304 si el proveedor no cambió.
     """
-    # Validar que el proveedor exista
-    if not Proveedor.objects.filter(id=proveedor_id).exists():
+    # Validar que el proveedor exista y obtener su tienda
+    tienda_id = Proveedor.objects.filter(id=proveedor_id).values_list("tienda_id", flat=True).first()
+    if tienda_id is None:
         return 404, {"message": "Proveedor no encontrado"}
 
     # Verificar acceso del usuario a la tienda de ese proveedor (GETs libres pero filtradas)
-    user = _get_user_from_request(request)
-    allowed = get_allowed_tiendas(user)
-    proveedor_obj = Proveedor.objects.get(id=proveedor_id)
-    if allowed is not None and proveedor_obj.tienda_id not in allowed:
+    ctx = get_permission_context(request)
+    allowed = ctx.get_allowed_tiendas()
+    if allowed is not None and tienda_id not in allowed:
         return []
 
     # Filtrar por proveedor recibido en la ruta
@@ -100,165 +230,370 @@ def compras_por_rango(
     if fecha_inicio and fecha_fin:
         qs = qs.filter(fecha_compra__range=(fecha_inicio, fecha_fin))
 
-    # Prefetch detalles con su producto para que el ModelSchema pueda resolver producto.nombre
-    # y ordenar los detalles según el `orden` del producto
-    qs = qs.prefetch_related(
-        Prefetch("detalles", queryset=DetalleCompra.objects.select_related("producto").order_by("producto__orden"))
-    )
+    # fecha_compra es única por proveedor: basta como clave del keyset
+    descending = str(order).lower() == "desc"
+    page = paginate_keyset(qs.values("id", "proveedor", "fecha_compra"), ("fecha_compra",), limit, cursor, descending)
+    # la visibilidad del inventario se decide una sola vez: todas las compras son de la misma tienda
+    show_inventario = ctx.has_permission(tienda_id, "puede_ver_inventario_compras")
+    response = _json_response(_compras_to_dicts(page.items, show_inventario))
+    set_cursor_headers(response, page)
+    return response
+
+
 
-    ordering = "fecha_compra" if (str(order).lower() != "desc") else "-fecha_compra"
-    compras = list(qs.order_by(ordering)[:limit])
-    # convertir a dicts: la visibilidad del inventario se decidirá dentro de los helpers con el request
-    result = [_compra_to_dict(c, list(c.detalles.all()), request) for c in compras]
-    return result
+@compra_router.get("/matriz/{proveedor_id}/", response={200: MatrizComprasSchema, 403: ErrorSchema, 404: ErrorSchema})
+@etag_por_version("proveedor", "proveedor_id")
+def matriz_compras(
+    request,
+    proveedor_id: int,
+    fecha_inicio: Optional[date] = None,
+    fecha_fin: Optional[date] = None,
+    limit: int = 30,
+):
+    """Las últimas `limit` compras del proveedor (dentro del rango, si se indica) como
+    matriz producto x fecha para la vista de planilla.
 
+    Productos y fechas vienen una sola vez; `detalle_ids`, `cantidad` e
+    `inventario_anterior` son listas planas por filas (un producto por fila, una fecha
+    por columna, en orden ascendente). Mucho más chica que `/rango/` para la misma grilla.
+    Soporta GET condicional (`ETag` / `If-None-Match`) por versión del proveedor.
+    """
+    tienda_id = Proveedor.objects.filter(id=proveedor_id).values_list("tienda_id", flat=True).first()
+    if tienda_id is None:
+        return 404, {"message": "Proveedor no encontrado"}
+    ctx = get_permission_context(request)
+    allowed = ctx.get_allowed_tiendas()
+    if allowed is not None and tienda_id not in allowed:
+        return 403, {"message": "No autorizado para esta tienda"}
+
+    qs = Compra.objects.filter(proveedor_id=proveedor_id)
+    if fecha_inicio:
+        qs = qs.filter(fecha_compra__gte=fecha_inicio)
+    if fecha_fin:
+        qs = qs.filter(fecha_compra__lte=fecha_fin)
+    limit = min(max(limit, 1), MATRIZ_MAX_COMPRAS)
+    compras = list(qs.order_by("-fecha_compra").values_list("id", "fecha_compra")[:limit])
+    compras.reverse()
+    show_inventario = ctx.has_permission(tienda_id, "puede_ver_inventario_compras")
+    return _json_response(_matriz(compras, show_inventario))
 
 
 @compra_router.post("/crear/", response={200: CompraWithDetailsSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema})
-@require_manage_purchases()
+@require_manage_purchases(TiendaVia("proveedor", "compra_in", "proveedor_id"))
 def crear_compra(request, compra_in: CompraInSchema):
     """Crea una nueva compra y genera un detalle por cada producto del proveedor con valores en 0."""
     # Validación: no permitir más de una compra en la misma fecha para el mismo proveedor
     if Compra.objects.filter(proveedor_id=compra_in.proveedor_id, fecha_compra=compra_in.fecha_compra).exists():
         return 400, {"message": "Ya existe una compra para este proveedor en la fecha indicada."}
 
-    compra = Compra.objects.create(**compra_in.dict())
-
-    # Obtener el proveedor de la compra y filtrar productos por esa instancia
-    proveedor_obj = compra.proveedor
-    # asegurar orden por `orden` del producto al crear detalles
-    productos = Producto.objects.filter(proveedor=proveedor_obj).order_by("orden")
-    detalles_creados = []
-    for producto in productos:
-        cantidad_compra = 0
-        detalle = DetalleCompra.objects.create(
-            compra=compra,
-            producto=producto,
-            cantidad=cantidad_compra,
-            inventario_anterior=0,
-        )
-        detalles_creados.append(detalle)
-
-    # Devolver la instancia ORM con los detalles precargados para que el schema pueda resolver nombres
-    compra_con_detalles = (
-        Compra.objects.prefetch_related(
-            Prefetch("detalles", queryset=DetalleCompra.objects.select_related("producto").order_by("producto__orden"))
-        ).get(id=compra.id)
-    )
-    return _compra_to_dict(compra_con_detalles, list(compra_con_detalles.detalles.all()), request)
-
+    # Compra + detalles en una sola transacción y un número fijo de consultas:
+    # un INSERT ... SELECT crea todos los detalles sin importar el tamaño del catálogo
+    try:
+        with transaction.atomic():
+            with registrar_escritura([compra_in.proveedor_id]) as escritura:
+                compra = Compra.objects.create(**compra_in.dict())
+                escritura.compras = Compra.objects.filter(pk=compra.pk)
+            detalle_ids = DetalleCompra.objects.crear_vacios_para_compra(compra)
+    except IntegrityError:
+        return 400, {"message": "Ya existe una compra para este proveedor en la fecha indicada."}
 
-@compra_router.post("/detalle/crear/{compra_id}/", response={200: DetalleCompraSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema})
-@require_manage_purchases()
+    productos = Producto.objects.filter(proveedor_id=compra.proveedor_id).order_by("orden").values_list("id", "nombre")
+    # `request.tienda_id` lo deja resuelto el decorador de permisos
+    show_inventario = get_permission_context(request).has_permission(request.tienda_id, "puede_ver_inventario_compras")
+    # Construir la respuesta en memoria, sin volver a leer los detalles recién creados
+    detalles = [
+        {
+            "id": detalle_ids[producto_id],
+            "compra_id": compra.id,
+            "producto_id": producto_id,
+            "cantidad": 0,
+            "inventario_anterior": 0 if show_inventario else "?",
+            "producto_nombre": nombre,
+        }
+        for producto_id, nombre in productos
+        if producto_id in detalle_ids
+    ]
+    return {"id": compra.id, "proveedor_id": compra.proveedor_id, "fecha_compra": compra.fecha_compra, "detalles": detalles}
+
+
+@compra_router.post("/detalle/crear/{compra_id}/", response={200: DetalleCompraSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_purchases(TiendaVia("compra", "compra_id"))
 def crear_detalle(request, compra_id: int, detalle_in: DetalleCompraInSchema):
     """Crea un nuevo detalle de compra para una compra existente."""
     compra = Compra.objects.get(id=compra_id)
     producto = Producto.objects.get(id=detalle_in.producto_id)
-    detalle = DetalleCompra.objects.create(
-        compra=compra,
-        producto=producto,
-        cantidad=detalle_in.cantidad,
-        inventario_anterior=detalle_in.inventario_anterior,
-    )
+    with registrar_escritura([compra.proveedor_id]) as escritura:
+        detalle = DetalleCompra.objects.create(
+            compra=compra,
+            producto=producto,
+            cantidad=detalle_in.cantidad,
+            inventario_anterior=detalle_in.inventario_anterior,
+        )
+        escritura.detalles = DetalleCompra.objects.filter(id=detalle.id)
     detalle_obj = DetalleCompra.objects.select_related("producto", "compra__proveedor").get(id=detalle.id)
     return _detalle_to_dict(detalle_obj, request)
 
 
 @compra_router.patch("/detalle/editar/{detalle_id}/", response={200: DetalleCompraSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_edit_purchases()
+@require_edit_purchases(TiendaVia("detalle", "detalle_id"))
 def editar_detalle(request, detalle_id: int, detalle_in: DetalleCompraUpdateSchema):
-    """Edita un detalle de compra existente."""
-    detalle = DetalleCompra.objects.select_related("producto", "compra__proveedor").get(id=detalle_id)
-    # Aplicar sólo los campos realmente presentes en el JSON del request (PATCH parcial)
-    import json
-    try:
-        body_data = json.loads(request.body) if request.body else {}
-    except Exception:
-        body_data = {}
-
-    updated = False
+    """Edita un detalle de compra existente.
 
-    def _coerce_int(val, default=0):
-        # Acepta int, str numérica, float; valores vacíos o None devuelven default
-        if val is None:
-            return default
-        if isinstance(val, int):
-            return val
-        try:
-            # strings: strip and try int, then float
-            if isinstance(val, str):
-                s = val.strip()
-                if s == "":
-                    return default
-                return int(s)
-            # floats
-            if isinstance(val, float):
-                return int(val)
-            # other types fallback
-            return int(val)
-        except Exception:
-            return default
-
-    # Si el cliente envió 'cantidad' lo aplicamos coercionado
-    if "cantidad" in body_data:
-        raw = body_data.get("cantidad")
-        coerced = _coerce_int(raw, default=0)
-        if coerced < 0:
-            logger.warning("editar_detalle: cantidad negativa recibida (%r) para detalle_id=%s — ajustando a 0", raw, detalle_id)
-            coerced = 0
-        if coerced > MAX_ALLOWED:
-            logger.warning("editar_detalle: cantidad excesiva recibida (%r) para detalle_id=%s — limitando a %s", raw, detalle_id, MAX_ALLOWED)
-            coerced = MAX_ALLOWED
-        logger.debug("editar_detalle: coercing cantidad raw=%r -> %r for detalle_id=%s", raw, coerced, detalle_id)
-        detalle.cantidad = coerced
-        updated = True
-
-    # Si el cliente envió 'inventario_anterior' lo aplicamos coercionado
-    if "inventario_anterior" in body_data:
-        raw = body_data.get("inventario_anterior")
-        coerced = _coerce_int(raw, default=0)
-        if coerced < 0:
-            logger.warning("editar_detalle: inventario_anterior negativo recibido (%r) para detalle_id=%s — ajustando a 0", raw, detalle_id)
-            coerced = 0
-        if coerced > MAX_ALLOWED:
-            logger.warning("editar_detalle: inventario_anterior excesivo recibido (%r) para detalle_id=%s — limitando a %s", raw, detalle_id, MAX_ALLOWED)
-            coerced = MAX_ALLOWED
-        logger.debug("editar_detalle: coercing inventario_anterior raw=%r -> %r for detalle_id=%s", raw, coerced, detalle_id)
-        detalle.inventario_anterior = coerced
-        updated = True
-
-    if updated:
+    Sólo se escriben los campos enviados (PATCH parcial), con un único UPDATE que
+    devuelve la fila actualizada; no hay lecturas previas ni posteriores.
+    """
+    valores = {
+        campo: _sanear_valor(campo, getattr(detalle_in, campo), detalle_id)
+        for campo in DETALLE_CAMPOS_EDITABLES
+        if campo in detalle_in.model_fields_set
+    }
+    try:
+        fila = DetalleCompra.objects.actualizar_y_devolver(detalle_id, valores)
+    except Exception as e:
+        logger.exception("Error saving DetalleCompra id=%s with data=%s: %s", detalle_id, valores, e)
+        return 400, {"message": "Error al actualizar detalle"}
+    if fila is None:
+        return 404, {"message": "Detalle no encontrado"}
+    # `request.tienda_id` lo deja resuelto el decorador de permisos
+    if not get_permission_context(request).has_permission(request.tienda_id, "puede_ver_inventario_compras"):
+        fila["inventario_anterior"] = "?"
+    return fila
+
+
+@compra_router.patch("/detalle/lote/editar/", response={200: list[DetalleCompraLoteResultadoSchema], 400: ErrorSchema, 401: ErrorSchema})
+def editar_detalles_lote(request, lote_in: DetalleCompraLoteSchema):
+    """Edita muchos detalles en una sola petición (edición tipo planilla).
+
+    Cada item aplica sólo los campos enviados, con la misma coerción y límites que
+    `editar_detalle`. Los permisos se comprueban una vez por tienda y todos los
+    cambios se guardan con un único `bulk_update` en una transacción. La respuesta
+    trae un resultado por item, en el mismo orden.
+    """
+    ctx = get_permission_context(request)
+    if not ctx.user:
+        return 401, {"message": "Token inválido o no proporcionado"}
+
+    ids = {item.detalle_id for item in lote_in.items}
+    detalles = {
+        d.id: d
+        for d in DetalleCompra.objects.filter(id__in=ids).annotate(
+            tienda_id=F("compra__proveedor__tienda_id"),
+            producto_nombre=F("producto__nombre"),
+            proveedor_id=F("compra__proveedor_id"),
+        )
+    }
+    tiendas = {d.tienda_id for d in detalles.values()}
+    puede_editar = {t: ctx.has_permission(t, "puede_editar_compras") for t in tiendas}
+    puede_ver = {t: ctx.has_permission(t, "puede_ver_inventario_compras") for t in tiendas}
+
+    resultados = []
+    modificados = {}
+    campos = set()
+    for item in lote_in.items:
+        detalle = detalles.get(item.detalle_id)
+        if detalle is None:
+            resultados.append({"detalle_id": item.detalle_id, "ok": False, "message": "Detalle no encontrado"})
+            continue
+        if not puede_editar[detalle.tienda_id]:
+            resultados.append({"detalle_id": item.detalle_id, "ok": False, "message": "No autorizado para esta operación"})
+            continue
+        for campo in DETALLE_CAMPOS_EDITABLES:
+            if campo in item.model_fields_set:
+                setattr(detalle, campo, _sanear_valor(campo, getattr(item, campo), detalle.id))
+                campos.add(campo)
+                modificados[detalle.id] = detalle
+        resultados.append({"detalle_id": item.detalle_id, "ok": True, "detalle": detalle})
+
+    if modificados:
         try:
-            detalle.save()
+            with registrar_escritura(
+                {d.proveedor_id for d in modificados.values()},
+                detalles=DetalleCompra.objects.filter(id__in=list(modificados)),
+            ):
+                DetalleCompra.objects.bulk_update(list(modificados.values()), sorted(campos))
         except Exception as e:
-            logger.exception("Error saving DetalleCompra id=%s with data=%s: %s", detalle_id, body_data, e)
-            return 400, {"message": "Error al actualizar detalle"}
-    detalle_obj = DetalleCompra.objects.select_related("producto", "compra__proveedor").get(id=detalle.id)
-    return _detalle_to_dict(detalle_obj, request)
+            logger.exception("Error guardando lote de %s detalles: %s", len(modificados), e)
+            return 400, {"message": "Error al actualizar detalles"}
+
+    for resultado in resultados:
+        detalle = resultado.get("detalle")
+        if detalle is not None:
+            resultado["detalle"] = {
+                "id": detalle.id,
+                "compra_id": detalle.compra_id,
+                "producto_id": detalle.producto_id,
+                "cantidad": detalle.cantidad,
+                "inventario_anterior": detalle.inventario_anterior if puede_ver[detalle.tienda_id] else "?",
+                "producto_nombre": detalle.producto_nombre,
+            }
+    return resultados
+
 
 @compra_router.patch("/compra/{compra}/", response={200: CompraSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_manage_purchases()
+@require_manage_purchases(TiendaVia("compra", "compra"))
 def actualizar_compra(request, compra: int, compra_in: CompraUpdateSchema):
     """Actualiza una compra existente."""
     compra_obj = Compra.objects.get(id=compra)
-    if compra_in.fecha_compra:
-        compra_obj.fecha_compra = compra_in.fecha_compra
-    compra_obj.save()
+    # el resumen mensual cambia tanto en el mes anterior como en el nuevo
+    with registrar_escritura(
+        [compra_obj.proveedor_id],
+        compras=Compra.objects.filter(pk=compra_obj.id),
+        detalles=DetalleCompra.objects.filter(compra_id=compra_obj.id),
+        mueve_fechas=True,
+    ):
+        if compra_in.fecha_compra:
+            compra_obj.fecha_compra = compra_in.fecha_compra
+        compra_obj.save()
     return compra_obj
 
 @compra_router.delete("/detalle/eliminar/{detalle_id}/", response={200: dict, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_manage_purchases()
+@require_manage_purchases(TiendaVia("detalle", "detalle_id"))
 def eliminar_detalle(request, detalle_id: int):
     """Elimina un detalle de compra existente."""
-    detalle = DetalleCompra.objects.get(id=detalle_id)
-    detalle.delete()
+    detalle = DetalleCompra.objects.select_related("compra").get(id=detalle_id)
+    with registrar_escritura(
+        [detalle.compra.proveedor_id], detalles=DetalleCompra.objects.filter(id=detalle.id), eliminado=True
+    ):
+        detalle.delete()
     return {"mensaje": "Detalle de compra eliminado correctamente."}
 
 
 @compra_router.delete("/eliminar/{compra_id}/", response={200: dict, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_manage_purchases()
+@require_manage_purchases(TiendaVia("compra", "compra_id"))
 def eliminar_compra(request, compra_id: int):
     """Elimina una compra (y sus detalles por cascade)."""
     compra = Compra.objects.get(id=compra_id)
-    compra.delete()
+    with registrar_escritura(
+        [compra.proveedor_id],
+        compras=Compra.objects.filter(pk=compra.id),
+        detalles=DetalleCompra.objects.filter(compra_id=compra.id),
+        eliminado=True,
+    ):
+        compra.delete()
     return {"mensaje": "Compra eliminada correctamente."}
+
+
+@compra_router.get("/reporte/consumo/proveedor/{proveedor_id}/", response={200: ReporteConsumoSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_view_inventory(TiendaVia("proveedor", "proveedor_id"))
+def reporte_consumo_proveedor(request, proveedor_id: int, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None):
+    """Consumo, compras y consumo diario promedio por producto de un proveedor (ver `consumo_por_producto`)."""
+    filas = consumo_por_producto(proveedor_id=proveedor_id, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    return {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin, "columnas": CONSUMO_COLUMNAS, "filas": filas}
+
+
+@compra_router.get("/reporte/consumo/tienda/{tienda_id}/", response={200: ReporteConsumoSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_view_inventory()
+def reporte_consumo_tienda(request, tienda_id: int, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None):
+    """Consumo, compras y consumo diario promedio por producto de todos los proveedores de una tienda."""
+    filas = consumo_por_producto(tienda_id=tienda_id, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    return {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin, "columnas": CONSUMO_COLUMNAS, "filas": filas}
+
+
+@compra_router.get("/sugerencias/tienda/{tienda_id}/", response={200: SugerenciasSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_view_inventory()
+def sugerencias_tienda(request, tienda_id: int, fecha: Optional[date] = None):
+    """Cantidad sugerida a pedir en la próxima compra para cada producto de la tienda.
+
+    Se basa en el consumo suavizado de los últimos meses más un stock de seguridad
+    (ver `compra.sugerencias`). `fecha` es el día de la compra a planificar (hoy por defecto).
+    """
+    fecha = fecha or date.today()
+    proveedores = Proveedor.objects.filter(tienda_id=tienda_id).order_by("id").values_list("id", flat=True)
+    filas = sugerencias.sugerencias_por_proveedor(list(proveedores), fecha)
+    return {"fecha": fecha, "columnas": sugerencias.SUGERENCIA_COLUMNAS, "filas": filas}
+
+
+def _exportar_response(rows, formato: str, nombre: str) -> StreamingHttpResponse:
+    if formato == "xlsx":
+        response = StreamingHttpResponse(
+            exportar.xlsx_partes(rows),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+    else:
+        response = StreamingHttpResponse(exportar.csv_partes(rows), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{nombre}.{formato}"'
+    return response
+
+
+def _exportar(request, tienda_id: int, formato: str, nombre: str, filtros: dict):
+    ctx = get_permission_context(request)
+    allowed = ctx.get_allowed_tiendas()
+    if allowed is not None and tienda_id not in allowed:
+        return 403, {"message": "No autorizado para esta tienda"}
+    show_inventario = ctx.has_permission(tienda_id, "puede_ver_inventario_compras")
+    return _exportar_response(exportar.filas(show_inventario=show_inventario, **filtros), formato, nombre)
+
+
+@compra_router.get("/exportar/proveedor/{proveedor_id}/", response={200: None, 403: ErrorSchema, 404: ErrorSchema})
+def exportar_proveedor(
+    request,
+    proveedor_id: int,
+    fecha_inicio: Optional[date] = None,
+    fecha_fin: Optional[date] = None,
+    formato: Literal["csv", "xlsx"] = "csv",
+):
+    """Descarga el historial de compras de un proveedor (una fila por detalle), en CSV o XLSX.
+
+    La respuesta se genera por partes: sirve para historiales de cualquier tamaño.
+    """
+    tienda_id = Proveedor.objects.filter(id=proveedor_id).values_list("tienda_id", flat=True).first()
+    if tienda_id is None:
+        return 404, {"message": "Proveedor no encontrado"}
+    return _exportar(
+        request, tienda_id, formato, f"compras_proveedor_{proveedor_id}",
+        {"proveedor_id": proveedor_id, "fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin},
+    )
+
+
+@compra_router.get("/exportar/tienda/{tienda_id}/", response={200: None, 403: ErrorSchema, 404: ErrorSchema})
+def exportar_tienda(
+    request,
+    tienda_id: int,
+    fecha_inicio: Optional[date] = None,
+    fecha_fin: Optional[date] = None,
+    formato: Literal["csv", "xlsx"] = "csv",
+):
+    """Descarga el historial de compras de todos los proveedores de una tienda, en CSV o XLSX."""
+    if not Tienda.objects.filter(id=tienda_id).exists():
+        return 404, {"message": "Tienda no encontrada"}
+    return _exportar(
+        request, tienda_id, formato, f"compras_tienda_{tienda_id}",
+        {"tienda_id": tienda_id, "fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin},
+    )
+
+
+@compra_router.post("/importar/tienda/{tienda_id}/", response={200: ImportacionResultadoSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_purchases()
+def importar_compras(request, tienda_id: int, archivo: UploadedFile = File(...)):
+    """Importa compras históricas desde un CSV (ver `compra.importar` para el formato).
+
+    Los productos que falten se crean sólo si el usuario puede gestionar productos
+    en la tienda; si no, sus filas se informan como error.
+    """
+    crear_productos = get_permission_context(request).has_permission(tienda_id, "puede_gestionar_productos")
+    texto = io.TextIOWrapper(archivo.file, encoding="utf-8-sig", newline="")
+    try:
+        resultado = importar.importar(texto, tienda_id, crear_productos=crear_productos)
+    except (ValueError, UnicodeDecodeError) as e:
+        return 400, {"message": f"Archivo inválido: {e}"}
+    return resultado
+
+
+
+@compra_router.get("/cambios/tienda/{tienda_id}/", response={200: CambiosSchema, 403: ErrorSchema, 404: ErrorSchema})
+def cambios_tienda(request, tienda_id: int, desde: int = 0, limit: int = cambios.LIMITE):
+    """Productos, compras y detalles de la tienda creados, modificados o borrados después
+    del cambio `desde` (sincronización incremental, ver `compra.cambios`).
+
+    Con `desde=0` se recibe todo. Se guarda `hasta` para la próxima llamada y se repite
+    mientras `completo` sea falso. `limit` es la cantidad máxima de cambios por respuesta.
+    """
+    if not Tienda.objects.filter(id=tienda_id).exists():
+        return 404, {"message": "Tienda no encontrada"}
+    ctx = get_permission_context(request)
+    allowed = ctx.get_allowed_tiendas()
+    if allowed is not None and tienda_id not in allowed:
+        return 403, {"message": "No autorizado para esta tienda"}
+    limit = min(max(limit, 1), cambios.LIMITE_MAXIMO)
+    show_inventario = ctx.has_permission(tienda_id, "puede_ver_inventario_compras")
+    return _json_response(cambios.desde(tienda_id, desde, limit, show_inventario))
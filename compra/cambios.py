@@ -0,0 +1,104 @@
+"""Registro de cambios por tienda para clientes que sincronizan sin conexión.
+
+Cada escritura sobre productos, compras o detalles agrega con `registrar()` (desde
+`compra.escrituras.registrar_escritura`) una fila por objeto tocado en `Cambio`,
+con un único INSERT ... SELECT y en la misma transacción que la escritura (también
+en las escrituras masivas). Los borrados se registran como lápidas
+(`eliminado=True`) antes de borrar, incluidos los objetos que caen en cascada.
+
+Un cliente guarda el último `id` de cambio que aplicó y pide `desde(tienda, id)`:
+recibe las filas actuales de lo que cambió después y los ids borrados, en lugar de
+volver a descargar todas las compras.
+
+Los `id` crecen en el orden de las escrituras porque SQLite las serializa; con un
+backend con escrituras concurrentes, una transacción lenta podría confirmar un `id`
+menor que otro ya leído por un cliente.
+"""
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import BooleanField, CharField, Value
+
+from compra.models import Cambio, Compra, DetalleCompra
+from producto.models import Producto
+
+
+PRODUCTO, COMPRA, DETALLE = Cambio.PRODUCTO, Cambio.COMPRA, Cambio.DETALLE
+
+# Cambios por respuesta de `desde`: por defecto y máximo que se acepta
+LIMITE = 1000
+LIMITE_MAXIMO = 5000
+
+# camino hasta la tienda desde cada modelo registrado
+_TIENDA = {
+    PRODUCTO: "proveedor__tienda_id",
+    COMPRA: "proveedor__tienda_id",
+    DETALLE: "compra__proveedor__tienda_id",
+}
+
+_MODELOS = {PRODUCTO: Producto, COMPRA: Compra, DETALLE: DetalleCompra}
+
+_CAMPOS = {
+    PRODUCTO: ("id", "nombre", "proveedor_id", "orden"),
+    COMPRA: ("id", "proveedor_id", "fecha_compra"),
+    DETALLE: ("id", "compra_id", "producto_id", "cantidad", "inventario_anterior"),
+}
+
+
+def registrar(modelo: str, qs, eliminado: bool = False) -> None:
+    """Registra un cambio por cada objeto del queryset `qs` (del modelo `modelo`).
+
+    Debe llamarse en la misma transacción que la escritura; para borrados
+    (`eliminado=True`), antes de borrar.
+    """
+    filas = qs.order_by().annotate(
+        cambio_modelo=Value(modelo, CharField()),
+        cambio_eliminado=Value(eliminado, BooleanField()),
+    ).values_list(_TIENDA[modelo], "cambio_modelo", "id", "cambio_eliminado")
+    connection = connections[qs.db]
+    try:
+        sql, params = filas.query.sql_with_params()
+    except EmptyResultSet:
+        return
+    table = connection.ops.quote_name(Cambio._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} (tienda_id, modelo, objeto_id, eliminado) {sql}", params)
+
+
+def desde(tienda_id: int, ultimo: int, limite: int = LIMITE, show_inventario: bool = True) -> dict:
+    """Cambios de la tienda posteriores al cambio `ultimo`, de a `limite` cambios.
+
+    Devuelve las filas actuales de los objetos creados o modificados y los ids de los
+    borrados. Si un objeto cambió varias veces sólo cuenta su último cambio.
+    `hasta` es el `ultimo` a usar en la siguiente llamada; `completo` indica que no
+    quedan más cambios por ahora.
+    """
+    cambios = list(
+        Cambio.objects.filter(tienda_id=tienda_id, id__gt=ultimo)
+        .order_by("id")
+        .values_list("id", "modelo", "objeto_id", "eliminado")[:limite]
+    )
+    estado = {}
+    for _, modelo, objeto_id, eliminado in cambios:
+        estado[(modelo, objeto_id)] = eliminado
+    vigentes = {modelo: [] for modelo in _MODELOS}
+    eliminados = {modelo: [] for modelo in _MODELOS}
+    for (modelo, objeto_id), eliminado in estado.items():
+        (eliminados if eliminado else vigentes)[modelo].append(objeto_id)
+
+    resultado = {
+        "desde": ultimo,
+        "hasta": cambios[-1][0] if cambios else ultimo,
+        "completo": len(cambios) < limite,
+    }
+    for modelo, model in _MODELOS.items():
+        filas = []
+        if vigentes[modelo]:
+            # un objeto borrado después de `hasta` ya no está: su lápida llega en la próxima llamada
+            filas = list(model.objects.filter(id__in=vigentes[modelo]).order_by("id").values(*_CAMPOS[modelo]))
+        if modelo == DETALLE and not show_inventario:
+            for fila in filas:
+                # si no puede ver inventario, devolver el marcador '?'
+                fila["inventario_anterior"] = "?"
+        resultado[f"{modelo}s"] = filas
+    resultado["eliminados"] = {f"{modelo}s": sorted(ids) for modelo, ids in eliminados.items()}
+    return resultado
@@ -0,0 +1,95 @@
+"""Lo que acompaña a toda escritura sobre productos, compras y detalles.
+
+En la misma transacción que la escritura hay que:
+
+- marcar los (producto, mes) de los detalles tocados para `compra.resumen`,
+- recalcular el stock de sus productos (`compra.stock`),
+- agregar lo tocado al registro de cambios (`compra.cambios`), como lápidas si se borra,
+- y subir la versión de los proveedores y la de los datos de sus tiendas
+  (`core.versiones`, al confirmar).
+
+`registrar_escritura()` hace las cuatro cosas alrededor del bloque que escribe, cada
+una en el momento que necesita (las marcas y lápidas de un borrado, antes de
+borrar). Las vistas, la importación y los métodos de `DetalleCompraManager` sólo
+dicen qué tocaron; no llaman a esos módulos por separado.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from compra import cambios, resumen
+from compra import stock as compra_stock
+from core import versiones
+from proveedor.models import Proveedor
+
+
+@dataclass
+class Escritura:
+    """Lo que escribe un bloque de `registrar_escritura`.
+
+    El bloque puede completar los querysets o los proveedores que sólo conoce
+    después de escribir (por ejemplo, el id de lo que acaba de crear).
+    """
+    proveedores: set = field(default_factory=set)
+    productos: QuerySet | None = None
+    compras: QuerySet | None = None
+    detalles: QuerySet | None = None
+
+
+@contextmanager
+def registrar_escritura(
+    proveedor_ids=(), *, productos=None, compras=None, detalles=None,
+    eliminado: bool = False, mueve_fechas: bool = False, stock=None, using=None,
+):
+    """Envuelve en una transacción la escritura de `productos`, `compras` y `detalles`
+    (querysets de lo que se escribe, o de lo que se va a borrar) de los proveedores
+    `proveedor_ids`, y devuelve la `Escritura` para completarla dentro del bloque.
+
+    Con `eliminado=True` el bloque borra; si borra los productos, su resumen y su
+    stock caen con ellos en cascada y no se recalculan. Con `mueve_fechas=True` (la
+    compra cambia de fecha) el resumen se marca también antes de escribir, por el mes
+    que dejan los detalles.
+
+    El stock se recalcula para los productos de `detalles`, o para los de `stock`
+    (ids o queryset de ids) si se indica. Los lotes de una escritura masiva pasan
+    `stock=()` y lo recalculan una sola vez al terminar (`compra.importar`): hacerlo
+    en cada lote recorrería el historial de los mismos productos una y otra vez.
+    """
+    escritura = Escritura(set(proveedor_ids), productos, compras, detalles)
+    with transaction.atomic(using=using):
+        if eliminado:
+            if escritura.productos is None and escritura.detalles is not None:
+                resumen.marcar(escritura.detalles)
+                if stock is None:
+                    # después de borrar ya no se pueden leer los productos de los detalles
+                    stock = list(escritura.detalles.values_list("producto_id", flat=True).distinct())
+            for modelo, qs in ((cambios.DETALLE, escritura.detalles), (cambios.COMPRA, escritura.compras),
+                               (cambios.PRODUCTO, escritura.productos)):
+                if qs is not None:
+                    cambios.registrar(modelo, qs, eliminado=True)
+        elif mueve_fechas and escritura.detalles is not None:
+            resumen.marcar(escritura.detalles)
+
+        yield escritura
+
+        if not eliminado:
+            for modelo, qs in ((cambios.PRODUCTO, escritura.productos), (cambios.COMPRA, escritura.compras),
+                               (cambios.DETALLE, escritura.detalles)):
+                if qs is not None:
+                    cambios.registrar(modelo, qs)
+            if escritura.detalles is not None:
+                resumen.marcar(escritura.detalles)
+                if stock is None:
+                    stock = escritura.detalles.values("producto_id")
+        if stock is not None:
+            compra_stock.actualizar(stock)
+        versiones.bump("proveedor", *escritura.proveedores)
+        if escritura.proveedores:
+            # lo que resume a todos los proveedores de una tienda (el listado con resumen)
+            # se valida contra esta versión sin tener que listar los proveedores
+            versiones.bump(
+                "datos_tienda",
+                *Proveedor.objects.filter(id__in=escritura.proveedores).values_list("tienda_id", flat=True).distinct(),
+            )
@@ -0,0 +1,181 @@
+"""Exportación del historial de compras en CSV o XLSX, generada por partes.
+
+Las filas se leen con `QuerySet.iterator(chunk_size=...)` y cada parte se entrega
+a `StreamingHttpResponse` apenas está lista: la memoria no crece con el tamaño del
+historial y los primeros bytes salen sin esperar al resto.
+
+Las filas de cada proveedor salen en orden (fecha, producto) recorriendo los índices
+de `compra` (proveedor, fecha_compra) y de `detalle_compra` (compra, producto), sin
+ordenar nada antes de la primera fila. La exportación de una tienda encadena la
+de cada uno de sus proveedores, por `id`.
+"""
+import csv
+import zipfile
+from xml.sax.saxutils import escape
+
+from compra.models import DetalleCompra
+from proveedor.models import Proveedor
+
+
+CHUNK_SIZE = 2000
+
+EXPORT_COLUMNAS = [
+    "proveedor_id",
+    "proveedor",
+    "compra_id",
+    "fecha_compra",
+    "producto_id",
+    "producto",
+    "cantidad",
+    "inventario_anterior",
+]
+
+
+def _filas_proveedor(proveedor_id, fecha_inicio=None, fecha_fin=None):
+    qs = DetalleCompra.objects.filter(compra__proveedor_id=proveedor_id)
+    if fecha_inicio:
+        qs = qs.filter(compra__fecha_compra__gte=fecha_inicio)
+    if fecha_fin:
+        qs = qs.filter(compra__fecha_compra__lte=fecha_fin)
+    rows = qs.order_by("compra__fecha_compra", "producto_id").values_list(
+        "compra__proveedor_id", "compra__proveedor__nombre", "compra_id", "compra__fecha_compra",
+        "producto_id", "producto__nombre", "cantidad", "inventario_anterior",
+    )
+    return rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def filas(proveedor_id=None, tienda_id=None, fecha_inicio=None, fecha_fin=None, show_inventario=True):
+    """Itera las filas (en el orden de `EXPORT_COLUMNAS`) de un proveedor o de una tienda."""
+    if proveedor_id is not None:
+        proveedores = [proveedor_id]
+    else:
+        # una consulta por proveedor: ordenar la tienda completa de una vez obliga a
+        # SQLite a ordenar todos sus detalles antes de devolver la primera fila
+        proveedores = Proveedor.objects.filter(tienda_id=tienda_id).order_by("id").values_list("id", flat=True)
+    for proveedor in proveedores:
+        for row in _filas_proveedor(proveedor, fecha_inicio, fecha_fin):
+            if not show_inventario:
+                # mismo marcador que en las respuestas JSON
+                row = (*row[:-1], "?")
+            yield row
+
+
+class _Eco:
+    """Pseudo-archivo para `csv.writer`: devuelve lo escrito en lugar de guardarlo."""
+
+    def write(self, value):
+        return value
+
+
+def csv_partes(rows):
+    writer = csv.writer(_Eco())
+    yield writer.writerow(EXPORT_COLUMNAS)
+    parte = []
+    for row in rows:
+        parte.append(writer.writerow(row))
+        if len(parte) >= CHUNK_SIZE:
+            yield "".join(parte)
+            parte = []
+    if parte:
+        yield "".join(parte)
+
+
+class _Buffer:
+    """Destino no posicionable para `zipfile`: acumula bytes hasta que se retiran."""
+
+    def __init__(self):
+        self._partes = []
+        self._escritos = 0
+
+    def write(self, data):
+        self._partes.append(bytes(data))
+        self._escritos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._escritos
+
+    def flush(self):
+        pass
+
+    def retirar(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes = []
+        return data
+
+
+_XLSX_ESTATICOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="compras" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def _celda(value) -> str:
+    if isinstance(value, int):
+        return f"<c><v>{value}</v></c>"
+    # fechas como texto ISO: no hace falta una hoja de estilos
+    text = value.isoformat() if hasattr(value, "isoformat") else str(value)
+    return f'<c t="inlineStr"><is><t>{escape(text)}</t></is></c>'
+
+
+def xlsx_partes(rows):
+    """Genera un .xlsx mínimo (una hoja, textos en línea) sin dependencias externas.
+
+    Excel sólo abre las primeras 1.048.576 filas de una hoja: para historiales más
+    grandes conviene el CSV.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre, contenido in _XLSX_ESTATICOS.items():
+            zf.writestr(nombre, contenido)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja.write(("<row>" + "".join(_celda(c) for c in EXPORT_COLUMNAS) + "</row>").encode())
+            parte = []
+            for row in rows:
+                parte.append("<row>" + "".join(_celda(c) for c in row) + "</row>")
+                if len(parte) >= CHUNK_SIZE:
+                    hoja.write("".join(parte).encode())
+                    parte = []
+                    data = buffer.retirar()
+                    if data:
+                        yield data
+            if parte:
+                hoja.write("".join(parte).encode())
+            hoja.write(b"</sheetData></worksheet>")
+    yield buffer.retirar()
@@ -0,0 +1,279 @@
+"""Importación de compras históricas desde CSV.
+
+Columnas (con encabezado, separadas por `,` o `;`):
+`proveedor, fecha, producto, cantidad, inventario_anterior`.
+
+- `proveedor` es el nombre de un proveedor existente de la tienda.
+- `fecha` en formato `AAAA-MM-DD` o `DD/MM/AAAA`.
+- Los productos que no existan se crean al final del `orden` de su proveedor.
+- Las compras (proveedor, fecha) que no existan se crean; si ya existe el detalle de
+  un producto en esa compra, se sobrescriben sus valores.
+
+Las filas se guardan de a `lote`, cada lote en su propia transacción: productos y
+compras nuevos con `bulk_create`, detalles con un único INSERT ... ON CONFLICT
+ejecutado por lotes, y lo tocado pasa por `registrar_escritura` (resumen, stock,
+cambios y versión) como cualquier otra escritura. Una fila inválida no detiene la
+importación: se informa en `errores` con su número de línea. Al final, por cada
+proveedor importado, se crean los detalles (0, 0) que falten en sus compras (como
+hace el alta normal) y se recalcula su stock.
+"""
+import csv
+import logging
+import operator
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache, reduce
+
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.constants import OnConflict
+
+from compra.escrituras import registrar_escritura
+from compra.models import Compra, DetalleCompra
+from producto.models import Producto
+from producto.orden import PASO
+from proveedor.models import Proveedor
+
+logger = logging.getLogger(__name__)
+
+LOTE = 10000
+
+# términos (grupos de compras) por consulta al buscar los detalles escritos en un lote
+# (ver `_escritos`)
+COMPRAS_POR_CONSULTA = 200
+
+COLUMNAS = ("proveedor", "fecha", "producto", "cantidad", "inventario_anterior")
+
+
+@dataclass
+class ResultadoImportacion:
+    filas: int = 0
+    importadas: int = 0
+    compras_creadas: int = 0
+    productos_creados: int = 0
+    errores: list = field(default_factory=list)
+
+    def error(self, fila: int, message: str) -> None:
+        self.errores.append({"fila": fila, "message": message})
+
+
+@lru_cache(maxsize=4096)
+def _fecha(raw: str) -> date:
+    raw = raw.strip()
+    if "/" in raw:
+        return datetime.strptime(raw, "%d/%m/%Y").date()
+    return date.fromisoformat(raw)
+
+
+def _entero(raw: str, campo: str, maximo: int) -> int:
+    try:
+        valor = int(raw)
+    except ValueError:
+        if raw.strip():
+            raise ValueError(f"{campo} no es un número entero: {raw!r}")
+        valor = 0
+    if not 0 <= valor <= maximo:
+        raise ValueError(f"{campo} fuera de rango: {valor}")
+    return valor
+
+
+def _lector(archivo):
+    """`csv.reader` sobre `archivo` (texto) detectando `,` o `;` en el encabezado."""
+    encabezado = archivo.readline()
+    delimitador = ";" if encabezado.count(";") > encabezado.count(",") else ","
+    columnas = [c.strip().lower() for c in next(csv.reader([encabezado], delimiter=delimitador), [])]
+    faltan = [c for c in COLUMNAS if c not in columnas]
+    if faltan:
+        raise ValueError(f"Faltan columnas en el encabezado: {', '.join(faltan)}")
+    posiciones = [columnas.index(c) for c in COLUMNAS]
+    return csv.reader(archivo, delimiter=delimitador), posiciones
+
+
+class _Importador:
+    def __init__(self, tienda_id: int, crear_productos: bool, resultado: ResultadoImportacion):
+        self.crear_productos = crear_productos
+        self.resultado = resultado
+        self.proveedores = dict(Proveedor.objects.filter(tienda_id=tienda_id).values_list("nombre", "id"))
+        # por proveedor, cargados al tocarlo por primera vez
+        self.productos = {}
+        self.orden = {}
+        self.compras = {}
+        self.vistos = set()
+        self.tocados = set()
+
+    def _cargar(self, proveedor_id: int) -> None:
+        if proveedor_id in self.productos:
+            return
+        self.productos[proveedor_id] = {}
+        self.orden[proveedor_id] = 0
+        for pk, nombre, orden in Producto.objects.filter(proveedor_id=proveedor_id).values_list("id", "nombre", "orden"):
+            self.productos[proveedor_id][nombre] = pk
+            self.orden[proveedor_id] = max(self.orden[proveedor_id], orden or 0)
+        self.compras[proveedor_id] = dict(
+            Compra.objects.filter(proveedor_id=proveedor_id).values_list("fecha_compra", "id")
+        )
+
+    def guardar(self, filas: list) -> None:
+        """Guarda un lote de filas ya validadas `(linea, proveedor_id, fecha, producto, cantidad, inventario)`."""
+        proveedores = {f[1] for f in filas}
+        lote, errores = filas, len(self.resultado.errores)
+        try:
+            # el stock, una vez por proveedor al terminar (ver `importar`)
+            with registrar_escritura(proveedores, stock=()) as escritura:
+                for proveedor_id in proveedores:
+                    self._cargar(proveedor_id)
+                filas, productos_creados = self._crear_productos(filas)
+                compras_creadas = self._crear_compras(filas)
+                self._guardar_detalles(filas)
+                escritura.productos = Producto.objects.filter(pk__in=productos_creados)
+                escritura.compras = Compra.objects.filter(pk__in=compras_creadas)
+                escritura.detalles = self._escritos(filas)
+        except DatabaseError as e:
+            logger.exception("Error importando un lote de %s filas: %s", len(filas), e)
+            # lo creado en el lote se deshizo: recargar esos proveedores en el próximo lote
+            for proveedor_id in proveedores:
+                self.productos.pop(proveedor_id, None)
+            del self.resultado.errores[errores:]
+            for linea, *_ in lote:
+                self.resultado.error(linea, "Error al guardar el lote de esta fila")
+            return
+        self.resultado.importadas += len(filas)
+        self.resultado.productos_creados += len(productos_creados)
+        self.resultado.compras_creadas += len(compras_creadas)
+        self.tocados |= proveedores
+
+    def _guardar_detalles(self, filas: list) -> None:
+        # miles de filas por lote: `executemany` con la misma sentencia que generaría
+        # `bulk_create(update_conflicts=True)`, sin instanciar un modelo por fila
+        connection = connections[DetalleCompra.objects.db]
+        qn = connection.ops.quote_name
+        fields = [DetalleCompra._meta.get_field(c) for c in ("compra", "producto", "cantidad", "inventario_anterior")]
+        sql = (
+            f"INSERT INTO {qn(DetalleCompra._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+            f"VALUES (%s, %s, %s, %s) "
+            + connection.ops.on_conflict_suffix_sql(
+                fields, OnConflict.UPDATE, [f.column for f in fields[2:]], [f.column for f in fields[:2]]
+            )
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                sql,
+                [
+                    (self.compras[proveedor_id][fecha], self.productos[proveedor_id][nombre], cantidad, inventario)
+                    for _, proveedor_id, fecha, nombre, cantidad, inventario in filas
+                ],
+            )
+
+    def _escritos(self, filas: list):
+        """Los detalles que escribió `filas`: sólo sus pares (compra, producto)."""
+        por_compra = defaultdict(set)
+        for _, proveedor_id, fecha, nombre, _, _ in filas:
+            por_compra[self.compras[proveedor_id][fecha]].add(self.productos[proveedor_id][nombre])
+        # las compras con los mismos productos (lo normal: todo el catálogo en cada
+        # fecha) comparten término; cada término lo resuelve `unique_producto_por_compra`
+        por_productos = defaultdict(list)
+        for compra_id, productos in por_compra.items():
+            por_productos[frozenset(productos)].append(compra_id)
+        grupos = [
+            Q(compra_id__in=compras, producto_id__in=productos) for productos, compras in por_productos.items()
+        ]
+        if len(grupos) <= COMPRAS_POR_CONSULTA:
+            return DetalleCompra.objects.filter(reduce(operator.or_, grupos))
+        # demasiados términos para un solo OR (profundidad de expresión de SQLite):
+        # buscar los ids de a COMPRAS_POR_CONSULTA
+        ids = []
+        for i in range(0, len(grupos), COMPRAS_POR_CONSULTA):
+            ids.extend(
+                DetalleCompra.objects.filter(reduce(operator.or_, grupos[i:i + COMPRAS_POR_CONSULTA]))
+                .values_list("id", flat=True)
+            )
+        return DetalleCompra.objects.filter(id__in=ids)
+
+    def _crear_productos(self, filas: list) -> tuple[list, list]:
+        nuevos = {}
+        validas = []
+        for fila in filas:
+            linea, proveedor_id, _, nombre, _, _ = fila
+            if nombre not in self.productos[proveedor_id]:
+                if not self.crear_productos:
+                    self.resultado.error(linea, f"Producto no encontrado: {nombre!r}")
+                    continue
+                if (proveedor_id, nombre) not in nuevos:
+                    self.orden[proveedor_id] += PASO
+                    nuevos[(proveedor_id, nombre)] = Producto(
+                        nombre=nombre, proveedor_id=proveedor_id, orden=self.orden[proveedor_id]
+                    )
+            validas.append(fila)
+        Producto.objects.bulk_create(nuevos.values())
+        for producto in nuevos.values():
+            self.productos[producto.proveedor_id][producto.nombre] = producto.pk
+        return validas, [p.pk for p in nuevos.values()]
+
+    def _crear_compras(self, filas: list) -> list:
+        nuevas = {}
+        for _, proveedor_id, fecha, _, _, _ in filas:
+            if fecha not in self.compras[proveedor_id] and (proveedor_id, fecha) not in nuevas:
+                nuevas[(proveedor_id, fecha)] = Compra(proveedor_id=proveedor_id, fecha_compra=fecha)
+        Compra.objects.bulk_create(nuevas.values())
+        for compra in nuevas.values():
+            self.compras[compra.proveedor_id][compra.fecha_compra] = compra.pk
+        return [c.pk for c in nuevas.values()]
+
+
+def importar(archivo, tienda_id: int, crear_productos: bool = True, lote: int = LOTE) -> ResultadoImportacion:
+    """Importa el CSV `archivo` (objeto de texto) en la tienda `tienda_id`.
+
+    Lanza `ValueError` si el encabezado no es válido; los errores de cada fila se
+    devuelven en el resultado.
+    """
+    # import local: compra.api importa este módulo
+    from compra.api import MAX_ALLOWED
+
+    reader, posiciones = _lector(archivo)
+    n_columnas = max(posiciones) + 1
+    max_nombre = Producto._meta.get_field("nombre").max_length
+    resultado = ResultadoImportacion()
+    importador = _Importador(tienda_id, crear_productos, resultado)
+    pendientes = []
+    for linea, row in enumerate(reader, start=2):
+        if not "".join(row).strip():
+            continue
+        resultado.filas += 1
+        if len(row) < n_columnas:
+            row += [""] * (n_columnas - len(row))
+        try:
+            proveedor, fecha, producto, cantidad, inventario = [row[i] for i in posiciones]
+            proveedor_id = importador.proveedores.get(proveedor.strip())
+            if proveedor_id is None:
+                raise ValueError(f"Proveedor no encontrado: {proveedor.strip()!r}")
+            try:
+                fecha = _fecha(fecha)
+            except ValueError:
+                raise ValueError(f"fecha inválida: {fecha!r}")
+            producto = producto.strip()
+            if not producto or len(producto) > max_nombre:
+                raise ValueError(f"producto inválido: {producto!r}")
+            cantidad = _entero(cantidad, "cantidad", MAX_ALLOWED)
+            inventario = _entero(inventario, "inventario_anterior", MAX_ALLOWED)
+        except ValueError as e:
+            resultado.error(linea, str(e))
+            continue
+        clave = (proveedor_id, fecha, producto)
+        if clave in importador.vistos:
+            resultado.error(linea, "Fila repetida: ya hay otra con el mismo proveedor, fecha y producto")
+            continue
+        importador.vistos.add(clave)
+        pendientes.append((linea, proveedor_id, fecha, producto, cantidad, inventario))
+        if len(pendientes) >= lote:
+            importador.guardar(pendientes)
+            pendientes = []
+    if pendientes:
+        importador.guardar(pendientes)
+
+    for proveedor_id in importador.tocados:
+        # una vez por proveedor y no por lote: el stock depende de todo su historial
+        with registrar_escritura([proveedor_id], stock=Producto.objects.filter(proveedor_id=proveedor_id).values("id")):
+            # como el alta normal: cada compra con un detalle por cada producto del proveedor
+            DetalleCompra.objects.completar_vacios(proveedor_id=proveedor_id)
+    return resultado
@@ -0,0 +1,91 @@
+import json
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+from ninja.responses import NinjaJSONEncoder
+
+from compra.api import _compras_to_dicts, _detalle_to_dict
+from compra.models import Compra, DetalleCompra
+from compra.schemas import CompraWithDetailsSchema
+from producto.models import Producto
+from proveedor.models import Proveedor
+from tienda.models import Tienda
+from usuario.permisions import PermissionContext
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Comparar el serializador por lotes de compras_por_rango con el serializador por fila anterior'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compras', type=int, default=3)
+        parser.add_argument('--productos', type=int, default=500)
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Los datos de prueba se crean dentro de una transacción que se deshace al final
+        try:
+            with transaction.atomic():
+                self._run(options['compras'], options['productos'], options['repeticiones'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, n_compras, n_productos, repeticiones):
+        tienda = Tienda.objects.create(nombre='__benchmark__')
+        proveedor = Proveedor.objects.create(nombre='__benchmark__', tienda=tienda)
+        Producto.objects.bulk_create(
+            [Producto(nombre=f'producto {i}', proveedor=proveedor, orden=i) for i in range(n_productos)]
+        )
+        for i in range(n_compras):
+            compra = Compra.objects.create(proveedor=proveedor, fecha_compra=date(2000, 1, 1) + timedelta(days=i))
+            DetalleCompra.objects.crear_vacios_para_compra(compra)
+
+        # request mínimo con permisos ya resueltos: se mide sólo la serialización
+        permisos = {tienda.id: {'puede_ver_inventario_compras': True}}
+        request = SimpleNamespace(_permission_context=PermissionContext(SimpleNamespace(id=0), permisos))
+        qs = Compra.objects.filter(proveedor=proveedor).order_by('fecha_compra')
+
+        def por_fila():
+            compras = qs.prefetch_related(
+                Prefetch('detalles', queryset=DetalleCompra.objects.select_related('producto', 'compra__proveedor').order_by('producto__orden'))
+            )
+            data = [
+                {
+                    'id': c.id,
+                    'proveedor_id': c.proveedor_id,
+                    'fecha_compra': c.fecha_compra,
+                    'detalles': [_detalle_to_dict(d, request) for d in c.detalles.all()],
+                }
+                for c in compras
+            ]
+            validated = [CompraWithDetailsSchema.model_validate(c).model_dump() for c in data]
+            return json.dumps(validated, cls=NinjaJSONEncoder)
+
+        def por_lote():
+            compras = list(qs.values('id', 'proveedor', 'fecha_compra'))
+            return json.dumps(_compras_to_dicts(compras, True), cls=NinjaJSONEncoder)
+
+        assert json.loads(por_fila()) == json.loads(por_lote())
+        t_fila = self._medir(por_fila, repeticiones)
+        t_lote = self._medir(por_lote, repeticiones)
+        self.stdout.write(f'{n_compras} compras x {n_productos} detalles, mejor de {repeticiones}:')
+        self.stdout.write(f'  por fila: {t_fila * 1000:8.2f} ms')
+        self.stdout.write(f'  por lote: {t_lote * 1000:8.2f} ms')
+        self.stdout.write(self.style.SUCCESS(f'  speedup:  {t_fila / t_lote:8.1f}x'))
+
+    @staticmethod
+    def _medir(fn, repeticiones):
+        mejor = float('inf')
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            fn()
+            mejor = min(mejor, time.perf_counter() - inicio)
+        return mejor
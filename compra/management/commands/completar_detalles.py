@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from compra.models import DetalleCompra
+
+
+class Command(BaseCommand):
+    help = 'Crear los DetalleCompra (0, 0) que falten entre compras y productos de cada proveedor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proveedor', type=int, help='Limitar a un proveedor')
+
+    def handle(self, *args, **options):
+        creados = DetalleCompra.objects.completar_vacios(proveedor_id=options.get('proveedor'))
+        self.stdout.write(self.style.SUCCESS(f'Detalles creados: {creados}'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from compra.importar import LOTE, importar
+from tienda.models import Tienda
+
+
+class Command(BaseCommand):
+    help = 'Importar compras históricas de una tienda desde un CSV (proveedor, fecha, producto, cantidad, inventario_anterior)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV (UTF-8)')
+        parser.add_argument('--tienda', type=int, required=True)
+        parser.add_argument('--lote', type=int, default=LOTE, help='Filas por transacción')
+        parser.add_argument('--sin-crear-productos', action='store_true', help='Informar como error los productos que no existan')
+
+    def handle(self, *args, **options):
+        if not Tienda.objects.filter(id=options['tienda']).exists():
+            raise CommandError('Tienda no encontrada')
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                resultado = importar(
+                    archivo, options['tienda'],
+                    crear_productos=not options['sin_crear_productos'], lote=options['lote'],
+                )
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+        for error in resultado.errores:
+            self.stderr.write(f"fila {error['fila']}: {error['message']}")
+        self.stdout.write(
+            f'Filas: {resultado.filas}, importadas: {resultado.importadas}, '
+            f'compras creadas: {resultado.compras_creadas}, productos creados: {resultado.productos_creados}'
+        )
+        if resultado.errores:
+            self.stdout.write(self.style.WARNING(f'Filas con error: {len(resultado.errores)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Importación completa'))
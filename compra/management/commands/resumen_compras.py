@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from compra import resumen
+from compra.models import DetalleCompra, ResumenCompra
+from producto.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Reconstruir o verificar por lotes el resumen mensual de compras (ResumenCompra)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconstruir', action='store_true', help='Recalcular todo el resumen desde detalle_compra')
+        parser.add_argument('--verificar', action='store_true', help='Comparar el resumen guardado con un recálculo')
+        parser.add_argument('--lote', type=int, default=resumen.LOTE, help='Productos o pares (producto, mes) por lote')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        if options['reconstruir']:
+            with transaction.atomic():
+                ResumenCompra.objects.all().delete()
+                resumen.marcar(DetalleCompra.objects.all())
+            procesados = resumen.refrescar_pendientes(lote)
+            self.stdout.write(self.style.SUCCESS(f'Resumen reconstruido: {procesados} (producto, mes) calculados'))
+        else:
+            procesados = resumen.refrescar_pendientes(lote)
+            self.stdout.write(f'Pendientes procesados: {procesados}')
+
+        if options['verificar']:
+            ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+            errores = 0
+            for i in range(0, len(ids), lote):
+                errores += resumen.diferencias(ids[i:i + lote])
+            if errores:
+                self.stdout.write(self.style.ERROR(f'{errores} resúmenes no coinciden; ejecutar con --reconstruir'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Resumen verificado: sin diferencias'))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def marcar_historial(apps, schema_editor):
+    # El resumen arranca vacío: dejar todo el historial pendiente de calcular
+    DetalleCompra = apps.get_model('compra', 'DetalleCompra')
+    ResumenPendiente = apps.get_model('compra', 'ResumenPendiente')
+    pares = (
+        DetalleCompra.objects.annotate(periodo=TruncMonth('compra__fecha_compra'))
+        .values_list('producto_id', 'periodo')
+        .distinct()
+    )
+    ResumenPendiente.objects.bulk_create(
+        [ResumenPendiente(producto_id=producto_id, periodo=periodo) for producto_id, periodo in pares],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compra', '0002_compra_unique_compra_proveedor_fecha_and_more'),
+        ('producto', '0004_producto_proveedor_orden_idx'),
+        ('proveedor', '0001_initial'),
+        ('tienda', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField()),
+                ('compras', models.PositiveIntegerField(default=0)),
+                ('cantidad_total', models.PositiveBigIntegerField(default=0)),
+                ('inventario_total', models.PositiveBigIntegerField(default=0)),
+                ('primera_fecha', models.DateField()),
+                ('inventario_primero', models.PositiveIntegerField(default=0)),
+                ('ultima_fecha', models.DateField()),
+                ('inventario_ultimo', models.PositiveIntegerField(default=0)),
+                ('cantidad_ultima', models.PositiveIntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='producto.producto')),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='proveedor.proveedor')),
+                ('tienda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tienda.tienda')),
+            ],
+            options={
+                'db_table': 'resumen_compra',
+                'indexes': [models.Index(fields=['proveedor', 'periodo'], name='resumen_proveedor_periodo_idx'), models.Index(fields=['tienda', 'periodo'], name='resumen_tienda_periodo_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'periodo'), name='unique_resumen_producto_periodo')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='producto.producto')),
+            ],
+            options={
+                'db_table': 'resumen_pendiente',
+                'constraints': [models.UniqueConstraint(fields=('producto', 'periodo'), name='unique_resumen_pendiente')],
+            },
+        ),
+        migrations.RunPython(marcar_historial, migrations.RunPython.noop),
+    ]
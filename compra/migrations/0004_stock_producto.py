@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def calcular_stock(apps, schema_editor):
+    # Partir con el stock de todos los productos que ya tienen historial
+    Producto = apps.get_model('producto', 'Producto')
+    DetalleCompra = apps.get_model('compra', 'DetalleCompra')
+    StockProducto = apps.get_model('compra', 'StockProducto')
+    ultimos = DetalleCompra.objects.filter(producto_id=OuterRef('pk')).order_by('-compra__fecha_compra')
+    comprados = DetalleCompra.objects.filter(producto_id=OuterRef('pk'), cantidad__gt=0).order_by('-compra__fecha_compra')
+    filas = Producto.objects.annotate(
+        s_fecha_inventario=Subquery(ultimos.values('compra__fecha_compra')[:1]),
+        s_inventario=Subquery(ultimos.values('inventario_anterior')[:1]),
+        s_fecha_ultima_compra=Subquery(comprados.values('compra__fecha_compra')[:1]),
+        s_cantidad_ultima_compra=Subquery(comprados.values('cantidad')[:1]),
+    ).values_list('pk', 's_fecha_inventario', 's_inventario', 's_fecha_ultima_compra', 's_cantidad_ultima_compra')
+    StockProducto.objects.bulk_create(
+        [
+            StockProducto(
+                producto_id=pk, fecha_inventario=fecha_inv, inventario=inv,
+                fecha_ultima_compra=fecha_compra, cantidad_ultima_compra=cantidad,
+            )
+            for pk, fecha_inv, inv, fecha_compra, cantidad in filas.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compra', '0003_resumen_compra'),
+        ('producto', '0004_producto_proveedor_orden_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detallecompra',
+            index=models.Index(condition=models.Q(('cantidad__gt', 0)), fields=['producto', 'compra'], name='detalle_comprado_idx'),
+        ),
+        migrations.CreateModel(
+            name='StockProducto',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='producto.producto')),
+                ('fecha_inventario', models.DateField(null=True)),
+                ('inventario', models.PositiveIntegerField(null=True)),
+                ('fecha_ultima_compra', models.DateField(null=True)),
+                ('cantidad_ultima_compra', models.PositiveIntegerField(null=True)),
+            ],
+            options={
+                'db_table': 'stock_producto',
+            },
+        ),
+        migrations.RunPython(calcular_stock, migrations.RunPython.noop),
+    ]
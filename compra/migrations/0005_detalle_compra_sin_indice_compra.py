@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compra', '0004_stock_producto'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detallecompra',
+            name='compra',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='compra.compra'),
+        ),
+    ]
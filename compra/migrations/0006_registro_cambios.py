@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:28
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.db import migrations, models
+from django.db.models import BooleanField, CharField, Value
+
+
+def registrar_existentes(apps, schema_editor):
+    # Partir con un cambio por cada objeto existente: `desde=0` devuelve todo
+    Cambio = apps.get_model('compra', 'Cambio')
+    consultas = [
+        ('producto', apps.get_model('producto', 'Producto').objects.all(), 'proveedor__tienda_id'),
+        ('compra', apps.get_model('compra', 'Compra').objects.all(), 'proveedor__tienda_id'),
+        ('detalle', apps.get_model('compra', 'DetalleCompra').objects.all(), 'compra__proveedor__tienda_id'),
+    ]
+    table = schema_editor.quote_name(Cambio._meta.db_table)
+    for modelo, qs, tienda in consultas:
+        sql, params = qs.order_by('id').annotate(
+            cambio_modelo=Value(modelo, CharField()), cambio_eliminado=Value(False, BooleanField()),
+        ).values_list(tienda, 'cambio_modelo', 'id', 'cambio_eliminado').query.sql_with_params()
+        schema_editor.execute(f"INSERT INTO {table} (tienda_id, modelo, objeto_id, eliminado) {sql}", params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compra', '0005_detalle_compra_sin_indice_compra'),
+        ('producto', '0004_producto_proveedor_orden_idx'),
+        ('tienda', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('producto', 'Producto'), ('compra', 'Compra'), ('detalle', 'Detalle de compra')], max_length=10)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('eliminado', models.BooleanField(default=False)),
+                ('fecha', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+                ('tienda', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tienda.tienda')),
+            ],
+            options={
+                'db_table': 'cambio',
+                'indexes': [models.Index(fields=['tienda', 'id'], name='cambio_tienda_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compra', '0006_registro_cambios'),
+        ('tienda', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cambio',
+            index=models.Index(fields=['tienda', 'fecha'], name='cambio_tienda_fecha_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import F
+from django.db.models.functions import Now
+from django.db.models.constants import OnConflict
 from django.utils import timezone
 # Create your models here.
 
@@ -11,14 +14,228 @@ class Compra(models.Model):
             models.UniqueConstraint(fields=["proveedor", "fecha_compra"], name="unique_compra_proveedor_fecha"),
         ]
 
+def _registrar_escritura(*args, **kwargs):
+    # import local: compra.escrituras importa estos modelos
+    from compra.escrituras import registrar_escritura
+    return registrar_escritura(*args, **kwargs)
+
+
+class DetalleCompraManager(models.Manager):
+    def crear_vacios_para_compra(self, compra) -> dict[int, int]:
+        """Crea con un único INSERT ... SELECT un detalle (0, 0) por cada producto del
+        proveedor de `compra` y devuelve `{producto_id: detalle_id}`.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        producto_table = self.model._meta.get_field("producto").related_model._meta.db_table
+        sql = (
+            f"INSERT INTO {qn(self.model._meta.db_table)} (compra_id, producto_id, cantidad, inventario_anterior) "
+            f"SELECT %s, id, 0, 0 FROM {qn(producto_table)} WHERE proveedor_id = %s"
+        )
+        params = [compra.pk, compra.proveedor_id]
+        with _registrar_escritura([compra.proveedor_id], detalles=self.filter(compra=compra), using=self.db):
+            with connection.cursor() as cursor:
+                if connection.features.can_return_rows_from_bulk_insert:
+                    cursor.execute(sql + " RETURNING producto_id, id", params)
+                    creados = dict(cursor.fetchall())
+                else:
+                    cursor.execute(sql, params)
+                    creados = dict(self.filter(compra=compra).values_list("producto_id", "id"))
+        return creados
+
+    def actualizar_y_devolver(self, detalle_id: int, valores: dict) -> dict | None:
+        """Actualiza sólo las columnas de `valores` y devuelve la fila resultante
+        (con `producto_nombre`), o `None` si el detalle no existe.
+
+        Donde el backend soporta UPDATE ... RETURNING es una única sentencia.
+        """
+        columnas = ("id", "compra_id", "producto_id", "cantidad", "inventario_anterior")
+        connection = connections[self.db]
+        soporta_returning = (
+            connection.vendor in ("sqlite", "postgresql") and connection.features.can_return_columns_from_insert
+        )
+        if not valores:
+            return self.filter(pk=detalle_id).values(*columnas, producto_nombre=F("producto__nombre")).first()
+        if not soporta_returning:
+            with _registrar_escritura(detalles=self.filter(pk=detalle_id), using=self.db) as escritura:
+                self.filter(pk=detalle_id).update(**valores)
+                escritura.proveedores.update(self.filter(pk=detalle_id).values_list("compra__proveedor_id", flat=True))
+            return self.filter(pk=detalle_id).values(*columnas, producto_nombre=F("producto__nombre")).first()
+
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        producto_table = qn(self.model._meta.get_field("producto").related_model._meta.db_table)
+        compra_table = qn(self.model._meta.get_field("compra").related_model._meta.db_table)
+        sets = ", ".join(f"{qn(self.model._meta.get_field(campo).column)} = %s" for campo in valores)
+        sql = (
+            f"UPDATE {table} SET {sets} WHERE id = %s "
+            f"RETURNING {', '.join(columnas)}, "
+            f"(SELECT nombre FROM {producto_table} WHERE {producto_table}.id = {table}.producto_id), "
+            f"(SELECT proveedor_id FROM {compra_table} WHERE {compra_table}.id = {table}.compra_id)"
+        )
+        with _registrar_escritura(detalles=self.filter(pk=detalle_id), using=self.db) as escritura:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [*valores.values(), detalle_id])
+                row = cursor.fetchone()
+            if row is not None:
+                escritura.proveedores.add(row[-1])
+        if row is None:
+            return None
+        return dict(zip((*columnas, "producto_nombre"), row[:-1]))
+
+    def completar_vacios(self, proveedor_id: int | None = None, producto_ids=None) -> int:
+        """Crea con un único INSERT ... SELECT los detalles (0, 0) que falten entre las
+        compras y los productos de un mismo proveedor (sólo `producto_ids`, si se indican).
+
+        Los pares que ya tienen detalle se saltan por `unique_producto_por_compra`
+        (ON CONFLICT DO NOTHING / INSERT OR IGNORE). Devuelve las filas insertadas.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        compra_table = self.model._meta.get_field("compra").related_model._meta.db_table
+        producto_table = self.model._meta.get_field("producto").related_model._meta.db_table
+        where, params = [], []
+        if proveedor_id is not None:
+            where.append("c.proveedor_id = %s")
+            params.append(proveedor_id)
+        if producto_ids is not None:
+            producto_ids = list(producto_ids)
+            if not producto_ids:
+                return 0
+            where.append(f"p.id IN ({', '.join(['%s'] * len(producto_ids))})")
+            params.extend(producto_ids)
+        sql = (
+            f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {qn(self.model._meta.db_table)} "
+            "(compra_id, producto_id, cantidad, inventario_anterior) "
+            f"SELECT c.id, p.id, 0, 0 FROM {qn(compra_table)} c "
+            f"INNER JOIN {qn(producto_table)} p ON p.proveedor_id = c.proveedor_id "
+            # SQLite exige un WHERE en INSERT ... SELECT seguido de ON CONFLICT
+            f"WHERE {' AND '.join(where) or '1 = 1'} "
+            f"{connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)}"
+        )
+        with _registrar_escritura(using=self.db) as escritura:
+            # los ids crecen: lo insertado ahora queda por encima del máximo actual
+            ultimo_id = self.aggregate(ultimo=models.Max("id"))["ultimo"] or 0
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                creados = cursor.rowcount
+            if creados:
+                # sólo las filas nuevas: las que ya existían no cambiaron
+                escritura.detalles = self.filter(id__gt=ultimo_id)
+                if proveedor_id is not None:
+                    escritura.proveedores.add(proveedor_id)
+                else:
+                    escritura.proveedores.update(
+                        escritura.detalles.values_list("compra__proveedor_id", flat=True).distinct()
+                    )
+        return creados
+
+
 class DetalleCompra(models.Model):
-    compra = models.ForeignKey(Compra, related_name='detalles', on_delete=models.CASCADE)
+    # sin índice propio: `unique_producto_por_compra` (compra, producto) ya sirve para buscar por compra
+    compra = models.ForeignKey(Compra, related_name='detalles', on_delete=models.CASCADE, db_index=False)
     producto = models.ForeignKey('producto.Producto', on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField()
     inventario_anterior = models.PositiveIntegerField()
 
+    objects = DetalleCompraManager()
+
     class Meta:
         db_table = 'detalle_compra'
         constraints = [
             models.UniqueConstraint(fields=["compra", "producto"], name="unique_producto_por_compra"),
         ]
+        indexes = [
+            # sólo los detalles con compra real: última compra de un producto (ver `compra.stock`)
+            models.Index(
+                fields=["producto", "compra"], condition=models.Q(cantidad__gt=0), name="detalle_comprado_idx"
+            ),
+        ]
+
+
+class ResumenCompra(models.Model):
+    """Resumen mensual por producto de su historial de compras (ver `compra.resumen`).
+
+    Guarda lo necesario para calcular compras y consumo de cualquier rango de meses
+    sin recorrer `detalle_compra`: totales más la primera y última compra del mes.
+    """
+    tienda = models.ForeignKey('tienda.Tienda', on_delete=models.CASCADE)
+    proveedor = models.ForeignKey('proveedor.Proveedor', on_delete=models.CASCADE)
+    producto = models.ForeignKey('producto.Producto', on_delete=models.CASCADE)
+    # primer día del mes
+    periodo = models.DateField()
+    compras = models.PositiveIntegerField(default=0)
+    cantidad_total = models.PositiveBigIntegerField(default=0)
+    inventario_total = models.PositiveBigIntegerField(default=0)
+    primera_fecha = models.DateField()
+    inventario_primero = models.PositiveIntegerField(default=0)
+    ultima_fecha = models.DateField()
+    inventario_ultimo = models.PositiveIntegerField(default=0)
+    cantidad_ultima = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'resumen_compra'
+        constraints = [
+            models.UniqueConstraint(fields=["producto", "periodo"], name="unique_resumen_producto_periodo"),
+        ]
+        indexes = [
+            models.Index(fields=["proveedor", "periodo"], name="resumen_proveedor_periodo_idx"),
+            models.Index(fields=["tienda", "periodo"], name="resumen_tienda_periodo_idx"),
+        ]
+
+
+class ResumenPendiente(models.Model):
+    """(producto, mes) cuyo `ResumenCompra` debe recalcularse tras una escritura."""
+    producto = models.ForeignKey('producto.Producto', on_delete=models.CASCADE)
+    periodo = models.DateField()
+
+    class Meta:
+        db_table = 'resumen_pendiente'
+        constraints = [
+            models.UniqueConstraint(fields=["producto", "periodo"], name="unique_resumen_pendiente"),
+        ]
+
+
+class StockProducto(models.Model):
+    """Último inventario conocido y última compra de cada producto (ver `compra.stock`).
+
+    Copia desnormalizada de `detalle_compra`: evita buscar la compra más reciente de
+    cada producto para mostrar su stock.
+    """
+    producto = models.OneToOneField('producto.Producto', primary_key=True, related_name='stock', on_delete=models.CASCADE)
+    # inventario_anterior del detalle de la compra más reciente
+    fecha_inventario = models.DateField(null=True)
+    inventario = models.PositiveIntegerField(null=True)
+    # compra más reciente con cantidad > 0
+    fecha_ultima_compra = models.DateField(null=True)
+    cantidad_ultima_compra = models.PositiveIntegerField(null=True)
+
+    class Meta:
+        db_table = 'stock_producto'
+
+
+class Cambio(models.Model):
+    """Registro de cambios por tienda para la sincronización incremental (ver `compra.cambios`).
+
+    Sólo se agregan filas: el `id` creciente es la secuencia que guardan los clientes.
+    """
+    PRODUCTO = "producto"
+    COMPRA = "compra"
+    DETALLE = "detalle"
+    MODELOS = [(PRODUCTO, "Producto"), (COMPRA, "Compra"), (DETALLE, "Detalle de compra")]
+
+    # sin índice propio: `cambio_tienda_idx` (tienda, id) ya sirve para buscar por tienda
+    tienda = models.ForeignKey('tienda.Tienda', on_delete=models.CASCADE, db_index=False)
+    modelo = models.CharField(max_length=10, choices=MODELOS)
+    objeto_id = models.PositiveBigIntegerField()
+    # lápida: el objeto se borró
+    eliminado = models.BooleanField(default=False)
+    fecha = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        db_table = 'cambio'
+        indexes = [
+            models.Index(fields=["tienda", "id"], name="cambio_tienda_idx"),
+            # cambios del día en el resumen de la tienda (`tienda.dashboard`)
+            models.Index(fields=["tienda", "fecha"], name="cambio_tienda_fecha_idx"),
+        ]
@@ -0,0 +1,116 @@
+"""Reportes calculados en la base de datos a partir del historial de DetalleCompra."""
+from datetime import date, timedelta
+
+from django.db import connection
+
+from compra import resumen
+from compra.models import Compra, DetalleCompra
+from producto.models import Producto
+from proveedor.models import Proveedor
+
+
+# Columnas de cada fila de `consumo_por_producto`
+CONSUMO_COLUMNAS = [
+    "producto_id",
+    "producto_nombre",
+    "proveedor_id",
+    "compras",
+    "cantidad_comprada",
+    "consumo",
+    "dias",
+    "consumo_diario",
+]
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _es_mes_completo(fecha_inicio: date | None, fecha_fin: date | None) -> bool:
+    if fecha_inicio is not None and fecha_inicio.day != 1:
+        return False
+    return fecha_fin is None or (fecha_fin + timedelta(days=1)).day == 1
+
+
+def consumo_por_producto(
+    proveedor_id: int | None = None,
+    tienda_id: int | None = None,
+    fecha_inicio: date | None = None,
+    fecha_fin: date | None = None,
+) -> list[list]:
+    """Consumo por producto (filas en el orden de `CONSUMO_COLUMNAS`).
+
+    Si el rango cubre meses completos (o no hay rango) se lee del resumen mensual
+    mantenido en `ResumenCompra`; si no, se calcula sobre `detalle_compra`.
+    """
+    if _es_mes_completo(fecha_inicio, fecha_fin):
+        return resumen.consumo_por_producto(proveedor_id, tienda_id, fecha_inicio, fecha_fin)
+    return consumo_por_producto_detalle(proveedor_id, tienda_id, fecha_inicio, fecha_fin)
+
+
+def consumo_por_producto_detalle(
+    proveedor_id: int | None = None,
+    tienda_id: int | None = None,
+    fecha_inicio: date | None = None,
+    fecha_fin: date | None = None,
+) -> list[list]:
+    """Consumo por producto entre compras consecutivas, en una sola consulta.
+
+    Para cada compra de un producto el consumo hasta la siguiente compra es
+    `inventario_anterior + cantidad - inventario_anterior(siguiente)`, obtenido con
+    LEAD() sobre `fecha_compra`. Se agregan por producto: número de compras, cantidad
+    comprada, consumo total, días cubiertos (de la primera a la última compra del
+    rango) y consumo diario promedio. Devuelve filas en el orden de `CONSUMO_COLUMNAS`.
+    """
+    qn = connection.ops.quote_name
+    where, params = [], []
+    if proveedor_id is not None:
+        where.append("c.proveedor_id = %s")
+        params.append(proveedor_id)
+    if tienda_id is not None:
+        where.append("pr.tienda_id = %s")
+        params.append(tienda_id)
+    if fecha_inicio is not None:
+        where.append("c.fecha_compra >= %s")
+        params.append(fecha_inicio)
+    if fecha_fin is not None:
+        where.append("c.fecha_compra <= %s")
+        params.append(fecha_fin)
+
+    sql = f"""
+        WITH serie AS (
+            SELECT
+                d.producto_id,
+                c.fecha_compra,
+                d.cantidad,
+                d.inventario_anterior + d.cantidad - LEAD(d.inventario_anterior) OVER (
+                    PARTITION BY d.producto_id ORDER BY c.fecha_compra
+                ) AS consumo
+            FROM {qn(DetalleCompra._meta.db_table)} d
+            INNER JOIN {qn(Compra._meta.db_table)} c ON c.id = d.compra_id
+            INNER JOIN {qn(Proveedor._meta.db_table)} pr ON pr.id = c.proveedor_id
+            WHERE {' AND '.join(where) or '1 = 1'}
+        )
+        SELECT
+            p.id, p.nombre, p.proveedor_id,
+            COUNT(*), SUM(s.cantidad), SUM(s.consumo),
+            MIN(s.fecha_compra), MAX(s.fecha_compra)
+        FROM serie s
+        INNER JOIN {qn(Producto._meta.db_table)} p ON p.id = s.producto_id
+        GROUP BY p.id, p.nombre, p.proveedor_id, p.orden
+        ORDER BY p.proveedor_id, p.orden, p.id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    filas = []
+    for producto_id, nombre, prov_id, compras, comprado, consumo, primera, ultima in rows:
+        primera, ultima = _as_date(primera), _as_date(ultima)
+        dias = (ultima - primera).days if primera and ultima else 0
+        consumo = int(consumo or 0)
+        diario = round(consumo / dias, 3) if dias else None
+        filas.append([producto_id, nombre, prov_id, compras, int(comprado or 0), consumo, dias, diario])
+    return filas
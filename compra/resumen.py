@@ -0,0 +1,183 @@
+"""Mantenimiento incremental de `ResumenCompra`.
+
+Cada escritura sobre compras/detalles marca con `marcar()` (desde
+`compra.escrituras.registrar_escritura`) los pares (producto, mes) afectados en
+`ResumenPendiente`, con un único INSERT ... SELECT y sin leer nada.
+`refrescar_pendientes()` recalcula sólo esos meses; los reportes lo llaman antes de
+leer, así que siempre ven el resumen al día pagando sólo por lo que cambió.
+"""
+from datetime import date, timedelta
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.constants import OnConflict
+from django.db.models.functions import TruncMonth
+
+from compra.models import DetalleCompra, ResumenCompra, ResumenPendiente
+
+
+LOTE = 500
+
+_CAMPOS = (
+    "tienda_id", "proveedor_id", "compras", "cantidad_total", "inventario_total",
+    "primera_fecha", "inventario_primero", "ultima_fecha", "inventario_ultimo", "cantidad_ultima",
+)
+
+
+def _mes(fecha: date) -> date:
+    return fecha.replace(day=1)
+
+
+def _fin_de_mes(periodo: date) -> date:
+    return (periodo.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def marcar(detalles) -> None:
+    """Marca como pendientes los (producto, mes) de los detalles del queryset `detalles`.
+
+    Debe llamarse en la misma transacción que la escritura; para borrados, antes de borrar.
+    """
+    _insertar_pendientes(
+        detalles.order_by()
+        .annotate(periodo_resumen=TruncMonth("compra__fecha_compra"))
+        .values_list("producto_id", "periodo_resumen")
+        .distinct()
+    )
+
+
+def _insertar_pendientes(qs) -> None:
+    connection = connections[qs.db]
+    sql, params = qs.query.sql_with_params()
+    table = connection.ops.quote_name(ResumenPendiente._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {table} (producto_id, periodo) {sql} "
+            f"{connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)}",
+            params,
+        )
+
+
+def calcular(productos, desde: date | None = None, hasta: date | None = None, pares=None) -> dict:
+    """Calcula desde `detalle_compra` los resúmenes de `productos` entre `desde` y `hasta`.
+
+    Devuelve `{(producto_id, periodo): ResumenCompra}` sin guardar. Si se pasa `pares`
+    sólo se devuelven esos (producto, mes).
+    """
+    qs = DetalleCompra.objects.filter(producto_id__in=productos)
+    if desde:
+        qs = qs.filter(compra__fecha_compra__gte=desde)
+    if hasta:
+        qs = qs.filter(compra__fecha_compra__lte=hasta)
+    rows = qs.order_by("producto_id", "compra__fecha_compra").values_list(
+        "producto_id", "compra__proveedor_id", "compra__proveedor__tienda_id",
+        "compra__fecha_compra", "cantidad", "inventario_anterior",
+    )
+    resumenes = {}
+    for producto_id, proveedor_id, tienda_id, fecha, cantidad, inventario in rows.iterator(chunk_size=2000):
+        key = (producto_id, _mes(fecha))
+        if pares is not None and key not in pares:
+            continue
+        r = resumenes.get(key)
+        if r is None:
+            r = resumenes[key] = ResumenCompra(
+                tienda_id=tienda_id, proveedor_id=proveedor_id, producto_id=producto_id, periodo=key[1],
+                primera_fecha=fecha, inventario_primero=inventario,
+                ultima_fecha=fecha, inventario_ultimo=inventario,
+            )
+        # filas ordenadas por fecha: la última vista es la última del mes
+        r.compras += 1
+        r.cantidad_total += cantidad
+        r.inventario_total += inventario
+        r.ultima_fecha = fecha
+        r.inventario_ultimo = inventario
+        r.cantidad_ultima = cantidad
+    return resumenes
+
+
+def _reemplazar(pares: set, resumenes: dict) -> None:
+    por_producto = {}
+    for producto_id, periodo in pares:
+        por_producto.setdefault(producto_id, []).append(periodo)
+    filtro = Q(pk__in=[])
+    for producto_id, periodos in por_producto.items():
+        filtro |= Q(producto_id=producto_id, periodo__in=periodos)
+    ResumenCompra.objects.filter(filtro).delete()
+    ResumenCompra.objects.bulk_create(resumenes.values(), batch_size=LOTE)
+
+
+def refrescar_pendientes(lote: int = LOTE) -> int:
+    """Recalcula los (producto, mes) pendientes, de a `lote`. Devuelve cuántos procesó."""
+    total = 0
+    while True:
+        with transaction.atomic():
+            pendientes = list(ResumenPendiente.objects.order_by("id").values_list("id", "producto_id", "periodo")[:lote])
+            if not pendientes:
+                return total
+            # borrar primero: una escritura concurrente vuelve a marcar su par y no se pierde
+            ResumenPendiente.objects.filter(id__in=[p[0] for p in pendientes]).delete()
+            pares = {(producto_id, periodo) for _, producto_id, periodo in pendientes}
+            periodos = [periodo for _, periodo in pares]
+            resumenes = calcular(
+                {producto_id for producto_id, _ in pares}, min(periodos), _fin_de_mes(max(periodos)), pares
+            )
+            _reemplazar(pares, resumenes)
+        total += len(pendientes)
+
+
+def consumo_por_producto(
+    proveedor_id: int | None = None,
+    tienda_id: int | None = None,
+    desde: date | None = None,
+    hasta: date | None = None,
+) -> list[list]:
+    """Igual que `compra.reportes.consumo_por_producto` pero leyendo `ResumenCompra`.
+
+    `desde`/`hasta` se redondean a meses completos. Coste O(productos x meses).
+    """
+    refrescar_pendientes()
+    qs = ResumenCompra.objects.all()
+    if proveedor_id is not None:
+        qs = qs.filter(proveedor_id=proveedor_id)
+    if tienda_id is not None:
+        qs = qs.filter(tienda_id=tienda_id)
+    if desde:
+        qs = qs.filter(periodo__gte=_mes(desde))
+    if hasta:
+        qs = qs.filter(periodo__lte=_mes(hasta))
+    rows = qs.order_by("proveedor_id", "producto__orden", "producto_id", "periodo").values_list(
+        "producto_id", "producto__nombre", "proveedor_id", "compras", "cantidad_total",
+        "primera_fecha", "inventario_primero", "ultima_fecha", "inventario_ultimo", "cantidad_ultima",
+    )
+    filas = []
+    actual = None
+    for producto_id, nombre, prov_id, compras, cantidad, primera, inv_primero, ultima, inv_ultimo, cant_ultima in rows:
+        if actual is None or actual["producto_id"] != producto_id:
+            actual = {
+                "producto_id": producto_id, "nombre": nombre, "proveedor_id": prov_id, "compras": 0,
+                "cantidad": 0, "primera": primera, "inv_primero": inv_primero,
+            }
+            filas.append(actual)
+        actual["compras"] += compras
+        actual["cantidad"] += cantidad
+        actual.update(ultima=ultima, inv_ultimo=inv_ultimo, cant_ultima=cant_ultima)
+
+    resultado = []
+    for f in filas:
+        # suma de (inv_i + cant_i - inv_{i+1}) entre compras consecutivas, telescópica
+        consumo = f["inv_primero"] - f["inv_ultimo"] + f["cantidad"] - f["cant_ultima"]
+        dias = (f["ultima"] - f["primera"]).days
+        diario = round(consumo / dias, 3) if dias else None
+        resultado.append([f["producto_id"], f["nombre"], f["proveedor_id"], f["compras"], f["cantidad"], consumo, dias, diario])
+    return resultado
+
+
+def diferencias(productos) -> int:
+    """Cuántos resúmenes de `productos` difieren de lo que da recalcularlos desde cero."""
+    esperados = calcular(productos)
+    guardados = {(r.producto_id, r.periodo): r for r in ResumenCompra.objects.filter(producto_id__in=productos)}
+    n = 0
+    for key in esperados.keys() | guardados.keys():
+        a, b = esperados.get(key), guardados.get(key)
+        if a is None or b is None or any(getattr(a, c) != getattr(b, c) for c in _CAMPOS):
+            n += 1
+    return n
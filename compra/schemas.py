@@ -34,4 +34,82 @@ class DetalleCompraUpdateSchema(Schema):
     inventario_anterior: Optional[int] = None
 
 class CompraWithDetailsSchema(CompraSchema):
-    detalles: list[DetalleCompraSchema]
\ No newline at end of file
+    detalles: list[DetalleCompraSchema]
+
+class DetalleCompraLoteItemSchema(Schema):
+    detalle_id: int
+    cantidad: Optional[int] = None
+    inventario_anterior: Optional[int] = None
+
+class DetalleCompraLoteSchema(Schema):
+    items: list[DetalleCompraLoteItemSchema]
+
+class DetalleCompraLoteResultadoSchema(Schema):
+    detalle_id: int
+    ok: bool
+    message: Optional[str] = None
+    detalle: Optional[DetalleCompraSchema] = None
+
+class MatrizComprasSchema(Schema):
+    producto_ids: list[int]
+    productos: list[str]
+    compra_ids: list[int]
+    fechas: list[date]
+    # celdas por fila (producto) y columna (fecha): índice = fila * len(fechas) + columna
+    detalle_ids: list[Optional[int]]
+    cantidad: list[Optional[int]]
+    inventario_anterior: list[Union[int, str, None]]
+
+class ReporteConsumoSchema(Schema):
+    fecha_inicio: Optional[date] = None
+    fecha_fin: Optional[date] = None
+    columnas: list[str]
+    filas: list[list[Union[int, float, str, None]]]
+
+class SugerenciasSchema(Schema):
+    fecha: date
+    columnas: list[str]
+    filas: list[list[Union[int, float, str, None]]]
+
+class ImportacionErrorSchema(Schema):
+    fila: int
+    message: str
+
+class ImportacionResultadoSchema(Schema):
+    filas: int
+    importadas: int
+    compras_creadas: int
+    productos_creados: int
+    errores: list[ImportacionErrorSchema]
+
+class CambioProductoSchema(Schema):
+    id: int
+    nombre: str
+    proveedor_id: int
+    orden: Optional[int] = None
+
+class CambioCompraSchema(Schema):
+    id: int
+    proveedor_id: int
+    fecha_compra: date
+
+class CambioDetalleSchema(Schema):
+    id: int
+    compra_id: int
+    producto_id: int
+    cantidad: int
+    inventario_anterior: Union[int, str]
+
+class CambiosEliminadosSchema(Schema):
+    productos: list[int]
+    compras: list[int]
+    detalles: list[int]
+
+class CambiosSchema(Schema):
+    desde: int
+    hasta: int
+    completo: bool
+    productos: list[CambioProductoSchema]
+    compras: list[CambioCompraSchema]
+    detalles: list[CambioDetalleSchema]
+    eliminados: CambiosEliminadosSchema
@@ -0,0 +1,75 @@
+"""Mantenimiento de `StockProducto`, el último stock conocido de cada producto.
+
+Toda escritura sobre compras/detalles llama a `actualizar()` con los productos
+afectados (desde `compra.escrituras.registrar_escritura`), en la misma transacción
+y después de escribir (también tras borrar).
+Cada llamada es un único INSERT ... SELECT ... ON CONFLICT DO UPDATE que recalcula
+la fila de esos productos desde `detalle_compra`, así que el resultado no depende
+del orden en que lleguen las escrituras.
+"""
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+from django.db.models.constants import OnConflict
+
+from compra.models import DetalleCompra, StockProducto
+from producto.models import Producto
+
+
+_CAMPOS = ("fecha_inventario", "inventario", "fecha_ultima_compra", "cantidad_ultima_compra")
+
+
+def _consulta(productos):
+    """SELECT (producto_id, *_CAMPOS) para los productos indicados."""
+    # recorrer las compras del proveedor de la más reciente hacia atrás: con el índice
+    # (proveedor, fecha_compra) y el único (compra, producto) la primera fila suele bastar
+    ultimos = DetalleCompra.objects.filter(
+        producto_id=OuterRef("pk"), compra__proveedor_id=OuterRef("proveedor_id")
+    ).order_by("-compra__fecha_compra")
+    # en cambio, la última compra con cantidad > 0 se busca por el índice parcial
+    # `detalle_comprado_idx`, que sólo contiene esas filas
+    comprados = DetalleCompra.objects.filter(producto_id=OuterRef("pk"), cantidad__gt=0).order_by(
+        "-compra__fecha_compra"
+    )
+    return (
+        Producto.objects.filter(pk__in=productos)
+        .order_by()
+        .annotate(
+            s_fecha_inventario=Subquery(ultimos.values("compra__fecha_compra")[:1]),
+            s_inventario=Subquery(ultimos.values("inventario_anterior")[:1]),
+            s_fecha_ultima_compra=Subquery(comprados.values("compra__fecha_compra")[:1]),
+            s_cantidad_ultima_compra=Subquery(comprados.values("cantidad")[:1]),
+        )
+        .values_list("pk", *(f"s_{campo}" for campo in _CAMPOS))
+    )
+
+
+def actualizar(productos) -> None:
+    """Recalcula el stock de `productos` (ids o queryset de ids de producto)."""
+    qs = _consulta(productos)
+    connection = connections[qs.db]
+    qn = connection.ops.quote_name
+    fields = [StockProducto._meta.get_field(campo) for campo in ("producto", *_CAMPOS)]
+    try:
+        # el filtro por pk asegura el WHERE que SQLite exige antes de ON CONFLICT
+        sql, params = qs.query.sql_with_params()
+    except EmptyResultSet:
+        return
+    suffix = connection.ops.on_conflict_suffix_sql(
+        fields, OnConflict.UPDATE, [f.column for f in fields[1:]], [fields[0].column]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(StockProducto._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) {sql} {suffix}",
+            params,
+        )
+
+
+def diferencias(productos) -> int:
+    """Cuántos productos de `productos` tienen un stock guardado distinto del calculado."""
+    esperados = {row[0]: row[1:] for row in _consulta(productos)}
+    guardados = {
+        row[0]: row[1:]
+        for row in StockProducto.objects.filter(producto_id__in=productos).values_list("producto_id", *_CAMPOS)
+    }
+    return sum(1 for pk, valores in esperados.items() if guardados.get(pk) != valores)
@@ -0,0 +1,136 @@
+"""Sugerencias de cantidades a pedir en la próxima compra, por producto.
+
+Para cada producto se toma el consumo diario entre compras consecutivas,
+`(inventario_i + cantidad_i - inventario_{i+1}) / días`, y se suaviza
+exponencialmente (media y varianza). La sugerencia cubre el intervalo habitual
+entre compras del proveedor más un stock de seguridad, descontando el stock
+estimado a la fecha:
+
+    sugerido = ceil(consumo * horizonte + z * desviacion * sqrt(horizonte) - stock_estimado)
+
+El historial de todos los proveedores a calcular se lee en una sola consulta,
+ordenada por (proveedor, producto, fecha), y se recorre una vez en Python: el
+suavizado es recursivo (cada varianza depende de la media anterior) y en SQL
+necesitaría varios niveles de ventanas con potencias por fila, mientras que el
+recorrido es una fracción del tiempo de leer esas filas. El resultado se
+cachea por (proveedor, fecha) junto con la versión del proveedor (`core.versiones`),
+que cambia con cada escritura sobre sus productos, compras o detalles.
+"""
+import math
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+
+from compra.models import DetalleCompra
+from core import versiones
+
+
+# Columnas de cada fila de `sugerencias_por_proveedor`
+SUGERENCIA_COLUMNAS = [
+    "producto_id",
+    "producto_nombre",
+    "proveedor_id",
+    "compras",
+    "consumo_diario",
+    "desviacion",
+    "stock_estimado",
+    "horizonte_dias",
+    "stock_seguridad",
+    "sugerido",
+]
+
+CACHE_ALIAS = getattr(settings, "SUGERENCIAS_CACHE_ALIAS", "default")
+CACHE_TIMEOUT = getattr(settings, "SUGERENCIAS_CACHE_TIMEOUT", 60 * 60 * 24)
+# días de historial que se usan para calcular
+VENTANA_DIAS = getattr(settings, "SUGERENCIAS_VENTANA_DIAS", 180)
+# peso de la última observación en el suavizado exponencial
+ALFA = getattr(settings, "SUGERENCIAS_ALFA", 0.3)
+# factor del stock de seguridad (1.65 ~ 95% de nivel de servicio)
+Z = getattr(settings, "SUGERENCIAS_Z", 1.65)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _entry_key(proveedor_id: int, fecha: date, version: int) -> str:
+    return f"sugerencias:{proveedor_id}:{fecha.isoformat()}:v{version}"
+
+
+def _sugerir(serie: list, stock_fecha: date, horizonte: float | None) -> tuple:
+    """(consumo_diario, desviacion, stock_estimado, horizonte_dias, stock_seguridad, sugerido)
+    de una serie `[(fecha, cantidad, inventario)]` ordenada por fecha."""
+    fecha, cantidad, inventario = serie[-1]
+    if len(serie) < 2 or horizonte is None:
+        return None, None, None, None, None, None
+    media = var = None
+    for (f0, c0, i0), (f1, _, i1) in zip(serie, serie[1:]):
+        tasa = max(i0 + c0 - i1, 0) / (f1 - f0).days
+        if media is None:
+            media, var = tasa, 0.0
+        else:
+            delta = tasa - media
+            media += ALFA * delta
+            var = (1 - ALFA) * (var + ALFA * delta * delta)
+    desviacion = math.sqrt(var)
+    stock = max(inventario + cantidad - media * (stock_fecha - fecha).days, 0)
+    seguridad = Z * desviacion * math.sqrt(horizonte)
+    sugerido = max(math.ceil(media * horizonte + seguridad - stock), 0)
+    return round(media, 3), round(desviacion, 3), round(stock, 1), round(horizonte, 1), round(seguridad, 1), sugerido
+
+
+def calcular(proveedor_ids, fecha: date) -> dict[int, list[list]]:
+    """Calcula sin caché las filas (en el orden de `SUGERENCIA_COLUMNAS`) de cada proveedor."""
+    rows = (
+        DetalleCompra.objects.filter(
+            compra__proveedor_id__in=proveedor_ids,
+            compra__fecha_compra__gte=fecha - timedelta(days=VENTANA_DIAS),
+            compra__fecha_compra__lte=fecha,
+        )
+        .order_by("compra__proveedor_id", "producto__orden", "producto_id", "compra__fecha_compra")
+        .values_list(
+            "compra__proveedor_id", "producto_id", "producto__nombre",
+            "compra__fecha_compra", "cantidad", "inventario_anterior",
+        )
+    )
+    # agrupar en series por producto; las fechas de compra de cada proveedor dan su horizonte
+    series = {proveedor_id: [] for proveedor_id in proveedor_ids}
+    fechas = {proveedor_id: set() for proveedor_id in proveedor_ids}
+    actual = None
+    for proveedor_id, producto_id, nombre, fecha_compra, cantidad, inventario in rows.iterator(chunk_size=2000):
+        if actual is None or actual[0] != producto_id:
+            actual = (producto_id, nombre, [])
+            series[proveedor_id].append(actual)
+        actual[2].append((fecha_compra, cantidad, inventario))
+        fechas[proveedor_id].add(fecha_compra)
+
+    resultado = {}
+    for proveedor_id, productos in series.items():
+        f = sorted(fechas[proveedor_id])
+        horizonte = (f[-1] - f[0]).days / (len(f) - 1) if len(f) > 1 else None
+        resultado[proveedor_id] = [
+            [producto_id, nombre, proveedor_id, len(serie), *_sugerir(serie, fecha, horizonte)]
+            for producto_id, nombre, serie in productos
+        ]
+    return resultado
+
+
+def sugerencias_por_proveedor(proveedor_ids, fecha: date) -> list[list]:
+    """Filas de sugerencias de los proveedores indicados, leyendo de la caché lo que se pueda.
+
+    Los proveedores sin entrada en la caché se calculan juntos con una sola consulta.
+    """
+    proveedor_ids = list(proveedor_ids)
+    cache = _cache()
+    actuales = versiones.get_versions("proveedor", proveedor_ids)
+    keys = {p: _entry_key(p, fecha, actuales[p]) for p in proveedor_ids}
+    cacheadas = cache.get_many(keys.values())
+    faltan = [p for p in proveedor_ids if keys[p] not in cacheadas]
+    calculadas = calcular(faltan, fecha) if faltan else {}
+    if calculadas:
+        cache.set_many({keys[p]: filas for p, filas in calculadas.items()}, CACHE_TIMEOUT)
+    filas = []
+    for p in proveedor_ids:
+        filas.extend(calculadas[p] if p in calculadas else cacheadas[keys[p]])
+    return filas
@@ -1,3 +1,764 @@
-from django.test import TestCase
+import csv
+import io
+import zipfile
+from datetime import date
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from compra import exportar, importar, resumen, stock, sugerencias
+from compra.api import MAX_ALLOWED, _compras_to_dicts, _matriz
+from compra.models import Compra, DetalleCompra, ResumenCompra
+from compra.reportes import CONSUMO_COLUMNAS, consumo_por_producto_detalle
+from core.pagination import NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER, encode_cursor
+from core.testing import ApiTestCase
+from producto.models import Producto
+from proveedor.models import Proveedor
+from tienda.models import Tienda
+
+
+class CompraApiTestCase(ApiTestCase):
+    """Dos tiendas, un superusuario y un usuario con permisos sólo en `self.tienda`."""
+
+    def setUp(self):
+        super().setUp()
+        self.tienda = Tienda.objects.create(nombre="Propia")
+        self.ajena = Tienda.objects.create(nombre="Ajena")
+        self.crear_usuario("admin", superusuario=True)
+        self.crear_usuario("limitado", tiendas=[self.tienda])
+        self.token = self.admin = self.login("admin")
+        self.limitado = self.login("limitado")
+
+    def _compra(self, tienda, fecha="2026-01-01", productos=("a", "b")):
+        proveedor = Proveedor.objects.filter(tienda=tienda).first() or Proveedor.objects.create(nombre="P", tienda=tienda)
+        for nombre in productos:
+            Producto.objects.get_or_create(nombre=nombre, proveedor=proveedor, defaults={"orden": 1024})
+        respuesta = self.api("post", "/compra/crear/", {"proveedor_id": proveedor.id, "fecha_compra": fecha})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return Compra.objects.get(id=respuesta.json()["id"])
+
+
+class EditarDetallesLoteTests(CompraApiTestCase):
+    def test_resultado_por_item(self):
+        propio = DetalleCompra.objects.filter(compra=self._compra(self.tienda)).first()
+        ajeno = DetalleCompra.objects.filter(compra=self._compra(self.ajena)).first()
+        items = [
+            {"detalle_id": propio.id, "cantidad": 7},
+            {"detalle_id": ajeno.id, "cantidad": 7},
+            {"detalle_id": 999999, "cantidad": 7},
+        ]
+        respuesta = self.api("patch", "/compra/detalle/lote/editar/", {"items": items}, self.limitado)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        resultados = respuesta.json()
+        self.assertEqual([r["detalle_id"] for r in resultados], [propio.id, ajeno.id, 999999])
+        self.assertEqual([r["ok"] for r in resultados], [True, False, False])
+        self.assertEqual(resultados[0]["detalle"]["cantidad"], 7)
+        self.assertEqual(resultados[1]["message"], "No autorizado para esta operación")
+        self.assertEqual(resultados[2]["message"], "Detalle no encontrado")
+
+        propio.refresh_from_db()
+        ajeno.refresh_from_db()
+        self.assertEqual(propio.cantidad, 7)
+        self.assertEqual(ajeno.cantidad, 0)
+
+    def test_valor_no_entero_no_escribe(self):
+        detalle = DetalleCompra.objects.filter(compra=self._compra(self.tienda)).first()
+        items = [{"detalle_id": detalle.id, "cantidad": 3}, {"detalle_id": detalle.id, "inventario_anterior": "abc"}]
+        respuesta = self.api("patch", "/compra/detalle/lote/editar/", {"items": items})
+        self.assertEqual(respuesta.status_code, 422)
+        detalle.refresh_from_db()
+        self.assertEqual(detalle.cantidad, 0)
+
+
+class EtagTests(CompraApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.compra = self._compra(self.tienda)
+        self.url = f"/compra/rango/{self.compra.proveedor_id}/?limit=5"
+
+    def test_304_si_el_proveedor_no_cambio(self):
+        respuesta = self.api("get", self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta["ETag"]
+
+        with self.assertNumQueries(0):
+            respuesta = self.api("get", self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta["ETag"], etag)
+        self.assertEqual(respuesta.content, b"")
+
+    def test_escritura_cambia_el_etag(self):
+        etag = self.api("get", self.url)["ETag"]
+        detalle = DetalleCompra.objects.filter(compra=self.compra).first()
+        # la versión se incrementa al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api("patch", f"/compra/detalle/editar/{detalle.id}/", {"cantidad": 4})
+
+        respuesta = self.api("get", self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], etag)
+
+    def test_etag_por_usuario(self):
+        # la respuesta depende del usuario (tiendas visibles, inventario): el ETag también
+        etag_admin = self.api("get", self.url)["ETag"]
+        respuesta = self.api("get", self.url, token=self.limitado, HTTP_IF_NONE_MATCH=etag_admin)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], etag_admin)
+
+
+class CambiosTests(CompraApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.compra = self._compra(self.tienda)
+        self.detalles = list(DetalleCompra.objects.filter(compra=self.compra).order_by("id").values_list("id", flat=True))
+        self.hasta = self._cambios()["hasta"]
+
+    def _cambios(self, desde=0, tienda=None, token=None):
+        respuesta = self.api("get", f"/compra/cambios/tienda/{(tienda or self.tienda).id}/?desde={desde}", token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_lapida_de_detalle(self):
+        # editado y luego borrado: sólo cuenta el último cambio
+        self.api("patch", f"/compra/detalle/editar/{self.detalles[0]}/", {"cantidad": 2})
+        self.api("delete", f"/compra/detalle/eliminar/{self.detalles[0]}/")
+
+        cambios = self._cambios(self.hasta)
+        self.assertEqual(cambios["eliminados"]["detalles"], [self.detalles[0]])
+        self.assertEqual(cambios["detalles"], [])
+        self.assertTrue(cambios["completo"])
+        self.assertEqual(self._cambios(cambios["hasta"])["eliminados"]["detalles"], [])
+
+    def test_lapidas_en_cascada_al_borrar_compra(self):
+        self.api("delete", f"/compra/eliminar/{self.compra.id}/")
+
+        cambios = self._cambios(self.hasta)
+        self.assertEqual(cambios["eliminados"]["compras"], [self.compra.id])
+        self.assertEqual(cambios["eliminados"]["detalles"], self.detalles)
+        self.assertEqual(cambios["compras"], [])
+
+    def test_lapidas_solo_en_su_tienda(self):
+        ajena = self._compra(self.ajena)
+        hasta_ajena = self._cambios(tienda=self.ajena)["hasta"]
+        self.api("delete", f"/compra/eliminar/{ajena.id}/")
+
+        self.assertEqual(self._cambios(self.hasta)["eliminados"]["compras"], [])
+        self.assertEqual(self._cambios(hasta_ajena, tienda=self.ajena)["eliminados"]["compras"], [ajena.id])
+        respuesta = self.api("get", f"/compra/cambios/tienda/{self.ajena.id}/", token=self.limitado)
+        self.assertEqual(respuesta.status_code, 403)
+
+
+class CrearCompraTests(CompraApiTestCase):
+    def _proveedor(self, n_productos):
+        proveedor = Proveedor.objects.create(nombre=f"P{n_productos}", tienda=self.tienda)
+        Producto.objects.bulk_create(
+            Producto(nombre=f"p{i}", proveedor=proveedor, orden=(n_productos - i) * 1024) for i in range(n_productos)
+        )
+        return proveedor
+
+    def _crear(self, proveedor, fecha="2026-01-01", token=None):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.api("post", "/compra/crear/", {"proveedor_id": proveedor.id, "fecha_compra": fecha}, token)
+        return respuesta, len(consultas)
+
+    def test_consultas_no_dependen_del_catalogo(self):
+        self._crear(self._proveedor(1))  # calienta sesión y permisos
+        respuesta_chica, consultas_chica = self._crear(self._proveedor(3))
+        respuesta_grande, consultas_grande = self._crear(self._proveedor(30))
+
+        self.assertEqual(respuesta_grande.status_code, 200, respuesta_grande.content)
+        self.assertEqual(consultas_chica, consultas_grande)
+        self.assertEqual(len(respuesta_chica.json()["detalles"]), 3)
+        self.assertEqual(len(respuesta_grande.json()["detalles"]), 30)
+
+    def test_respuesta_igual_a_la_base(self):
+        proveedor = self._proveedor(3)
+        compra = self._crear(proveedor)[0].json()
+        # detalles (0, 0) en el orden de los productos, con los ids que quedaron guardados
+        self.assertEqual([d["producto_nombre"] for d in compra["detalles"]], ["p2", "p1", "p0"])
+        guardados = {
+            d.id: d for d in DetalleCompra.objects.filter(compra_id=compra["id"]).select_related("producto")
+        }
+        self.assertEqual(len(guardados), 3)
+        for detalle in compra["detalles"]:
+            guardado = guardados[detalle["id"]]
+            self.assertEqual(detalle["compra_id"], compra["id"])
+            self.assertEqual(detalle["producto_id"], guardado.producto_id)
+            self.assertEqual(detalle["producto_nombre"], guardado.producto.nombre)
+            self.assertEqual((detalle["cantidad"], detalle["inventario_anterior"]), (0, 0))
+            self.assertEqual((guardado.cantidad, guardado.inventario_anterior), (0, 0))
+
+    def test_inventario_oculto_y_fecha_repetida(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        proveedor = self._proveedor(2)
+        respuesta, _ = self._crear(proveedor, token=self.login("sin_inventario"))
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual({d["inventario_anterior"] for d in respuesta.json()["detalles"]}, {"?"})
+
+        respuesta, _ = self._crear(proveedor)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(Compra.objects.filter(proveedor=proveedor).count(), 1)
+        self.assertEqual(DetalleCompra.objects.filter(compra__proveedor=proveedor).count(), 2)
+
+
+class EditarDetalleTests(CompraApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.detalle = DetalleCompra.objects.filter(compra=self._compra(self.tienda)).first()
+        DetalleCompra.objects.filter(id=self.detalle.id).update(cantidad=3, inventario_anterior=8)
+        self.url = f"/compra/detalle/editar/{self.detalle.id}/"
+
+    def test_patch_parcial_en_un_solo_update(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.api("patch", self.url, {"cantidad": 5})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json(), {
+            "id": self.detalle.id,
+            "compra_id": self.detalle.compra_id,
+            "producto_id": self.detalle.producto_id,
+            "cantidad": 5,
+            "inventario_anterior": 8,
+            "producto_nombre": self.detalle.producto.nombre,
+        })
+        # ni lectura previa ni posterior del detalle: sólo el UPDATE, y sólo de lo enviado
+        sobre_detalle = [q["sql"] for q in consultas if q["sql"].startswith(('SELECT "detalle_compra"', 'UPDATE "detalle_compra"'))]
+        self.assertEqual(len(sobre_detalle), 1, sobre_detalle)
+        self.assertIn("RETURNING", sobre_detalle[0])
+        self.assertNotIn('"inventario_anterior" =', sobre_detalle[0])
+
+    def test_coercion_y_limites(self):
+        self.assertEqual(self.api("patch", self.url, {"cantidad": "12"}).json()["cantidad"], 12)
+        with self.assertLogs("compra.api", "WARNING"):
+            self.assertEqual(self.api("patch", self.url, {"inventario_anterior": -4}).json()["inventario_anterior"], 0)
+            respuesta = self.api("patch", self.url, {"cantidad": MAX_ALLOWED * 10})
+        self.assertEqual(respuesta.json()["cantidad"], MAX_ALLOWED)
+        self.detalle.refresh_from_db()
+        self.assertEqual((self.detalle.cantidad, self.detalle.inventario_anterior), (MAX_ALLOWED, 0))
+
+    def test_sin_campos_no_escribe(self):
+        respuesta = self.api("patch", self.url, {})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual((respuesta.json()["cantidad"], respuesta.json()["inventario_anterior"]), (3, 8))
+
+    def test_inventario_oculto_y_404(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        respuesta = self.api("patch", self.url, {"inventario_anterior": 6}, self.login("sin_inventario"))
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()["inventario_anterior"], "?")
+        self.detalle.refresh_from_db()
+        self.assertEqual(self.detalle.inventario_anterior, 6)
+
+        self.assertEqual(self.api("patch", "/compra/detalle/editar/999999/", {"cantidad": 1}).status_code, 404)
+
+
+class RangoTests(CompraApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.compras = [self._compra(self.tienda, f"2026-01-{dia:02d}") for dia in range(1, 6)]
+        self.proveedor = self.compras[0].proveedor
+        # "b" antes que "a": los detalles salen en el orden del producto, no por id
+        Producto.objects.filter(nombre="b").update(orden=1)
+        DetalleCompra.objects.filter(compra=self.compras[0], producto__nombre="a").update(cantidad=2, inventario_anterior=9)
+
+    def _rango(self, query="", token=None):
+        respuesta = self.api("get", f"/compra/rango/{self.proveedor.id}/?{query}", token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta
+
+    def test_forma_de_la_respuesta(self):
+        [compra] = self._rango("limit=1").json()
+        a = DetalleCompra.objects.get(compra=self.compras[0], producto__nombre="a")
+        self.assertEqual(compra["id"], self.compras[0].id)
+        self.assertEqual(compra["proveedor"], self.proveedor.id)
+        self.assertEqual(compra["fecha_compra"], "2026-01-01")
+        self.assertEqual([d["producto_nombre"] for d in compra["detalles"]], ["b", "a"])
+        self.assertEqual(compra["detalles"][1], {
+            "id": a.id, "compra_id": self.compras[0].id, "producto_id": a.producto_id,
+            "cantidad": 2, "inventario_anterior": 9, "producto_nombre": "a",
+        })
+
+    def test_orden_y_rango_de_fechas(self):
+        fechas = [c["fecha_compra"] for c in self._rango("limit=2&order=desc").json()]
+        self.assertEqual(fechas, ["2026-01-05", "2026-01-04"])
+        fechas = [c["fecha_compra"] for c in self._rango("limit=10&fecha_inicio=2026-01-02&fecha_fin=2026-01-03").json()]
+        self.assertEqual(fechas, ["2026-01-02", "2026-01-03"])
+
+    def test_una_consulta_de_detalles_por_pagina(self):
+        compras = list(Compra.objects.filter(proveedor=self.proveedor).values("id", "proveedor", "fecha_compra"))
+        with self.assertNumQueries(1):
+            serializadas = _compras_to_dicts(compras, show_inventario=False)
+        self.assertEqual(sum(len(c["detalles"]) for c in serializadas), 10)
+        self.assertEqual({d["inventario_anterior"] for c in serializadas for d in c["detalles"]}, {"?"})
+
+    def test_tienda_ajena_y_proveedor_inexistente(self):
+        ajena = self._compra(self.ajena)
+        respuesta = self.api("get", f"/compra/rango/{ajena.proveedor_id}/", token=self.limitado)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json(), [])
+        self.assertEqual(self.api("get", "/compra/rango/999999/").status_code, 404)
+
+
+class CursorRangoTests(CompraApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proveedor = self._compra(self.tienda, "2026-01-01").proveedor_id
+        for dia in range(2, 6):
+            self._compra(self.tienda, f"2026-01-{dia:02d}")
+
+    def _pagina(self, query):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.api("get", f"/compra/rango/{self.proveedor}/?{query}")
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertFalse([q["sql"] for q in consultas if "OFFSET" in q["sql"]])
+        fechas = [c["fecha_compra"][-2:] for c in respuesta.json()]
+        return fechas, respuesta.get(NEXT_CURSOR_HEADER), respuesta.get(PREV_CURSOR_HEADER)
+
+    def test_recorrido_hacia_adelante_y_atras(self):
+        fechas, siguiente, anterior = self._pagina("limit=2")
+        self.assertEqual((fechas, anterior), (["01", "02"], None))
+        fechas, siguiente, anterior = self._pagina(f"limit=2&cursor={siguiente}")
+        self.assertEqual(fechas, ["03", "04"])
+        self.assertEqual(self._pagina(f"limit=2&cursor={anterior}")[0], ["01", "02"])
+        fechas, ultimo, anterior = self._pagina(f"limit=2&cursor={siguiente}")
+        self.assertEqual((fechas, ultimo), (["05"], None))
+        self.assertEqual(self._pagina(f"limit=2&cursor={anterior}")[0], ["03", "04"])
+
+    def test_orden_descendente(self):
+        fechas, siguiente, _ = self._pagina("limit=3&order=desc")
+        self.assertEqual(fechas, ["05", "04", "03"])
+        self.assertEqual(self._pagina(f"limit=3&order=desc&cursor={siguiente}")[0], ["02", "01"])
+
+    def test_limit_cero_o_negativo_y_cursor_invalido(self):
+        self.assertEqual(self._pagina("limit=0"), ([], None, None))
+        self.assertEqual(self._pagina("limit=-3"), ([], None, None))
+        respuesta = self.api("get", f"/compra/rango/{self.proveedor}/?cursor=no-es-un-cursor")
+        self.assertEqual(respuesta.status_code, 400)
+        otro = encode_cursor(["2026-01-01", 1], "next")  # claves de más
+        self.assertEqual(self.api("get", f"/compra/rango/{self.proveedor}/?cursor={otro}").status_code, 400)
+
+
+class HistorialTestCase(CompraApiTestCase):
+    """Tres compras de "a" y "b" en `self.tienda`, cargadas por la API."""
+
+    # (cantidad, inventario_anterior) de "a" y "b" en cada compra
+    HISTORIAL = {
+        "2026-01-01": {"a": (5, 10), "b": (2, 4)},
+        "2026-01-11": {"a": (0, 12), "b": (3, 6)},
+        "2026-01-21": {"a": (4, 2), "b": (0, 1)},
+    }
+
+    def setUp(self):
+        super().setUp()
+        items = []
+        for fecha, valores in self.HISTORIAL.items():
+            compra = self._compra(self.tienda, fecha)
+            for detalle in DetalleCompra.objects.filter(compra=compra).select_related("producto"):
+                cantidad, inventario = valores[detalle.producto.nombre]
+                items.append({"detalle_id": detalle.id, "cantidad": cantidad, "inventario_anterior": inventario})
+        self.assertEqual(self.api("patch", "/compra/detalle/lote/editar/", {"items": items}).status_code, 200)
+        self.proveedor = compra.proveedor_id
+        self.a, self.b = Producto.objects.filter(proveedor_id=self.proveedor).order_by("nombre").values_list("id", flat=True)
+
+    def _reporte(self, url, token=None):
+        respuesta = self.api("get", url, token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        datos = respuesta.json()
+        self.assertEqual(datos["columnas"], CONSUMO_COLUMNAS)
+        return datos["filas"]
+
+
+class ConsumoTests(HistorialTestCase):
+    def test_consumo_entre_compras_consecutivas(self):
+        filas = self._reporte(f"/compra/reporte/consumo/proveedor/{self.proveedor}/?fecha_inicio=2026-01-01&fecha_fin=2026-01-25")
+        self.assertEqual(filas, [
+            # a: 10 + 5 - 12 = 3 y 12 + 0 - 2 = 10; la última compra no tiene siguiente
+            [self.a, "a", self.proveedor, 3, 9, 13, 20, 0.65],
+            [self.b, "b", self.proveedor, 3, 5, 8, 20, 0.4],
+        ])
+
+    def test_rango_de_fechas(self):
+        filas = self._reporte(f"/compra/reporte/consumo/proveedor/{self.proveedor}/?fecha_inicio=2026-01-05&fecha_fin=2026-01-15")
+        # una sola compra en el rango: sin siguiente ni días cubiertos
+        self.assertEqual(filas, [
+            [self.a, "a", self.proveedor, 1, 0, 0, 0, None],
+            [self.b, "b", self.proveedor, 1, 3, 0, 0, None],
+        ])
+
+    def test_una_consulta_y_por_tienda(self):
+        with self.assertNumQueries(1):
+            filas = consumo_por_producto_detalle(tienda_id=self.tienda.id)
+        self.assertEqual([f[0] for f in filas], [self.a, self.b])
+        self._compra(self.ajena, "2026-01-05")
+        self.assertEqual(len(self._reporte(f"/compra/reporte/consumo/tienda/{self.tienda.id}/?fecha_fin=2026-01-30")), 2)
+
+    def test_requiere_ver_inventario(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        token = self.login("sin_inventario")
+        url = f"/compra/reporte/consumo/proveedor/{self.proveedor}/"
+        self.assertEqual(self.api("get", url, token=token).status_code, 403)
+        self.assertEqual(self.api("get", f"/compra/reporte/consumo/tienda/{self.ajena.id}/", token=self.limitado).status_code, 403)
+
+
+class ResumenTests(HistorialTestCase):
+    def _assert_paridad(self):
+        self.assertEqual(
+            resumen.consumo_por_producto(proveedor_id=self.proveedor),
+            consumo_por_producto_detalle(proveedor_id=self.proveedor),
+        )
+        self.assertEqual(resumen.diferencias([self.a, self.b]), 0)
+
+    def test_paridad_tras_cada_escritura(self):
+        self._assert_paridad()
+        febrero = self._compra(self.tienda, "2026-02-03")
+        detalle = DetalleCompra.objects.get(compra=febrero, producto_id=self.a)
+        self.api("patch", f"/compra/detalle/editar/{detalle.id}/", {"cantidad": 7, "inventario_anterior": 1})
+        self._assert_paridad()
+
+        # la compra del 21 de enero pasa a marzo: cambian los dos meses
+        enero = Compra.objects.get(proveedor_id=self.proveedor, fecha_compra="2026-01-21")
+        self.assertEqual(self.api("patch", f"/compra/compra/{enero.id}/", {"fecha_compra": "2026-03-01"}).status_code, 200)
+        self._assert_paridad()
+
+        self.api("delete", f"/compra/detalle/eliminar/{detalle.id}/")
+        self._assert_paridad()
+        self.api("delete", f"/compra/eliminar/{febrero.id}/")
+        self._assert_paridad()
+        self.assertEqual(self.api("delete", f"/producto/eliminar/{self.b}/").status_code, 200)
+        self._assert_paridad()
+
+    def test_reporte_de_meses_completos_lee_el_resumen(self):
+        url = f"/compra/reporte/consumo/proveedor/{self.proveedor}/"
+        esperado = self._reporte(f"{url}?fecha_inicio=2026-01-01&fecha_fin=2026-01-25")
+        resumen.refrescar_pendientes()
+        with CaptureQueriesContext(connection) as consultas:
+            filas = self._reporte(f"{url}?fecha_inicio=2026-01-01&fecha_fin=2026-01-31")
+        self.assertEqual(filas, esperado)
+        self.assertFalse([q["sql"] for q in consultas if '"detalle_compra"' in q["sql"]])
+
+    def test_comando_verificar_y_reconstruir(self):
+        resumen.refrescar_pendientes()
+        salida = io.StringIO()
+        call_command("resumen_compras", "--verificar", stdout=salida)
+        self.assertIn("sin diferencias", salida.getvalue())
+
+        ResumenCompra.objects.filter(producto_id=self.a).update(cantidad_total=999)
+        salida = io.StringIO()
+        call_command("resumen_compras", "--verificar", stdout=salida)
+        self.assertIn("1 resúmenes no coinciden", salida.getvalue())
+
+        call_command("resumen_compras", "--reconstruir", "--lote", "1", stdout=io.StringIO())
+        self._assert_paridad()
+
+
+class StockTests(HistorialTestCase):
+    def _stock(self, token=None):
+        respuesta = self.api("get", f"/producto/listar/{self.proveedor}/?con_stock=true", token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(stock.diferencias(Producto.objects.values("id")), 0)
+        return {p["nombre"]: p["stock"] for p in respuesta.json()}
+
+    def test_ultimo_inventario_y_ultima_compra(self):
+        self.assertEqual(self._stock(), {
+            "a": {"fecha_inventario": "2026-01-21", "inventario": 2, "fecha_ultima_compra": "2026-01-21", "cantidad_ultima_compra": 4},
+            # la última compra de "b" con cantidad > 0 es anterior a su último inventario
+            "b": {"fecha_inventario": "2026-01-21", "inventario": 1, "fecha_ultima_compra": "2026-01-11", "cantidad_ultima_compra": 3},
+        })
+        sin_stock = self.api("get", f"/producto/listar/{self.proveedor}/").json()
+        self.assertEqual({p["stock"] for p in sin_stock}, {None})
+
+    def test_se_mantiene_en_cada_escritura(self):
+        febrero = self._compra(self.tienda, "2026-02-01")
+        self.assertEqual(self._stock()["a"]["fecha_inventario"], "2026-02-01")
+        self.assertEqual(self._stock()["a"]["inventario"], 0)
+
+        detalle = DetalleCompra.objects.get(compra=febrero, producto_id=self.b)
+        self.api("patch", f"/compra/detalle/editar/{detalle.id}/", {"cantidad": 6, "inventario_anterior": 5})
+        self.assertEqual(self._stock()["b"], {
+            "fecha_inventario": "2026-02-01", "inventario": 5, "fecha_ultima_compra": "2026-02-01", "cantidad_ultima_compra": 6,
+        })
+        self.api("delete", f"/compra/detalle/eliminar/{detalle.id}/")
+        self.assertEqual(self._stock()["b"]["fecha_ultima_compra"], "2026-01-11")
+        self.api("delete", f"/compra/eliminar/{febrero.id}/")
+        self.assertEqual(self._stock()["a"]["inventario"], 2)
+
+        # producto nuevo: la señal le crea detalles (0, 0) y con ellos su stock
+        self.api("post", "/producto/crear/", {"nombre": "c", "proveedor_id": self.proveedor})
+        self.assertEqual(self._stock()["c"], {
+            "fecha_inventario": "2026-01-21", "inventario": 0, "fecha_ultima_compra": None, "cantidad_ultima_compra": None,
+        })
+
+    def test_una_consulta_para_todos_los_productos(self):
+        def consultas():
+            with CaptureQueriesContext(connection) as capturadas:
+                self.api("get", f"/producto/listar/{self.proveedor}/?con_stock=true")
+            return len(capturadas)
+
+        consultas()  # calienta sesión y permisos
+        antes = consultas()
+        self.api("post", "/producto/crear/lote/", {"proveedor_id": self.proveedor, "nombres": [f"n{i}" for i in range(10)]})
+        self.assertEqual(consultas(), antes)
+
+    def test_inventario_oculto(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        stock_oculto = self._stock(self.login("sin_inventario"))
+        self.assertEqual({s["inventario"] for s in stock_oculto.values()}, {"?"})
+        self.assertEqual(stock_oculto["a"]["cantidad_ultima_compra"], 4)
+
+
+class SugerenciasTests(HistorialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/compra/sugerencias/tienda/{self.tienda.id}/?fecha=2026-01-31"
+
+    def _sugerencias(self, token=None):
+        respuesta = self.api("get", self.url, token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        datos = respuesta.json()
+        self.assertEqual(datos["columnas"], sugerencias.SUGERENCIA_COLUMNAS)
+        return datos["filas"]
+
+    def test_suavizado_y_stock_de_seguridad(self):
+        # a: consumo diario 0.3 y luego 1.0 -> media 0.51; compras cada 10 días;
+        # stock al 31: 2 + 4 - 0.51 * 10 = 0.9
+        self.assertEqual(self._sugerencias(), [
+            [self.a, "a", self.proveedor, 3, 0.51, 0.321, 0.9, 10.0, 1.7, 6],
+            [self.b, "b", self.proveedor, 3, 0.24, 0.367, 0.0, 10.0, 1.9, 5],
+        ])
+
+    def test_una_consulta_para_todos_los_proveedores(self):
+        otro = self._compra(self.ajena).proveedor_id
+        with self.assertNumQueries(1):
+            calculadas = sugerencias.calcular([self.proveedor, otro], date(2026, 1, 31))
+        self.assertEqual(len(calculadas[self.proveedor]), 2)
+        # una sola compra: no hay consumo del que partir
+        self.assertEqual({tuple(fila[4:]) for fila in calculadas[otro]}, {(None,) * 6})
+
+    def test_cache_por_version_del_proveedor(self):
+        filas = self._sugerencias()
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self._sugerencias(), filas)
+        self.assertFalse([q["sql"] for q in consultas if '"detalle_compra"' in q["sql"]])
+
+        detalle = DetalleCompra.objects.get(compra__fecha_compra="2026-01-21", producto_id=self.a)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api("patch", f"/compra/detalle/editar/{detalle.id}/", {"cantidad": 40})
+        self.assertEqual(self._sugerencias()[0][-1], 0)
+
+    def test_requiere_ver_inventario(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        self.assertEqual(self.api("get", self.url, token=self.login("sin_inventario")).status_code, 403)
+
+
+class ExportarTests(HistorialTestCase):
+    def _descargar(self, url, token=None):
+        respuesta = self.api("get", url, token=token)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, b"".join(respuesta.streaming_content)
+
+    def _csv(self, url, token=None):
+        respuesta, contenido = self._descargar(url, token)
+        self.assertEqual(respuesta["Content-Type"], "text/csv; charset=utf-8")
+        filas = list(csv.reader(io.StringIO(contenido.decode())))
+        self.assertEqual(filas[0], exportar.EXPORT_COLUMNAS)
+        return filas[1:]
+
+    def test_csv_de_proveedor(self):
+        url = f"/compra/exportar/proveedor/{self.proveedor}/"
+        respuesta, _ = self._descargar(url)
+        self.assertEqual(respuesta["Content-Disposition"], f'attachment; filename="compras_proveedor_{self.proveedor}.csv"')
+        filas = self._csv(url)
+        # orden (fecha, producto)
+        self.assertEqual([(f[3], f[5]) for f in filas], [(fecha, p) for fecha in self.HISTORIAL for p in "ab"])
+        self.assertEqual(filas[0][-2:], ["5", "10"])
+        self.assertEqual(len(self._csv(f"{url}?fecha_inicio=2026-01-05&fecha_fin=2026-01-15")), 2)
+
+    def test_inventario_oculto(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        filas = self._csv(f"/compra/exportar/tienda/{self.tienda.id}/", self.login("sin_inventario"))
+        self.assertEqual({f[-1] for f in filas}, {"?"})
+        self.assertEqual(filas[0][-2], "5")
+
+    def test_tienda_y_permisos(self):
+        self._compra(self.ajena)
+        self.assertEqual(len(self._csv(f"/compra/exportar/tienda/{self.tienda.id}/")), 6)
+        self.assertEqual(len(self._csv(f"/compra/exportar/tienda/{self.ajena.id}/")), 2)
+        self.assertEqual(self.api("get", f"/compra/exportar/tienda/{self.ajena.id}/", token=self.limitado).status_code, 403)
+        self.assertEqual(self.api("get", "/compra/exportar/tienda/999999/").status_code, 404)
+        self.assertEqual(self.api("get", "/compra/exportar/proveedor/999999/").status_code, 404)
+
+    def test_xlsx(self):
+        respuesta, contenido = self._descargar(f"/compra/exportar/proveedor/{self.proveedor}/?formato=xlsx")
+        self.assertEqual(respuesta["Content-Type"], "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            hoja = ElementTree.fromstring(libro.read("xl/worksheets/sheet1.xml"))
+        ns = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        filas = [
+            [c.findtext("s:v", namespaces=ns) or c.findtext("s:is/s:t", namespaces=ns) for c in fila.findall("s:c", ns)]
+            for fila in hoja.iterfind("s:sheetData/s:row", ns)
+        ]
+        self.assertEqual(filas[0], exportar.EXPORT_COLUMNAS)
+        self.assertEqual(len(filas), 7)
+        self.assertEqual(filas[1][3:], ["2026-01-01", str(self.a), "a", "5", "10"])
+
+    def test_se_entrega_por_partes(self):
+        with mock.patch.object(exportar, "CHUNK_SIZE", 2):
+            partes = list(exportar.csv_partes(exportar.filas(proveedor_id=self.proveedor)))
+        # cabecera + 6 filas de a 2
+        self.assertEqual(len(partes), 4)
+
+
+class ImportarTests(CompraApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.compra = self._compra(self.tienda, "2026-01-01")
+        self.proveedor = self.compra.proveedor
+        self.hasta = self.api("get", f"/compra/cambios/tienda/{self.tienda.id}/").json()["hasta"]
+
+    def _importar(self, contenido, token=None, tienda=None):
+        archivo = SimpleUploadedFile("compras.csv", contenido.encode(), content_type="text/csv")
+        return self.client.post(
+            f"/api/compra/importar/tienda/{(tienda or self.tienda).id}/", {"archivo": archivo},
+            HTTP_AUTHORIZATION=f"Bearer {token or self.token}",
+        )
+
+    def _detalles(self):
+        return {
+            (d.compra.fecha_compra.isoformat(), d.producto.nombre): (d.cantidad, d.inventario_anterior)
+            for d in DetalleCompra.objects.filter(compra__proveedor=self.proveedor).select_related("compra", "producto")
+        }
+
+    def test_filas_con_error_no_detienen_la_importacion(self):
+        respuesta = self._importar(
+            "proveedor;fecha;producto;cantidad;inventario_anterior\n"
+            "P;01/01/2026;a;3;4\n"
+            "Otro;2026-01-02;a;1;1\n"
+            "P;2026-13-01;a;1;1\n"
+            "P;2026-01-02;;1;1\n"
+            "P;2026-01-02;a;-1;1\n"
+            "P;2026-01-02;a;1;x\n"
+            "\n"
+            "P;2026-01-02;c;2;0\n"
+            "P;2026-01-02;c;9;9\n"
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json(), {
+            "filas": 8,
+            "importadas": 2,
+            "compras_creadas": 1,
+            "productos_creados": 1,
+            "errores": [
+                {"fila": 3, "message": "Proveedor no encontrado: 'Otro'"},
+                {"fila": 4, "message": "fecha inválida: '2026-13-01'"},
+                {"fila": 5, "message": "producto inválido: ''"},
+                {"fila": 6, "message": "cantidad fuera de rango: -1"},
+                {"fila": 7, "message": "inventario_anterior no es un número entero: 'x'"},
+                {"fila": 10, "message": "Fila repetida: ya hay otra con el mismo proveedor, fecha y producto"},
+            ],
+        })
+        # lo importado sobrescribe; el resto de la grilla se completa con (0, 0)
+        self.assertEqual(self._detalles(), {
+            ("2026-01-01", "a"): (3, 4), ("2026-01-01", "b"): (0, 0), ("2026-01-01", "c"): (0, 0),
+            ("2026-01-02", "a"): (0, 0), ("2026-01-02", "b"): (0, 0), ("2026-01-02", "c"): (2, 0),
+        })
+        productos = Producto.objects.filter(proveedor=self.proveedor).values("id")
+        self.assertEqual(stock.diferencias(productos), 0)
+        resumen.refrescar_pendientes()
+        self.assertEqual(resumen.diferencias(productos), 0)
+
+    def test_cambios_solo_de_lo_escrito(self):
+        sin_tocar = DetalleCompra.objects.get(compra=self.compra, producto__nombre="b")
+        with mock.patch.object(importar, "COMPRAS_POR_CONSULTA", 1):
+            respuesta = self._importar(
+                "proveedor,fecha,producto,cantidad,inventario_anterior\n"
+                "P,2026-01-01,a,3,4\n"
+                "P,2026-01-02,a,1,1\n"
+                "P,2026-01-02,b,1,1\n"
+            )
+        self.assertEqual(respuesta.json()["importadas"], 3)
+        cambios = self.api("get", f"/compra/cambios/tienda/{self.tienda.id}/?desde={self.hasta}").json()
+        escritos = {(d["compra_id"], d["producto_id"]) for d in cambios["detalles"]}
+        self.assertNotIn((self.compra.id, sin_tocar.producto_id), escritos)
+        self.assertEqual(len(escritos), 3)
+        self.assertEqual(len(cambios["compras"]), 1)
+
+    def test_sin_permiso_para_crear_productos(self):
+        self.crear_usuario("sin_productos", tiendas=[self.tienda], puede_gestionar_productos=False)
+        respuesta = self._importar(
+            "proveedor,fecha,producto,cantidad,inventario_anterior\nP,2026-01-02,a,1,1\nP,2026-01-02,nuevo,1,1\n",
+            self.login("sin_productos"),
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()["importadas"], 1)
+        self.assertEqual(respuesta.json()["errores"], [{"fila": 3, "message": "Producto no encontrado: 'nuevo'"}])
+        self.assertFalse(Producto.objects.filter(nombre="nuevo").exists())
+
+    def test_lotes_y_archivo_invalido(self):
+        contenido = "proveedor,fecha,producto,cantidad,inventario_anterior\n" + "".join(
+            f"P,2026-02-{dia:02d},{p},{dia},1\n" for dia in range(1, 6) for p in "ab"
+        )
+        resultado = importar.importar(io.StringIO(contenido), self.tienda.id, lote=3)
+        self.assertEqual((resultado.importadas, resultado.compras_creadas, resultado.errores), (10, 5, []))
+        self.assertEqual(self._detalles()[("2026-02-05", "b")], (5, 1))
+
+        respuesta = self._importar("proveedor,fecha,producto\nP,2026-01-02,a\n")
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn("cantidad, inventario_anterior", respuesta.json()["message"])
+        self.assertEqual(self._importar("proveedor,fecha,producto,cantidad,inventario_anterior\n", self.limitado, self.ajena).status_code, 403)
+
+
+class MatrizTests(HistorialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/compra/matriz/{self.proveedor}/"
+        self.compras = list(Compra.objects.filter(proveedor_id=self.proveedor).order_by("fecha_compra").values_list("id", flat=True))
+
+    def _matriz(self, query="", token=None):
+        respuesta = self.api("get", f"{self.url}?{query}", token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_filas_por_producto_y_columnas_por_fecha(self):
+        # sin detalle de "b" en la segunda compra: la celda queda vacía
+        DetalleCompra.objects.filter(compra_id=self.compras[1], producto_id=self.b).delete()
+        matriz = self._matriz()
+        self.assertEqual(matriz["producto_ids"], [self.a, self.b])
+        self.assertEqual(matriz["productos"], ["a", "b"])
+        self.assertEqual(matriz["compra_ids"], self.compras)
+        self.assertEqual(matriz["fechas"], list(self.HISTORIAL))
+        self.assertEqual(matriz["cantidad"], [5, 0, 4, 2, None, 0])
+        self.assertEqual(matriz["inventario_anterior"], [10, 12, 2, 4, None, 1])
+        self.assertIsNone(matriz["detalle_ids"][4])
+        self.assertEqual(
+            matriz["detalle_ids"][0], DetalleCompra.objects.get(compra_id=self.compras[0], producto_id=self.a).id
+        )
+
+    def test_ultimas_compras_en_orden_ascendente(self):
+        self.assertEqual(self._matriz("limit=2")["fechas"], ["2026-01-11", "2026-01-21"])
+        self.assertEqual(self._matriz("fecha_fin=2026-01-15")["fechas"], ["2026-01-01", "2026-01-11"])
+        with self.assertNumQueries(1):
+            _matriz([(self.compras[0], date(2026, 1, 1))], show_inventario=True)
+
+    def test_inventario_oculto_y_permisos(self):
+        self.crear_usuario("sin_inventario", tiendas=[self.tienda], puede_ver_inventario_compras=False)
+        matriz = self._matriz(token=self.login("sin_inventario"))
+        self.assertEqual(set(matriz["inventario_anterior"]), {"?"})
+        self.assertEqual(matriz["cantidad"], [5, 0, 4, 2, 3, 0])
+
+        ajena = self._compra(self.ajena).proveedor_id
+        self.assertEqual(self.api("get", f"/compra/matriz/{ajena}/", token=self.limitado).status_code, 403)
+        self.assertEqual(self.api("get", "/compra/matriz/999999/").status_code, 404)
+
+    def test_mas_chica_que_el_rango(self):
+        Producto.objects.bulk_create(
+            Producto(nombre=f"producto {i}", proveedor_id=self.proveedor, orden=2048 + i) for i in range(30)
+        )
+        DetalleCompra.objects.completar_vacios(proveedor_id=self.proveedor)
+        matriz = self.api("get", f"{self.url}?limit=3")
+        rango = self.api("get", f"/compra/rango/{self.proveedor}/?limit=3")
+        self.assertEqual(len(rango.json()), 3)
+        self.assertLess(len(matriz.content) * 3, len(rango.content))
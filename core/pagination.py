@@ -0,0 +1,125 @@
+"""Paginación por keyset (cursor) para los listados.
+
+En lugar de OFFSET, cada página se pide "después de" (o "antes de") los valores de
+ordenación de la última (o primera) fila de la página anterior. Con un índice sobre
+esas columnas, cualquier página cuesta lo mismo que la primera.
+
+Los cursores son opacos para el cliente y viajan en las cabeceras `X-Next-Cursor` /
+`X-Prev-Cursor`, así el cuerpo de las respuestas no cambia de forma.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from django.db.models import F, Q
+from ninja.errors import HttpError
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+DEFAULT_PAGE_SIZE = 100
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+
+def encode_cursor(values: list, direction: str) -> str:
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    raw = json.dumps({"k": values, "d": direction}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, n_keys: int) -> tuple[list, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values, direction = data["k"], data["d"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HttpError(400, "Cursor inválido")
+    if direction not in ("next", "prev") or not isinstance(values, list) or len(values) != n_keys:
+        raise HttpError(400, "Cursor inválido")
+    return values, direction
+
+
+def _after(keys: tuple, values: list, descending: bool) -> Q:
+    """Filas posteriores a `values` en el orden (con NULLs primero en orden ascendente)."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for key, value in zip(keys, values):
+        if descending:
+            step = Q(**{f"{key}__lt": value}) | Q(**{f"{key}__isnull": True}) if value is not None else Q(pk__in=[])
+        else:
+            step = Q(**{f"{key}__gt": value}) if value is not None else Q(**{f"{key}__isnull": False})
+        condition |= equal & step
+        equal &= Q(**{f"{key}__isnull": True}) if value is None else Q(**{key: value})
+    return condition
+
+
+def _ordering(keys: tuple, descending: bool) -> list:
+    if descending:
+        return [F(key).desc(nulls_last=True) for key in keys]
+    return [F(key).asc(nulls_first=True) for key in keys]
+
+
+def paginate_keyset(qs, keys: tuple, page_size: int, cursor: str | None = None, descending: bool = False) -> KeysetPage:
+    """Devuelve una página de `qs` ordenada por `keys` (que deben identificar cada fila).
+
+    `qs` puede ser de instancias o de `values()`; en el segundo caso debe incluir `keys`.
+    Con `page_size` < 1 devuelve una página vacía sin cursores (`limit=0` siempre
+    devolvió `[]`).
+    """
+    if page_size < 1:
+        return KeysetPage([])
+    direction = "next"
+    if cursor:
+        values, direction = decode_cursor(cursor, len(keys))
+        # hacia atrás se recorre en orden inverso y luego se da vuelta la página
+        backwards = direction == "prev"
+        qs = qs.filter(_after(keys, values, descending != backwards))
+    else:
+        backwards = False
+    rows = list(qs.order_by(*_ordering(keys, descending != backwards))[: page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def key_of(row):
+        if isinstance(row, dict):
+            return [row[k] for k in keys]
+        return [getattr(row, k) for k in keys]
+
+    page = KeysetPage(rows)
+    if rows:
+        if has_more or backwards:
+            page.next_cursor = encode_cursor(key_of(rows[-1]), "next")
+        if cursor and (has_more or not backwards):
+            page.prev_cursor = encode_cursor(key_of(rows[0]), "prev")
+    return page
+
+
+def set_cursor_headers(response, page: KeysetPage) -> None:
+    if page.next_cursor:
+        response[NEXT_CURSOR_HEADER] = page.next_cursor
+    if page.prev_cursor:
+        response[PREV_CURSOR_HEADER] = page.prev_cursor
+
+
+def paginate_optional(qs, keys: tuple, response, limit: int | None, cursor: str | None):
+    """Para listados que históricamente devolvían todo: pagina sólo si el cliente
+    pasa `limit` o `cursor`; si no, devuelve `qs` completo en el orden de `keys`.
+
+    Como en `paginate_keyset`, `limit=0` (y un `limit` negativo, que se lleva a 0)
+    devuelve una página vacía; sólo sin `limit` se usa `DEFAULT_PAGE_SIZE`."""
+    if limit is None and cursor is None:
+        return qs.order_by(*_ordering(keys, False))
+    page_size = DEFAULT_PAGE_SIZE if limit is None else max(limit, 0)
+    page = paginate_keyset(qs, keys, page_size, cursor)
+    set_cursor_headers(response, page)
+    return page.items
@@ -131,3 +131,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS: permitir todos los orígenes (útil en desarrollo)
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Sesiones (token Bearer): duración de la sesión y caché en proceso del lookup de tokens
+AUTH_SESSION_TTL = 60 * 60 * 24 * 30
+AUTH_TOKEN_CACHE_SIZE = 1024
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Caché compartida entre workers (permisos por usuario, etc.). FileBasedCache sirve
+# para varios workers en un mismo host; en varios hosts usar p.ej. PyMemcacheCache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+    },
+    # Estado que no se puede perder por expulsión: versiones por proveedor/tienda y
+    # revocaciones de tokens. Separado de 'default' (permisos, sugerencias), cuyo
+    # MAX_ENTRIES por defecto (300) borra un tercio de las entradas al llenarse.
+    # Alcanza con una entrada por proveedor y por tienda más las revocaciones del
+    # último minuto; FileBasedCache cuenta los archivos en cada escritura, así que
+    # el límite no debe ser mucho mayor de lo necesario.
+    'estado': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'estado',
+        'OPTIONS': {'MAX_ENTRIES': 50_000},
+    },
+}
+PERMISOS_CACHE_ALIAS = 'default'
+PERMISOS_CACHE_TIMEOUT = 60 * 60
+# Revocaciones de tokens (logout, usuario eliminado) visibles para todos los workers
+AUTH_REVOCACION_CACHE_ALIAS = 'estado'
+# Segundos entre consultas de revocación por token en cada worker (demora máxima de un logout)
+AUTH_REVOCACION_INTERVALO = 5
+# Versiones por proveedor/tienda (core.versiones): ETag de los listados y cachés derivadas
+VERSIONES_CACHE_ALIAS = 'estado'
+# Sugerencias de pedido (compra.sugerencias): caché por (proveedor, fecha) y parámetros
+SUGERENCIAS_CACHE_ALIAS = 'default'
+SUGERENCIAS_CACHE_TIMEOUT = 60 * 60 * 24
+SUGERENCIAS_VENTANA_DIAS = 180
+SUGERENCIAS_ALFA = 0.3
+SUGERENCIAS_Z = 1.65
+
+# Al crear un producto, crear sus detalles en las compras existentes en segundo plano
+# (tras el commit) en lugar de dentro del request. Útil con historiales muy grandes.
+PRODUCTO_FANOUT_DIFERIDO = False
+# Cabeceras de paginación por cursor y de GET condicional que el frontend necesita leer
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'X-Prev-Cursor', 'ETag']
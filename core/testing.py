@@ -0,0 +1,57 @@
+"""Base común para las pruebas que usan la API por HTTP."""
+import json
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from usuario.auth import token_cache
+from usuario.models import PermisosUsuarioTienda, Usuario
+
+
+PASSWORD = "x"
+
+# cada alias de `CACHES` en memoria y separado de los demás, como en producción
+CACHES_PRUEBA = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"pruebas-{alias}"}
+    for alias in settings.CACHES
+}
+
+
+@override_settings(CACHES=CACHES_PRUEBA)
+class ApiTestCase(TestCase):
+    """`TestCase` con usuarios, login y requests a `/api` con token Bearer.
+
+    Las cachés en memoria y la caché de tokens de este proceso se vacían antes de cada
+    prueba: los ids se reutilizan entre pruebas y una entrada vieja se leería como propia.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for alias in CACHES_PRUEBA:
+            caches[alias].clear()
+        token_cache.clear()
+
+    def crear_usuario(self, username: str, superusuario: bool = False, tiendas=(), **permisos) -> Usuario:
+        """Crea un usuario con permisos en `tiendas` (`permisos` fija los `puede_*`)."""
+        usuario = Usuario.objects.create(username=username, password=make_password(PASSWORD), es_superusuario=superusuario)
+        for tienda in tiendas:
+            PermisosUsuarioTienda.objects.create(usuario=usuario, tienda=tienda, **permisos)
+        return usuario
+
+    def login(self, username: str) -> str:
+        respuesta = self.client.post(
+            "/api/usuario/login/", json.dumps({"username": username, "password": PASSWORD}),
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()["token"]
+
+    def api(self, method: str, url: str, data=None, token: str | None = None, **extra):
+        """Request a `/api{url}`; sin `token` usa `self.token` si la prueba lo definió."""
+        token = token or getattr(self, "token", None)
+        if token:
+            extra.setdefault("HTTP_AUTHORIZATION", f"Bearer {token}")
+        body = json.dumps(data) if data is not None else None
+        return getattr(self.client, method)(f"/api{url}", body, content_type="application/json", **extra)
@@ -0,0 +1,114 @@
+"""Contadores de versión por proveedor y por tienda.
+
+Cada escritura sobre los productos, compras o detalles de un proveedor llama a
+`bump("proveedor", id)` y `bump("datos_tienda", id)` de su tienda (desde
+`compra.escrituras.registrar_escritura`); las altas, cambios y bajas de
+proveedores, a `bump("tienda", id)`. Los contadores viven en la caché compartida
+(`VERSIONES_CACHE_ALIAS`), con el mismo esquema que `usuario.permisos_cache`, y
+sirven para invalidar resultados cacheados y para los GET condicionales
+(`ETag` / `If-None-Match`) de `etag_por_version`.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+
+from usuario import permisos_cache
+from usuario.permisions import get_permission_context
+
+
+CACHE_ALIAS = getattr(settings, "VERSIONES_CACHE_ALIAS", "default")
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(ambito: str, id: int) -> str:
+    return f"version:{ambito}:{id}"
+
+
+def get_versions(ambito: str, ids) -> dict[int, int]:
+    cache = _cache()
+    keys = {_key(ambito, i): i for i in ids}
+    versiones = {keys[k]: v for k, v in cache.get_many(keys).items()}
+    for key, i in keys.items():
+        if i not in versiones:
+            # si la clave se pierde se parte de un valor basado en el reloj, nunca de 1
+            version = time.time_ns()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versiones[i] = version
+    return versiones
+
+
+def get_version(ambito: str, id: int) -> int:
+    return get_versions(ambito, [id])[id]
+
+
+def _incrementar(ambito: str, ids) -> None:
+    cache = _cache()
+    for i in ids:
+        # `set` de un valor nuevo y no `incr`, como `permisos_cache.bump_version`: en
+        # FileBasedCache `incr` es leer y escribir, y dos bumps simultáneos podrían
+        # terminar en el mismo valor
+        cache.set(_key(ambito, i), time.time_ns(), None)
+
+
+def bump(ambito: str, *ids: int) -> None:
+    """Marca como cambiados los proveedores/tiendas indicados.
+
+    Dentro de una transacción se aplica al confirmarla: una lectura concurrente que aún
+    ve los datos anteriores no puede quedar asociada a la versión nueva.
+    """
+    ids = {i for i in ids if i is not None}
+    if ids:
+        transaction.on_commit(lambda: _incrementar(ambito, ids))
+
+
+def _etag(request, ambito: str, id: int, extra: str = "") -> str:
+    user = get_permission_context(request).user
+    # la respuesta depende del usuario (tiendas visibles, inventario enmascarado)
+    usuario = f"{user.id}:{permisos_cache.get_version(user.id)}" if user else "-"
+    raw = f"{request.get_full_path()}|{ambito}:{id}:{get_version(ambito, id)}|{extra}|{usuario}"
+    return 'W/"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _coincide(if_none_match: str, etag: str) -> bool:
+    etiquetas = {e.strip() for e in if_none_match.split(",")}
+    return "*" in etiquetas or etag in etiquetas or etag.removeprefix("W/") in etiquetas
+
+
+def etag_por_version(ambito: str, param: str, extra=None):
+    """GET condicional para una vista cuya respuesta sólo depende del proveedor/tienda
+    `kwargs[param]` y del usuario.
+
+    Si `If-None-Match` coincide responde 304 sin ejecutar la vista (no lee tablas de
+    datos). La vista debe declarar `response: HttpResponse` si no devuelve ella misma
+    un `HttpResponse`, para poder fijar la cabecera `ETag`.
+
+    Si la respuesta depende además de otras versiones, `extra(kwargs)` devuelve un
+    texto que las resume y que entra en el `ETag`.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            etag = _etag(request, ambito, kwargs[param], extra(kwargs) if extra else "")
+            if _coincide(request.headers.get("If-None-Match", ""), etag):
+                not_modified = HttpResponse(status=304)
+                not_modified["ETag"] = etag
+                return not_modified
+            result = func(request, *args, **kwargs)
+            if isinstance(result, HttpResponseBase):
+                if result.status_code == 200:
+                    result["ETag"] = etag
+            elif not isinstance(result, tuple) and "response" in kwargs:
+                kwargs["response"]["ETag"] = etag
+            return result
+        return wrapper
+    return decorator
@@ -1,24 +1,47 @@
 from ninja import Router
-from usuario.permisions import require_manage_products, _get_user_from_request, get_allowed_tiendas
-from usuario.permisions import has_permission
-from producto.schemas import ProductoSchema, ProductoInSchema, ProductoUpdateSchema, MoverProductoSchema
+from usuario.permisions import require_manage_products, get_permission_context, TiendaVia
+from producto.schemas import (
+    ProductoSchema,
+    ProductoConStockSchema,
+    ProductoInSchema,
+    ProductoUpdateSchema,
+    MoverProductoSchema,
+    MoverProductoPosicionSchema,
+    OrdenProductosSchema,
+    ProductoLoteInSchema,
+    ProductoLoteResultadoSchema,
+    ProductoBusquedaSchema,
+)
 from core.schemas import ErrorSchema
+from core.pagination import paginate_optional
+from core.versiones import etag_por_version
+from compra.escrituras import registrar_escritura
+from compra.models import DetalleCompra
+from django.http import HttpResponse
+from typing import Optional
 from producto.models import Producto
+from producto import busqueda, orden
 from proveedor.models import Proveedor
 from ninja.errors import HttpError
 from django.db import IntegrityError
-from django.db.models import Max
-from django.db import transaction
+
+# Máximo de nombres por petición de `crear_productos_lote`
+MAX_PRODUCTOS_LOTE = 1000
 
 producto_router = Router(tags=["Productos"])
-@producto_router.get("/listar/{proveedor_id}/", response=list[ProductoSchema])
-def listar_productos(request, proveedor_id: int):
+@producto_router.get("/listar/{proveedor_id}/", response=list[ProductoConStockSchema])
+@etag_por_version("proveedor", "proveedor_id")
+def listar_productos(request, response: HttpResponse, proveedor_id: int, limit: Optional[int] = None, cursor: Optional[str] = None, con_stock: bool = False):
     """
     Lista todos los productos de un proveedor específico.
+
+    Con `limit` y/o `cursor` pagina por keyset sobre (proveedor, orden); ver cabeceras `X-Next-Cursor` / `X-Prev-Cursor`.
+    Con `con_stock=true` cada producto trae `stock` (último inventario y última compra), leído en la misma consulta.
+    Soporta GET condicional (`ETag` / `If-None-Match`) por versión del proveedor.
     """
     # Filtrar por tiendas permitidas del usuario (GETs son públicos pero limitados por tiendas)
-    user = _get_user_from_request(request)
-    allowed = get_allowed_tiendas(user)
+    ctx = get_permission_context(request)
+    allowed = ctx.get_allowed_tiendas()
     # comprobar proveedor y su tienda
     proveedor = Proveedor.objects.filter(id=proveedor_id).first()
     if not proveedor:
@@ -26,10 +49,31 @@ def listar_productos(request, proveedor_id: int):
     tienda_id = proveedor.tienda_id
     if allowed is not None and tienda_id not in allowed:
         return []
-    productos = Producto.objects.filter(proveedor_id=proveedor_id).order_by('orden')
+    productos = Producto.objects.filter(proveedor_id=proveedor_id)
+    if not con_stock:
+        return paginate_optional(productos, ("orden", "id"), response, limit, cursor)
+    productos = list(paginate_optional(productos.select_related("stock"), ("orden", "id"), response, limit, cursor))
+    if not ctx.has_permission(tienda_id, "puede_ver_inventario_compras"):
+        for producto in productos:
+            stock = getattr(producto, "stock", None)
+            if stock is not None:
+                stock.inventario = "?"
     return productos
-@producto_router.post("/crear/", response={200: ProductoSchema, 400: ErrorSchema})
-@require_manage_products()
+@producto_router.get("/buscar/", response=list[ProductoBusquedaSchema])
+def buscar_productos(request, q: str, tienda_id: Optional[int] = None, limit: int = busqueda.LIMITE):
+    """
+    Busca productos por nombre en todos los proveedores de las tiendas permitidas
+    (o sólo en `tienda_id`).
+
+    Cada palabra de `q` se busca como prefijo, sin distinguir mayúsculas ni acentos
+    (ver `producto.busqueda`). Primero los nombres que empiezan con lo buscado.
+    """
+    tiendas = get_permission_context(request).get_allowed_tiendas()
+    if tienda_id is not None:
+        tiendas = [tienda_id] if tiendas is None or tienda_id in tiendas else []
+    return busqueda.buscar(q, tiendas, min(max(limit, 1), busqueda.LIMITE_MAXIMO))
+@producto_router.post("/crear/", response={200: ProductoSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema})
+@require_manage_products(TiendaVia("proveedor", "producto_in", "proveedor_id"))
 def crear_producto(request, producto_in: ProductoInSchema):
     """
     Crea un nuevo producto asociado a un proveedor.
@@ -38,89 +82,174 @@ def crear_producto(request, producto_in: ProductoInSchema):
     if Producto.objects.filter(proveedor_id=producto_in.proveedor_id, nombre=producto_in.nombre).exists():
         return 400, {"message": "Ya existe un producto con ese nombre para este proveedor."}
     try:
-        # asignar orden secuencial por proveedor (siempre automático)
-        max_orden = Producto.objects.filter(proveedor_id=producto_in.proveedor_id).aggregate(max_ord=Max('orden'))['max_ord']
-        next_orden = 1 if max_orden is None else int(max_orden) + 1
-
-        producto = Producto.objects.create(
-            nombre=producto_in.nombre,
-            proveedor_id=producto_in.proveedor_id,
-            orden=next_orden,
-        )
+        with registrar_escritura([producto_in.proveedor_id]) as escritura:
+            # orden al final del proveedor (siempre automático), reservado con el
+            # proveedor bloqueado como en el alta en lote
+            [next_orden] = orden.reservar(producto_in.proveedor_id, 1)
+            producto = Producto.objects.create(
+                nombre=producto_in.nombre,
+                proveedor_id=producto_in.proveedor_id,
+                orden=next_orden,
+            )
+            escritura.productos = Producto.objects.filter(pk=producto.pk)
     except IntegrityError:
         return 400, {"message": "Ya existe un producto con ese nombre para este proveedor (constraint)."}
     return producto
 
 
+@producto_router.post("/crear/lote/", response={200: ProductoLoteResultadoSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_products(TiendaVia("proveedor", "payload", "proveedor_id"))
+def crear_productos_lote(request, payload: ProductoLoteInSchema):
+    """Crea muchos productos de un proveedor a partir de una lista de nombres.
+
+    Los nombres que ya existen (o se repiten en la lista) se informan en `existentes`
+    y no se crean. Los nuevos quedan al final, en el orden de la lista, y reciben un
+    detalle (0, 0) en cada compra existente del proveedor, todo en una transacción y
+    con un número fijo de consultas.
+    """
+    if len(payload.nombres) > MAX_PRODUCTOS_LOTE:
+        return 400, {"message": f"Como máximo {MAX_PRODUCTOS_LOTE} productos por petición"}
+    max_nombre = Producto._meta.get_field("nombre").max_length
+    nombres, existentes, invalidos = {}, [], []
+    for nombre in payload.nombres:
+        nombre = nombre.strip()
+        if not nombre or len(nombre) > max_nombre:
+            invalidos.append(nombre)
+        elif nombre in nombres:
+            existentes.append(nombre)
+        else:
+            nombres[nombre] = None
+    # una sola consulta para descartar los que ya existen
+    ya_existen = set(
+        Producto.objects.filter(proveedor_id=payload.proveedor_id, nombre__in=list(nombres)).values_list("nombre", flat=True)
+    )
+    existentes.extend(n for n in nombres if n in ya_existen)
+    a_crear = [n for n in nombres if n not in ya_existen]
+    if not a_crear:
+        return {"creados": [], "existentes": existentes, "invalidos": invalidos}
+    try:
+        with registrar_escritura([payload.proveedor_id]) as escritura:
+            # bloque contiguo de `orden` al final, con el proveedor bloqueado hasta el commit
+            ordenes = orden.reservar(payload.proveedor_id, len(a_crear))
+            nuevos = Producto.objects.bulk_create([
+                Producto(nombre=nombre, proveedor_id=payload.proveedor_id, orden=valor)
+                for nombre, valor in zip(a_crear, ordenes)
+            ])
+            ids = [p.id for p in nuevos]
+            # `bulk_create` no dispara la señal: el fan-out se hace una vez para todos
+            DetalleCompra.objects.completar_vacios(proveedor_id=payload.proveedor_id, producto_ids=ids)
+            escritura.productos = Producto.objects.filter(id__in=ids)
+    except IntegrityError:
+        # otra petición creó alguno de los nombres entre la consulta y el insert
+        return 400, {"message": "Alguno de los productos ya existe para este proveedor (constraint)."}
+    return {"creados": nuevos, "existentes": existentes, "invalidos": invalidos}
+
+
 @producto_router.post("/mover/", response={200: dict, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema})
 def mover_producto(request, payload: MoverProductoSchema):
-    """Mueve un producto intercambiando su `orden` con el producto de arriba/abajo."""
+    """Mueve un producto intercambiando su `orden` con el producto de arriba/abajo.
+
+    Para moverlo varias posiciones de una vez, ver `/mover/posicion/`.
+    """
     try:
         producto = Producto.objects.get(id=payload.producto_id)
     except Producto.DoesNotExist:
         return 400, {"message": "Producto no encontrado"}
 
     # permiso: verificar que el usuario pueda gestionar productos en la tienda del proveedor
-    user = _get_user_from_request(request)
     tienda_id = producto.proveedor.tienda_id
-    if not user or not has_permission(user, tienda_id, 'puede_gestionar_productos'):
+    if not get_permission_context(request).has_permission(tienda_id, 'puede_gestionar_productos'):
         return 403, {"message": "No autorizado para mover productos en esta tienda"}
 
-    # Hacer el swap dentro de una transacción para evitar condiciones de carrera
-    with transaction.atomic():
-        # volver a obtener el producto bloqueándolo
-        producto = Producto.objects.select_for_update().get(id=producto.id)
-
-        # Normalizar/reindexar órdenes para este proveedor para evitar duplicados/huecos
-        prods_for_provider = list(
-            Producto.objects.filter(proveedor_id=producto.proveedor_id).order_by('orden', 'id').select_for_update()
-        )
-        # Reasignar 1..N en memoria y hacer bulk_update sólo si hubo cambios
-        changed = False
-        for idx, p in enumerate(prods_for_provider, start=1):
-            if p.orden is None or int(p.orden) != idx:
-                p.orden = idx
-                changed = True
-        if changed:
-            Producto.objects.bulk_update(prods_for_provider, ['orden'])
-            # refrescar la instancia actual después del bulk_update
+    # Hacer el swap dentro de una transacción para evitar condiciones de carrera;
+    # si no hay vecino se lanza ValueError adentro, así se deshace un rebalanceo previo
+    try:
+        with registrar_escritura([producto.proveedor_id]) as escritura:
+            # volver a obtener el producto bloqueándolo
             producto = Producto.objects.select_for_update().get(id=producto.id)
+            cambiados = set()
+            if producto.orden is None:
+                cambiados.update(orden.rebalancear(producto.proveedor_id))
+                producto.refresh_from_db(fields=["orden"])
 
-        if payload.direccion == 'arriba':
-            neighbor_qs = Producto.objects.filter(
-                proveedor_id=producto.proveedor_id, orden__lt=producto.orden
-            ).exclude(id=producto.id).order_by('-orden')
-        else:
-            neighbor_qs = Producto.objects.filter(
-                proveedor_id=producto.proveedor_id, orden__gt=producto.orden
-            ).exclude(id=producto.id).order_by('orden')
+            # vecino por (orden, id), bloqueado también si existe
+            neighbor = orden.vecino(producto, arriba=payload.direccion == 'arriba')
+            if not neighbor:
+                raise ValueError("No hay producto para intercambiar en esa dirección")
+            if neighbor.orden == producto.orden:
+                # empate: intercambiar no cambiaría nada, separar primero
+                cambiados.update(orden.rebalancear(producto.proveedor_id))
+                producto.refresh_from_db(fields=["orden"])
+                neighbor.refresh_from_db(fields=["orden"])
 
-        # bloquear el vecino también si existe
-        neighbor = neighbor_qs.select_for_update().first()
+            before = {
+                "producto": {"id": producto.id, "orden": producto.orden},
+                "neighbor": {"id": neighbor.id, "orden": neighbor.orden},
+            }
 
-        if not neighbor:
-            return 400, {"message": "No hay producto para intercambiar en esa dirección"}
+            # intercambiar ordenes: sólo se escriben las dos filas
+            producto.orden, neighbor.orden = neighbor.orden, producto.orden
+            Producto.objects.bulk_update([producto, neighbor], ["orden"])
+            escritura.productos = Producto.objects.filter(id__in=cambiados | {producto.id, neighbor.id})
 
-        before = {
-            "producto": {"id": producto.id, "orden": producto.orden},
-            "neighbor": {"id": neighbor.id, "orden": neighbor.orden},
-        }
+            after = {
+                "producto": {"id": producto.id, "orden": producto.orden},
+                "neighbor": {"id": neighbor.id, "orden": neighbor.orden},
+            }
+    except ValueError as e:
+        return 400, {"message": str(e)}
 
-        # intercambiar ordenes de forma segura
-        prod_ord = producto.orden
-        producto.orden = neighbor.orden
-        neighbor.orden = prod_ord
-        producto.save()
-        neighbor.save()
+    return {"moved": producto.id, "swapped_with": neighbor.id, "before": before, "after": after}
 
-        after = {
-            "producto": {"id": producto.id, "orden": producto.orden},
-            "neighbor": {"id": neighbor.id, "orden": neighbor.orden},
-        }
 
-    return {"moved": producto.id, "swapped_with": neighbor.id, "before": before, "after": after}
-@producto_router.patch("/actualizar/{producto_id}/", response={200: ProductoSchema, 400: ErrorSchema})
-@require_manage_products()
+@producto_router.post("/mover/posicion/", response={200: dict, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_products(TiendaVia("producto", "payload", "producto_id"))
+def mover_producto_posicion(request, payload: MoverProductoPosicionSchema):
+    """Mueve un producto a cualquier lugar de su proveedor.
+
+    Se indica `despues_de` (id del producto que queda justo arriba) o `posicion`
+    (1 = primero), no ambos. Normalmente sólo se escribe el producto movido (ver
+    `producto.orden`).
+    """
+    if (payload.despues_de is None) == (payload.posicion is None):
+        return 400, {"message": "Indicar `despues_de` o `posicion` (sólo uno)"}
+    with registrar_escritura() as escritura:
+        producto = Producto.objects.select_for_update().get(id=payload.producto_id)
+        otros = Producto.objects.filter(proveedor_id=producto.proveedor_id).exclude(id=producto.id)
+        if payload.despues_de is not None:
+            anterior = otros.select_for_update().filter(id=payload.despues_de).first()
+            if anterior is None:
+                return 400, {"message": "`despues_de` no es otro producto del mismo proveedor"}
+        elif payload.posicion <= 1:
+            anterior = None
+        else:
+            # el producto que queda justo arriba de la posición pedida (o el último)
+            anterior = otros.order_by("orden", "id").select_for_update()[payload.posicion - 2:payload.posicion - 1].first()
+            if anterior is None:
+                anterior = otros.order_by("-orden", "-id").select_for_update().first()
+        cambiados = orden.mover_despues(producto, anterior)
+        escritura.productos = Producto.objects.filter(id__in=cambiados)
+        escritura.proveedores.add(producto.proveedor_id)
+    return {"moved": producto.id, "orden": producto.orden, "actualizados": len(cambiados)}
+
+
+@producto_router.put("/orden/{proveedor_id}/", response={200: dict, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_products(TiendaVia("proveedor", "proveedor_id"))
+def ordenar_productos(request, proveedor_id: int, payload: OrdenProductosSchema):
+    """Fija el orden completo de los productos de un proveedor.
+
+    `producto_ids` debe traer todos los productos del proveedor, cada uno una vez, en
+    el orden deseado. Se guarda con un único `bulk_update` de los que cambian.
+    """
+    try:
+        with registrar_escritura([proveedor_id]) as escritura:
+            cambiados = orden.aplicar(proveedor_id, payload.producto_ids)
+            escritura.productos = Producto.objects.filter(id__in=cambiados)
+    except ValueError as e:
+        return 400, {"message": str(e)}
+    return {"actualizados": len(cambiados)}
+@producto_router.patch("/actualizar/{producto_id}/", response={200: ProductoSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_products(TiendaVia("producto", "producto_id"))
 def actualizar_producto(request, producto_id: int, producto_in: ProductoUpdateSchema):
     """
     Actualiza un producto existente.
@@ -131,10 +260,11 @@ def actualizar_producto(request, producto_id: int, producto_in: ProductoUpdateSc
         if Producto.objects.filter(proveedor_id=producto.proveedor_id, nombre=producto_in.nombre).exclude(id=producto_id).exists():
             return 400, {"message": "Ya existe un producto con ese nombre para este proveedor."}
         producto.nombre = producto_in.nombre
-    producto.save()
+    with registrar_escritura([producto.proveedor_id], productos=Producto.objects.filter(pk=producto.pk)):
+        producto.save()
     return producto
 @producto_router.delete("/eliminar/{producto_id}/", response={200: dict, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_manage_products()
+@require_manage_products(TiendaVia("producto", "producto_id"))
 def eliminar_producto(request, producto_id: int):
     """
     Elimina un producto existente.
@@ -144,7 +274,14 @@ def eliminar_producto(request, producto_id: int):
     except Producto.DoesNotExist:
         return 404, {"message": "Producto no encontrado"}
     try:
-        producto.delete()
+        # lápidas del producto y de sus detalles, que se borran en cascada
+        with registrar_escritura(
+            [producto.proveedor_id],
+            productos=Producto.objects.filter(pk=producto.id),
+            detalles=DetalleCompra.objects.filter(producto_id=producto.id),
+            eliminado=True,
+        ):
+            producto.delete()
     except Exception as e:
         return 400, {"message": "Error al eliminar producto"}
     return {"mensaje": "Producto eliminado correctamente."}
\ No newline at end of file
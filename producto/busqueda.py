@@ -0,0 +1,86 @@
+"""Búsqueda de productos por nombre.
+
+En SQLite usa la tabla FTS5 `producto_fts` (migración `0006_producto_fts`), que los
+triggers mantienen al día en altas, renombres y bajas. El tokenizador ignora
+mayúsculas y acentos ("azucar" encuentra "Azúcar"), y cada palabra buscada se
+toma como prefijo ("azu mor" encuentra "Azúcar morena"). Los prefijos de 2 y 3
+letras tienen índice propio.
+
+Si una migración futura reconstruye la tabla `producto` (SQLite copia la tabla
+para algunos ALTER), los triggers se pierden: esa migración debe volver a crearlos
+y reconstruir el índice (`INSERT INTO producto_fts(producto_fts) VALUES ('rebuild')`).
+
+En otros backends se cae a `icontains`, sin índice y sensible a acentos.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F
+
+from producto.models import Producto
+
+
+# Resultados por búsqueda: por defecto y máximo que se acepta
+LIMITE = 20
+LIMITE_MAXIMO = 100
+
+CAMPOS = ("id", "nombre", "proveedor_id", "orden", "proveedor_nombre", "tienda_id")
+
+_PALABRA = re.compile(r"\w+")
+
+
+def _consulta_fts(palabras: list[str], al_inicio: bool = False) -> str:
+    # cada palabra como prefijo entre comillas: los operadores de FTS5 quedan como texto;
+    # `^` exige que la primera esté al principio del nombre
+    consulta = " ".join(f'"{palabra}"*' for palabra in palabras)
+    return f"^{consulta}" if al_inicio else consulta
+
+
+def _buscar_fts(consulta: str, tiendas: list | None, limite: int) -> list[dict]:
+    filtro, params = "", [consulta]
+    if tiendas is not None:
+        filtro = f"AND pr.tienda_id IN ({', '.join(['%s'] * len(tiendas))})"
+        params.extend(tiendas)
+    params.append(limite)
+    with connection.cursor() as cursor:
+        # sin ORDER BY: FTS5 entrega las coincidencias en orden y el LIMIT corta
+        # enseguida (ordenar por `rank` obliga a puntuar todas)
+        cursor.execute(
+            "SELECT p.id, p.nombre, p.proveedor_id, p.orden, pr.nombre, pr.tienda_id "
+            "FROM producto_fts f "
+            "INNER JOIN producto p ON p.id = f.rowid "
+            "INNER JOIN proveedor pr ON pr.id = p.proveedor_id "
+            f"WHERE producto_fts MATCH %s {filtro} "
+            "LIMIT %s",
+            params,
+        )
+        return [dict(zip(CAMPOS, row)) for row in cursor.fetchall()]
+
+
+def buscar(texto: str, tiendas: list | None = None, limite: int = LIMITE) -> list[dict]:
+    """Productos cuyo nombre tiene palabras que empiezan con las de `texto`.
+
+    `tiendas` limita el resultado (como `get_allowed_tiendas`: `None` es sin límite).
+    Primero vienen los nombres que empiezan con la primera palabra buscada y luego
+    el resto; a lo sumo dos consultas, cada una cortada en `limite`.
+    """
+    palabras = _PALABRA.findall(texto)
+    if not palabras or tiendas == []:
+        return []
+    if connection.vendor != "sqlite":
+        qs = Producto.objects.filter(nombre__icontains=texto.strip())
+        if tiendas is not None:
+            qs = qs.filter(proveedor__tienda_id__in=tiendas)
+        return list(
+            qs.order_by("nombre", "id").values(
+                "id", "nombre", "proveedor_id", "orden", proveedor_nombre=F("proveedor__nombre"),
+                tienda_id=F("proveedor__tienda_id"),
+            )[:limite]
+        )
+
+    resultado = _buscar_fts(_consulta_fts(palabras, al_inicio=True), tiendas, limite)
+    if len(resultado) < limite:
+        vistos = {fila["id"] for fila in resultado}
+        resto = _buscar_fts(_consulta_fts(palabras), tiendas, limite + len(resultado))
+        resultado.extend(fila for fila in resto if fila["id"] not in vistos)
+    return resultado[:limite]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producto', '0003_producto_orden'),
+        ('proveedor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['proveedor', 'orden'], name='producto_proveedor_orden_idx'),
+        ),
+    ]
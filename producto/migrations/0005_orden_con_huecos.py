@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# mismo valor que `producto.orden.PASO` al crear esta migración
+PASO = 1024
+
+
+def espaciar_orden(apps, schema_editor):
+    # Renumerar cada proveedor de a PASO, conservando el orden actual (orden, id)
+    Producto = apps.get_model('producto', 'Producto')
+    cambiados = []
+    proveedor_id, i = None, 0
+    for producto in Producto.objects.order_by('proveedor_id', 'orden', 'id').only('id', 'proveedor_id', 'orden').iterator():
+        if producto.proveedor_id != proveedor_id:
+            proveedor_id, i = producto.proveedor_id, 0
+        i += 1
+        if producto.orden != i * PASO:
+            producto.orden = i * PASO
+            cambiados.append(producto)
+    Producto.objects.bulk_update(cambiados, ['orden'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producto', '0004_producto_proveedor_orden_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(espaciar_orden, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Índice FTS5 de `producto.nombre` (ver `producto.busqueda`), sólo en SQLite.
+# Tabla de contenido externo: guarda el índice, no una copia de los nombres, y los
+# triggers lo mantienen al día ante cualquier INSERT/UPDATE/DELETE sobre `producto`
+# (incluidos `bulk_create`, `bulk_update` y los borrados en cascada).
+CREAR = [
+    "CREATE VIRTUAL TABLE producto_fts USING fts5("
+    "nombre, content='producto', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER producto_fts_ai AFTER INSERT ON producto BEGIN "
+    "INSERT INTO producto_fts(rowid, nombre) VALUES (new.id, new.nombre); END",
+    "CREATE TRIGGER producto_fts_ad AFTER DELETE ON producto BEGIN "
+    "INSERT INTO producto_fts(producto_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre); END",
+    "CREATE TRIGGER producto_fts_au AFTER UPDATE OF nombre ON producto BEGIN "
+    "INSERT INTO producto_fts(producto_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre); "
+    "INSERT INTO producto_fts(rowid, nombre) VALUES (new.id, new.nombre); END",
+    # indexar los productos existentes
+    "INSERT INTO producto_fts(producto_fts) VALUES ('rebuild')",
+]
+
+BORRAR = [
+    "DROP TRIGGER IF EXISTS producto_fts_au",
+    "DROP TRIGGER IF EXISTS producto_fts_ad",
+    "DROP TRIGGER IF EXISTS producto_fts_ai",
+    "DROP TABLE IF EXISTS producto_fts",
+]
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in CREAR:
+            schema_editor.execute(sql)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in BORRAR:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producto', '0005_orden_con_huecos'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
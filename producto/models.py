@@ -10,6 +10,10 @@ class Producto(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["proveedor", "nombre"], name="unique_producto_por_proveedor"),
         ]
+        indexes = [
+            # listados ordenados y paginación por keyset dentro de un proveedor
+            models.Index(fields=["proveedor", "orden"], name="producto_proveedor_orden_idx"),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -0,0 +1,119 @@
+"""`orden` de los productos de un proveedor, con huecos entre valores.
+
+Los productos se numeran de a `PASO` (1024, 2048, ...). Mover un producto le asigna
+un valor entre el de sus nuevos vecinos, así que se escribe una sola fila. Cuando
+entre dos vecinos ya no queda hueco, se renumera el proveedor completo
+(`rebalancear`). Eso pasa recién después de unos log2(PASO) movimientos seguidos al
+mismo lugar.
+
+Los empates de `orden` se desempatan por `id`, igual que en los listados.
+"""
+from django.db.models import Max, Q
+
+from producto.models import Producto
+from proveedor.models import Proveedor
+
+
+PASO = 1024
+
+
+def siguiente(proveedor_id: int) -> int:
+    """`orden` para un producto nuevo, al final de su proveedor."""
+    maximo = Producto.objects.filter(proveedor_id=proveedor_id).aggregate(maximo=Max("orden"))["maximo"]
+    return (maximo or 0) + PASO
+
+
+def reservar(proveedor_id: int, cantidad: int) -> list[int]:
+    """`cantidad` valores de `orden` consecutivos (de a `PASO`) al final del proveedor.
+
+    Bloquea la fila del proveedor hasta el fin de la transacción, para que dos altas
+    concurrentes no reciban el mismo bloque (SQLite ya serializa las escrituras).
+    Debe llamarse dentro de una transacción.
+    """
+    list(Proveedor.objects.select_for_update().filter(id=proveedor_id).values_list("id"))
+    base = siguiente(proveedor_id)
+    return [base + i * PASO for i in range(cantidad)]
+
+
+def rebalancear(proveedor_id: int) -> list[int]:
+    """Renumera los productos del proveedor de a `PASO`, sin cambiar su orden.
+
+    Devuelve los ids de los productos que cambiaron. Debe llamarse dentro de una transacción.
+    """
+    productos = list(
+        Producto.objects.filter(proveedor_id=proveedor_id).order_by("orden", "id").select_for_update().only("id", "orden")
+    )
+    cambiados = []
+    for i, producto in enumerate(productos, start=1):
+        if producto.orden != i * PASO:
+            producto.orden = i * PASO
+            cambiados.append(producto)
+    Producto.objects.bulk_update(cambiados, ["orden"])
+    return [p.id for p in cambiados]
+
+
+def _despues(proveedor_id: int, anterior, excluir: int):
+    """Primer producto del proveedor posterior a `anterior` (o el primero si es `None`)."""
+    qs = Producto.objects.filter(proveedor_id=proveedor_id).exclude(id=excluir)
+    if anterior is not None:
+        qs = qs.filter(Q(orden__gt=anterior.orden) | Q(orden=anterior.orden, id__gt=anterior.id))
+    return qs.order_by("orden", "id").select_for_update().only("id", "orden").first()
+
+
+def mover_despues(producto: Producto, anterior: Producto | None) -> list[int]:
+    """Ubica `producto` inmediatamente después de `anterior` (al principio si es `None`).
+
+    Escribe sólo `producto`, salvo que no quede hueco entre los vecinos; en ese caso
+    rebalancea antes. Devuelve los ids de los productos cuyo `orden` cambió. Debe
+    llamarse dentro de una transacción.
+    """
+    cambiados = set()
+    if anterior is not None and anterior.orden is None:
+        # productos sin `orden`: numerarlos antes de buscar vecinos
+        cambiados.update(rebalancear(producto.proveedor_id))
+        anterior.refresh_from_db(fields=["orden"])
+    for _ in range(2):
+        posterior = _despues(producto.proveedor_id, anterior, producto.id)
+        inferior = anterior.orden if anterior is not None else 0
+        superior = posterior.orden if posterior is not None else inferior + 2 * PASO
+        if superior is not None and superior - inferior >= 2:
+            producto.orden = (inferior + superior) // 2
+            Producto.objects.filter(id=producto.id).update(orden=producto.orden)
+            cambiados.add(producto.id)
+            return sorted(cambiados)
+        cambiados.update(rebalancear(producto.proveedor_id))
+        if anterior is not None:
+            anterior.refresh_from_db(fields=["orden"])
+    raise RuntimeError("No se pudo ubicar el producto después de rebalancear")
+
+
+def vecino(producto: Producto, arriba: bool):
+    """Producto inmediatamente anterior (`arriba`) o posterior al indicado, bloqueado."""
+    qs = Producto.objects.filter(proveedor_id=producto.proveedor_id).exclude(id=producto.id)
+    if arriba:
+        qs = qs.filter(Q(orden__lt=producto.orden) | Q(orden=producto.orden, id__lt=producto.id)).order_by("-orden", "-id")
+    else:
+        qs = qs.filter(Q(orden__gt=producto.orden) | Q(orden=producto.orden, id__gt=producto.id)).order_by("orden", "id")
+    return qs.select_for_update().first()
+
+
+def aplicar(proveedor_id: int, producto_ids: list[int]) -> list[int]:
+    """Fija el orden completo del proveedor: `producto_ids` debe tener todos sus productos.
+
+    Asigna `PASO`, `2 * PASO`, ... con un único `bulk_update` de las filas que cambian
+    y devuelve sus ids. Lanza `ValueError` si la lista no es una permutación de los
+    productos del proveedor. Debe llamarse dentro de una transacción.
+    """
+    productos = {p.id: p for p in Producto.objects.filter(proveedor_id=proveedor_id).select_for_update().only("id", "orden")}
+    if len(producto_ids) != len(set(producto_ids)):
+        raise ValueError("La lista tiene productos repetidos")
+    if set(producto_ids) != productos.keys():
+        raise ValueError("La lista debe tener exactamente los productos del proveedor")
+    cambiados = []
+    for i, producto_id in enumerate(producto_ids, start=1):
+        producto = productos[producto_id]
+        if producto.orden != i * PASO:
+            producto.orden = i * PASO
+            cambiados.append(producto)
+    Producto.objects.bulk_update(cambiados, ["orden"])
+    return [p.id for p in cambiados]
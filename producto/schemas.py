@@ -1,12 +1,30 @@
 from ninja import Schema, ModelSchema
 from producto.models import Producto
-from typing import Optional, Literal
+from typing import Optional, Literal, Union
+from datetime import date
 
 class ProductoSchema(ModelSchema):
     class Meta:
         model = Producto
         fields = '__all__'
 
+class StockProductoSchema(Schema):
+    fecha_inventario: Optional[date] = None
+    # "?" si el usuario no puede ver inventarios en la tienda
+    inventario: Optional[Union[int, str]] = None
+    fecha_ultima_compra: Optional[date] = None
+    cantidad_ultima_compra: Optional[int] = None
+
+class ProductoConStockSchema(ProductoSchema):
+    stock: Optional[StockProductoSchema] = None
+
+    @staticmethod
+    def resolve_stock(obj):
+        # sólo si se cargó con select_related('stock'): nunca una consulta por producto
+        if not Producto.stock.is_cached(obj):
+            return None
+        return getattr(obj, 'stock', None)
+
 class ProductoInSchema(Schema):
     nombre: str
     proveedor_id: int
@@ -19,4 +37,32 @@ class ProductoUpdateSchema(Schema):
 class MoverProductoSchema(Schema):
     producto_id: int
     direccion: Literal['arriba', 'abajo']
-    
\ No newline at end of file
+    
+class MoverProductoPosicionSchema(Schema):
+    producto_id: int
+    # id del producto que queda justo arriba
+    despues_de: Optional[int] = None
+    # 1 = primero
+    posicion: Optional[int] = None
+
+class OrdenProductosSchema(Schema):
+    producto_ids: list[int]
+
+class ProductoLoteInSchema(Schema):
+    proveedor_id: int
+    nombres: list[str]
+
+class ProductoLoteResultadoSchema(Schema):
+    creados: list[ProductoSchema]
+    # nombres que ya existían en el proveedor (o repetidos en la lista)
+    existentes: list[str]
+    # nombres vacíos o demasiado largos
+    invalidos: list[str]
+
+class ProductoBusquedaSchema(Schema):
+    id: int
+    nombre: str
+    proveedor_id: int
+    orden: Optional[int] = None
+    proveedor_nombre: str
+    tienda_id: int
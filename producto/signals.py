@@ -1,24 +1,43 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from producto.models import Producto
-from compra.models import Compra, DetalleCompra
+from compra.models import DetalleCompra
+
+logger = logging.getLogger(__name__)
+
+
+def _fanout_en_segundo_plano(proveedor_id: int, producto_id: int):
+    try:
+        DetalleCompra.objects.completar_vacios(proveedor_id=proveedor_id, producto_ids=[producto_id])
+    except Exception:
+        # `manage.py completar_detalles` repara cualquier hueco que quede
+        logger.exception("Fan-out diferido fallido para producto_id=%s", producto_id)
+    finally:
+        connections.close_all()
+
 
 @receiver(post_save, sender=Producto)
 def crear_detalle_en_compras(sender, instance, created, **kwargs):
     """Al crear un Producto, crear un DetalleCompra (cantidad=0, inventario_anterior=0)
     para todas las compras existentes si no existe ya un detalle para esa compra y producto.
+
+    Se hace con un único INSERT ... SELECT. Con `PRODUCTO_FANOUT_DIFERIDO = True` el
+    insert se ejecuta en segundo plano tras el commit, para historiales muy grandes.
     """
     if not created:
         return
 
-    # sólo considerar compras del mismo proveedor del producto
-    compras = Compra.objects.filter(proveedor_id=instance.proveedor_id)
-    detalles_to_create = []
-    for compra in compras:
-        # evitar duplicados
-        if DetalleCompra.objects.filter(compra=compra, producto=instance).exists():
-            continue
-        detalles_to_create.append(DetalleCompra(compra=compra, producto=instance, cantidad=0, inventario_anterior=0))
-
-    if detalles_to_create:
-        DetalleCompra.objects.bulk_create(detalles_to_create)
+    if getattr(settings, "PRODUCTO_FANOUT_DIFERIDO", False):
+        transaction.on_commit(
+            lambda: threading.Thread(
+                target=_fanout_en_segundo_plano, args=(instance.proveedor_id, instance.id), daemon=True
+            ).start()
+        )
+        return
+
+    DetalleCompra.objects.completar_vacios(proveedor_id=instance.proveedor_id, producto_ids=[instance.id])
@@ -1,3 +1,299 @@
-from django.test import TestCase
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from compra.models import Compra, DetalleCompra
+from core.pagination import NEXT_CURSOR_HEADER
+from core.testing import ApiTestCase
+from producto import orden, signals
+from producto.api import MAX_PRODUCTOS_LOTE
+from producto.models import Producto
+from proveedor.models import Proveedor
+from tienda.models import Tienda
+
+
+class ProductoApiTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tienda = Tienda.objects.create(nombre="Tienda")
+        self.crear_usuario("admin", superusuario=True)
+        self.token = self.login("admin")
+
+    def _proveedor(self, n_compras=0, nombre="P"):
+        proveedor = Proveedor.objects.create(nombre=nombre, tienda=self.tienda)
+        Compra.objects.bulk_create(
+            Compra(proveedor=proveedor, fecha_compra=f"2026-{1 + i // 28:02d}-{1 + i % 28:02d}") for i in range(n_compras)
+        )
+        return proveedor
+
+    def _post(self, url, data):
+        respuesta = self.api("post", url, data)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+
+class FanoutTests(ProductoApiTestCase):
+    def _crear(self, proveedor, nombre="a"):
+        with CaptureQueriesContext(connection) as consultas:
+            producto = self._post("/producto/crear/", {"nombre": nombre, "proveedor_id": proveedor.id})
+        return producto, len(consultas)
+
+    def test_consultas_no_dependen_de_las_compras(self):
+        self._crear(self._proveedor(1, "Calienta"))  # sesión y permisos
+        _, consultas_corto = self._crear(self._proveedor(2, "Corto"))
+        producto, consultas_largo = self._crear(self._proveedor(60, "Largo"))
+
+        self.assertEqual(consultas_corto, consultas_largo)
+        detalles = DetalleCompra.objects.filter(producto_id=producto["id"])
+        self.assertEqual(detalles.count(), 60)
+        self.assertEqual(set(detalles.values_list("cantidad", "inventario_anterior")), {(0, 0)})
+
+    def test_pares_existentes_se_saltan(self):
+        proveedor = self._proveedor(3)
+        producto = Producto.objects.create(nombre="a", proveedor=proveedor, orden=1024)
+        detalle = DetalleCompra.objects.filter(producto=producto).first()
+        DetalleCompra.objects.filter(id=detalle.id).update(cantidad=5, inventario_anterior=2)
+        DetalleCompra.objects.exclude(id=detalle.id).delete()
+
+        self.assertEqual(DetalleCompra.objects.completar_vacios(proveedor_id=proveedor.id), 2)
+        self.assertEqual(DetalleCompra.objects.completar_vacios(proveedor_id=proveedor.id), 0)
+        detalle.refresh_from_db()
+        self.assertEqual((detalle.cantidad, detalle.inventario_anterior), (5, 2))
+
+    @override_settings(PRODUCTO_FANOUT_DIFERIDO=True)
+    def test_fanout_diferido(self):
+        proveedor = self._proveedor(3)
+        with mock.patch.object(signals.threading, "Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                producto, _ = self._crear(proveedor)
+            # dentro de la petición no se crea ningún detalle: sólo se lanza el hilo al confirmar
+            self.assertFalse(DetalleCompra.objects.filter(producto_id=producto["id"]).exists())
+        thread.assert_called_once_with(
+            target=signals._fanout_en_segundo_plano, args=(proveedor.id, producto["id"]), daemon=True
+        )
+        thread.return_value.start.assert_called_once_with()
+
+        # el hilo cierra sus conexiones al terminar; aquí correría sobre la de la prueba
+        with mock.patch.object(signals.connections, "close_all"):
+            signals._fanout_en_segundo_plano(proveedor.id, producto["id"])
+        self.assertEqual(DetalleCompra.objects.filter(producto_id=producto["id"]).count(), 3)
+
+
+class ListarPaginadoTests(ProductoApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proveedor = self._proveedor()
+        # mismo `orden` en dos productos: el id desempata
+        Producto.objects.bulk_create(
+            Producto(nombre=nombre, proveedor=self.proveedor, orden=orden)
+            for nombre, orden in (("c", 3072), ("a", 1024), ("b", 2048), ("b2", 2048))
+        )
+        self.url = f"/producto/listar/{self.proveedor.id}/"
+
+    def _listar(self, query=""):
+        respuesta = self.api("get", f"{self.url}?{query}")
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return [p["nombre"] for p in respuesta.json()], respuesta.get(NEXT_CURSOR_HEADER)
+
+    def test_sin_limit_devuelve_todo(self):
+        self.assertEqual(self._listar(), (["a", "b", "b2", "c"], None))
+
+    def test_paginas_por_orden_e_id(self):
+        nombres, siguiente = self._listar("limit=3")
+        self.assertEqual(nombres, ["a", "b", "b2"])
+        self.assertEqual(self._listar(f"limit=3&cursor={siguiente}"), (["c"], None))
+        # sólo `cursor`: el tamaño de página por defecto
+        self.assertEqual(self._listar(f"cursor={siguiente}")[0], ["c"])
+
+    def test_limit_cero_o_negativo(self):
+        self.assertEqual(self._listar("limit=0"), ([], None))
+        self.assertEqual(self._listar("limit=-1"), ([], None))
+
+
+class OrdenTests(ProductoApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proveedor = self._proveedor()
+        creados = self._post("/producto/crear/lote/", {"proveedor_id": self.proveedor.id, "nombres": list("abcde")})["creados"]
+        self.ids = {p["nombre"]: p["id"] for p in creados}
+
+    def _nombres(self):
+        return "".join(Producto.objects.filter(proveedor=self.proveedor).order_by("orden", "id").values_list("nombre", flat=True))
+
+    def _ordenes(self):
+        return dict(Producto.objects.filter(proveedor=self.proveedor).values_list("nombre", "orden"))
+
+    def _mover(self, nombre, **destino):
+        return self.api("post", "/producto/mover/posicion/", {"producto_id": self.ids[nombre], **destino})
+
+    def test_mover_escribe_una_sola_fila(self):
+        self.assertEqual(self._ordenes(), {n: (i + 1) * orden.PASO for i, n in enumerate("abcde")})
+        antes = self._ordenes()
+        respuesta = self._mover("e", posicion=2)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()["actualizados"], 1)
+        self.assertEqual(self._nombres(), "aebcd")
+        despues = self._ordenes()
+        self.assertEqual({n for n in antes if antes[n] != despues[n]}, {"e"})
+
+        self.assertEqual(self._mover("a", despues_de=self.ids["c"]).json()["actualizados"], 1)
+        self.assertEqual(self._nombres(), "ebcad")
+        self._mover("d", posicion=1)
+        self._mover("b", posicion=99)
+        self.assertEqual(self._nombres(), "decab")
+
+    def test_sin_hueco_rebalancea(self):
+        # siempre al mismo hueco: se agota tras unos log2(PASO) movimientos
+        actualizados = []
+        for _ in range(6):
+            for nombre in "edc":
+                actualizados.append(self._mover(nombre, despues_de=self.ids["a"]).json()["actualizados"])
+        self.assertEqual(self._nombres(), "acdeb")
+        self.assertTrue(any(n > 1 for n in actualizados))
+        self.assertEqual(len(set(self._ordenes().values())), 5)
+
+    def test_destino_invalido(self):
+        self.assertEqual(self._mover("a", posicion=2, despues_de=self.ids["b"]).status_code, 400)
+        self.assertEqual(self._mover("a").status_code, 400)
+        self.assertEqual(self._mover("a", despues_de=self.ids["a"]).status_code, 400)
+        otro = Producto.objects.create(nombre="x", proveedor=self._proveedor(nombre="Otro"), orden=1024)
+        self.assertEqual(self._mover("a", despues_de=otro.id).status_code, 400)
+        self.assertEqual(self._nombres(), "abcde")
+
+    def test_intercambio_con_el_vecino(self):
+        respuesta = self.api("post", "/producto/mover/", {"producto_id": self.ids["c"], "direccion": "arriba"})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()["swapped_with"], self.ids["b"])
+        self.assertEqual(self._nombres(), "acbde")
+        # empate de `orden`: se separan antes de intercambiar
+        Producto.objects.filter(id=self.ids["e"]).update(orden=self._ordenes()["d"])
+        self.api("post", "/producto/mover/", {"producto_id": self.ids["e"], "direccion": "arriba"})
+        self.assertEqual(self._nombres(), "acbed")
+        respuesta = self.api("post", "/producto/mover/", {"producto_id": self.ids["a"], "direccion": "arriba"})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_orden_completo(self):
+        url = f"/producto/orden/{self.proveedor.id}/"
+        respuesta = self.api("put", url, {"producto_ids": [self.ids[n] for n in "edcba"]})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        # "c" ya estaba en la tercera posición: no se escribe
+        self.assertEqual(respuesta.json()["actualizados"], 4)
+        self.assertEqual(self._nombres(), "edcba")
+
+        for producto_ids in ([self.ids[n] for n in "edcb"], [self.ids[n] for n in "edcbaa"]):
+            self.assertEqual(self.api("put", url, {"producto_ids": producto_ids}).status_code, 400)
+        self.assertEqual(self._nombres(), "edcba")
+
+
+class CrearLoteTests(ProductoApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proveedor = self._proveedor(n_compras=2)
+        Producto.objects.create(nombre="existente", proveedor=self.proveedor, orden=5000)
+
+    def _lote(self, nombres, token=None):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.api("post", "/producto/crear/lote/", {"proveedor_id": self.proveedor.id, "nombres": nombres}, token)
+        return respuesta, len(consultas)
+
+    def test_existentes_invalidos_y_orden_contiguo(self):
+        respuesta, _ = self._lote(["b", " existente ", "a", "b", "", "x" * 101, " c "])
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        datos = respuesta.json()
+        self.assertEqual([p["nombre"] for p in datos["creados"]], ["b", "a", "c"])
+        self.assertEqual(datos["existentes"], ["b", "existente"])
+        self.assertEqual(datos["invalidos"], ["", "x" * 101])
+        # bloque contiguo después del último `orden` del proveedor
+        self.assertEqual([p["orden"] for p in datos["creados"]], [5000 + i * orden.PASO for i in (1, 2, 3)])
+        detalles = DetalleCompra.objects.filter(producto_id__in=[p["id"] for p in datos["creados"]])
+        self.assertEqual(detalles.count(), 6)
+        self.assertEqual(set(detalles.values_list("cantidad", "inventario_anterior")), {(0, 0)})
+
+    def test_consultas_no_dependen_de_la_cantidad(self):
+        self._lote(["calienta"])  # sesión y permisos
+        _, pocos = self._lote([f"p{i}" for i in range(3)])
+        respuesta, muchos = self._lote([f"q{i}" for i in range(60)])
+        self.assertEqual(len(respuesta.json()["creados"]), 60)
+        self.assertEqual(pocos, muchos)
+
+    def test_nada_que_crear_y_limites(self):
+        respuesta, _ = self._lote(["existente", ""])
+        self.assertEqual(respuesta.json(), {"creados": [], "existentes": ["existente"], "invalidos": [""]})
+
+        respuesta, _ = self._lote([f"p{i}" for i in range(MAX_PRODUCTOS_LOTE + 1)])
+        self.assertEqual(respuesta.status_code, 400)
+        self.crear_usuario("sin_productos", tiendas=[self.tienda], puede_gestionar_productos=False)
+        respuesta, _ = self._lote(["nuevo"], self.login("sin_productos"))
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertEqual(Producto.objects.filter(proveedor=self.proveedor).count(), 1)
+
+    def test_un_producto_reserva_el_mismo_bloque(self):
+        producto = self._post("/producto/crear/", {"nombre": "solo", "proveedor_id": self.proveedor.id})
+        self.assertEqual(producto["orden"], 5000 + orden.PASO)
+        creados = self._lote(["d"])[0].json()["creados"]
+        self.assertEqual(creados[0]["orden"], 5000 + 2 * orden.PASO)
+
+
+class BusquedaTests(ProductoApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.proveedor = self._proveedor()
+        self.ajena = Tienda.objects.create(nombre="Ajena")
+        nombres = ["Azúcar morena", "Harina", "Mermelada sin azúcar", "Azúcar blanca", "Sal marina"]
+        self.ids = {
+            p["nombre"]: p["id"]
+            for p in self._post("/producto/crear/lote/", {"proveedor_id": self.proveedor.id, "nombres": nombres})["creados"]
+        }
+        proveedor_ajeno = Proveedor.objects.create(nombre="Q", tienda=self.ajena)
+        self.ajeno = Producto.objects.create(nombre="Azúcar impalpable", proveedor=proveedor_ajeno, orden=1024)
+
+    def _buscar(self, q, token=None, **params):
+        respuesta = self.api("get", f"/producto/buscar/?{urlencode({'q': q, **params})}", token=token)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return [p["nombre"] for p in respuesta.json()]
+
+    def test_prefijos_sin_acentos_ni_mayusculas(self):
+        # primero los que empiezan con lo buscado
+        self.assertEqual(self._buscar("azu", tienda_id=self.tienda.id), ["Azúcar morena", "Azúcar blanca", "Mermelada sin azúcar"])
+        self.assertEqual(self._buscar("AZUCAR mor"), ["Azúcar morena"])
+        self.assertEqual(self._buscar("mar"), ["Sal marina"])
+        self.assertEqual(self._buscar("har", limit=1), ["Harina"])
+        self.assertEqual(self._buscar("zucar"), [])
+
+    def test_resultado(self):
+        [fila] = self.api("get", "/producto/buscar/?q=harina").json()
+        self.assertEqual(fila, {
+            "id": self.ids["Harina"], "nombre": "Harina", "proveedor_id": self.proveedor.id,
+            "orden": 2 * orden.PASO, "proveedor_nombre": "P", "tienda_id": self.tienda.id,
+        })
+
+    def test_indice_al_dia_en_altas_renombres_y_bajas(self):
+        self._post("/producto/crear/", {"nombre": "Arroz integral", "proveedor_id": self.proveedor.id})
+        self.assertEqual(self._buscar("integ"), ["Arroz integral"])
+
+        respuesta = self.api("patch", f"/producto/actualizar/{self.ids['Harina']}/", {"nombre": "Harina leudante"})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(self._buscar("leud"), ["Harina leudante"])
+        Producto.objects.filter(id=self.ids["Sal marina"]).update(nombre="Sal fina")
+        self.assertEqual(self._buscar("marina"), [])
+
+        self.api("delete", f"/producto/eliminar/{self.ids['Harina']}/")
+        self.assertEqual(self._buscar("harina"), [])
+
+    def test_tiendas_permitidas(self):
+        self.assertEqual(len(self._buscar("azucar")), 4)
+        self.crear_usuario("limitado", tiendas=[self.tienda])
+        limitado = self.login("limitado")
+        self.assertNotIn("Azúcar impalpable", self._buscar("azucar", limitado))
+        self.assertEqual(self._buscar("azucar", limitado, tienda_id=self.ajena.id), [])
+        self.assertEqual(self._buscar("azucar", tienda_id=self.ajena.id), ["Azúcar impalpable"])
+        self.assertEqual(self.client.get("/api/producto/buscar/?q=azucar").status_code, 401)
+
+    def test_operadores_como_texto(self):
+        self.assertEqual(self._buscar('sal" OR harina'), [])
+        self.assertEqual(self._buscar("NEAR(sal"), [])
+        self.assertEqual(self._buscar("sal* -mar"), ["Sal marina"])
+        self.assertEqual(self._buscar("***"), [])
@@ -1,27 +1,80 @@
 from ninja import Router
 from proveedor.models import Proveedor
-from proveedor.schemas import ProveedorSchema, ProveedorInSchema, ProveedorUpdateSchema
-from usuario.permisions import require_manage_providers, _get_user_from_request, get_allowed_tiendas
+from proveedor.schemas import ProveedorSchema, ProveedorConResumenSchema, ProveedorInSchema, ProveedorUpdateSchema, ClonarCatalogoSchema, ClonarCatalogoResultadoSchema
+from proveedor import catalogo
+from usuario.permisions import require_manage_providers, get_permission_context, TiendaVia
 from core.schemas import ErrorSchema
+from core.pagination import paginate_optional
+from core import versiones
+from core.versiones import etag_por_version
+from compra.escrituras import registrar_escritura
+from compra.models import Compra, DetalleCompra
+from producto.models import Producto
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from typing import Optional
 from tienda.models import Tienda
 from ninja.errors import HttpError
 
 proveedor_router = Router(tags=["Proveedores"])
-@proveedor_router.get("/listar/{tienda_id}/", response=list[ProveedorSchema])
-def listar_proveedores(request, tienda_id: int):
+
+
+def _con_resumen(proveedores):
+    """Anota cada proveedor con totales y su última compra, con subconsultas en la misma sentencia."""
+    def contar(qs):
+        return Coalesce(Subquery(qs.order_by().values("proveedor_id").annotate(n=Count("id")).values("n")), 0)
+
+    compras = Compra.objects.filter(proveedor_id=OuterRef("pk"))
+    # última compra por el índice único (proveedor, fecha_compra)
+    ultima = compras.order_by("-fecha_compra")
+    ultima_id = Compra.objects.filter(proveedor_id=OuterRef(OuterRef("pk"))).order_by("-fecha_compra").values("id")[:1]
+    cantidad = (
+        DetalleCompra.objects.filter(compra_id=Subquery(ultima_id))
+        .order_by()
+        .values("compra_id")
+        .annotate(total=Sum("cantidad"))
+        .values("total")
+    )
+    return proveedores.annotate(
+        total_productos=contar(Producto.objects.filter(proveedor_id=OuterRef("pk"))),
+        total_compras=contar(compras),
+        ultima_compra_fecha=Subquery(ultima.values("fecha_compra")[:1]),
+        ultima_compra_cantidad=Subquery(cantidad, output_field=IntegerField()),
+    )
+
+
+def _versiones_resumen(kwargs) -> str:
+    # con resumen, la respuesta cambia con cualquier escritura sobre los proveedores de
+    # la tienda: una versión por tienda, así el 304 no consulta la base
+    if not kwargs.get("con_resumen"):
+        return ""
+    return str(versiones.get_version("datos_tienda", kwargs["tienda_id"]))
+
+
+@proveedor_router.get("/listar/{tienda_id}/", response=list[ProveedorConResumenSchema])
+@etag_por_version("tienda", "tienda_id", extra=_versiones_resumen)
+def listar_proveedores(request, response: HttpResponse, tienda_id: int, limit: Optional[int] = None, cursor: Optional[str] = None, con_resumen: bool = False):
     """
     Lista todos los proveedores de una tienda específica.
+
+    Con `limit` y/o `cursor` pagina por keyset; ver cabeceras `X-Next-Cursor` / `X-Prev-Cursor`.
+    Con `con_resumen=true` cada proveedor trae `total_productos`, `total_compras`,
+    `ultima_compra_fecha` y `ultima_compra_cantidad`, calculados en la misma consulta.
+    Soporta GET condicional (`ETag` / `If-None-Match`) por versión de la tienda (y, con
+    resumen, de los datos de sus proveedores).
     """
     # Filtrar por tiendas permitidas del usuario
-    user = _get_user_from_request(request)
-    allowed = get_allowed_tiendas(user)
+    allowed = get_permission_context(request).get_allowed_tiendas()
     if allowed is not None and tienda_id not in allowed:
         return []
     proveedores = Proveedor.objects.filter(tienda_id=tienda_id)
-    return proveedores
+    if con_resumen:
+        proveedores = _con_resumen(proveedores)
+    return paginate_optional(proveedores, ("id",), response, limit, cursor)
 
 @proveedor_router.post("/crear/", response={200: ProveedorSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema})
-@require_manage_providers()
+@require_manage_providers(TiendaVia("tienda", "proveedor_in", "tienda_id"))
 def crear_proveedor(request, proveedor_in: ProveedorInSchema):
     """
     Crea un nuevo proveedor asociado a una tienda.
@@ -35,10 +88,11 @@ def crear_proveedor(request, proveedor_in: ProveedorInSchema):
         nombre=proveedor_in.nombre,
         tienda=tienda
     )
+    versiones.bump("tienda", tienda.id)
     return proveedor
 
 @proveedor_router.patch("/actualizar/{proveedor_id}/", response={200: ProveedorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_manage_providers()
+@require_manage_providers(TiendaVia("proveedor", "proveedor_id"))
 def actualizar_proveedor(request, proveedor_id: int, proveedor_in: ProveedorUpdateSchema):
     """
     Actualiza un proveedor existente.
@@ -47,14 +101,53 @@ def actualizar_proveedor(request, proveedor_id: int, proveedor_in: ProveedorUpda
     if proveedor_in.nombre:
         proveedor.nombre = proveedor_in.nombre
     proveedor.save()
+    versiones.bump("tienda", proveedor.tienda_id)
+    versiones.bump("proveedor", proveedor.id)
     return proveedor
 
 @proveedor_router.delete("/eliminar/{proveedor_id}/", response={200: dict, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
-@require_manage_providers()
+@require_manage_providers(TiendaVia("proveedor", "proveedor_id"))
 def eliminar_proveedor(request, proveedor_id: int):
     """
     Elimina un proveedor existente.
     """
     proveedor = Proveedor.objects.get(id=proveedor_id)
-    proveedor.delete()
-    return {"mensaje": "Proveedor eliminado correctamente."}
\ No newline at end of file
+    # lápidas de todo lo que se borra en cascada con el proveedor
+    with registrar_escritura(
+        [proveedor_id],
+        productos=Producto.objects.filter(proveedor_id=proveedor_id),
+        compras=Compra.objects.filter(proveedor_id=proveedor_id),
+        detalles=DetalleCompra.objects.filter(compra__proveedor_id=proveedor_id),
+        eliminado=True,
+    ):
+        proveedor.delete()
+    versiones.bump("tienda", proveedor.tienda_id)
+    return {"mensaje": "Proveedor eliminado correctamente."}
+
+@proveedor_router.post("/clonar/", response={200: ClonarCatalogoResultadoSchema, 400: ErrorSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_manage_providers(TiendaVia("tienda", "payload", "tienda_destino_id"))
+def clonar_catalogo(request, payload: ClonarCatalogoSchema):
+    """
+    Copia a otra tienda un proveedor (`proveedor_id`) o todos los de una tienda
+    (`tienda_origen_id`), con sus productos y su `orden`.
+
+    Los proveedores que ya existen en el destino con el mismo nombre se completan con
+    los productos que les falten (ver `proveedor.catalogo`).
+    """
+    if (payload.proveedor_id is None) == (payload.tienda_origen_id is None):
+        return 400, {"message": "Indicar `proveedor_id` o `tienda_origen_id` (sólo uno)"}
+    if payload.proveedor_id is not None:
+        tienda_origen_id = Proveedor.objects.filter(id=payload.proveedor_id).values_list("tienda_id", flat=True).first()
+        if tienda_origen_id is None:
+            return 404, {"message": "Proveedor no encontrado"}
+    else:
+        tienda_origen_id = payload.tienda_origen_id
+        if not Tienda.objects.filter(id=tienda_origen_id).exists():
+            return 404, {"message": "Tienda no encontrada"}
+    ctx = get_permission_context(request)
+    allowed = ctx.get_allowed_tiendas()
+    if allowed is not None and tienda_origen_id not in allowed:
+        return 403, {"message": "No autorizado para la tienda de origen"}
+    if not ctx.has_permission(payload.tienda_destino_id, "puede_gestionar_productos"):
+        return 403, {"message": "No autorizado para crear productos en la tienda destino"}
+    return catalogo.clonar(payload.tienda_destino_id, payload.proveedor_id, payload.tienda_origen_id)
@@ -0,0 +1,99 @@
+"""Copia de catálogos (proveedores y sus productos) entre tiendas.
+
+Todo en una transacción y con sentencias INSERT ... SELECT: el coste no depende de
+cuántos productos se copien.
+
+Colisiones de nombres:
+
+- Si la tienda destino ya tiene un proveedor con el mismo nombre
+  (`unique_proveedor_por_tienda`), se reutiliza y se le agregan los productos que
+  le falten, a continuación de los suyos y en el mismo orden relativo que en el
+  origen.
+- Los productos que ese proveedor ya tiene (`unique_producto_por_proveedor`) se
+  saltan.
+
+Los productos agregados a proveedores que ya tenían compras reciben su detalle
+(0, 0) en cada compra, como en el alta normal.
+"""
+from dataclasses import dataclass
+
+from django.db import connections
+from django.db.models import Max
+from django.db.models.constants import OnConflict
+
+from compra.escrituras import registrar_escritura
+from compra.models import DetalleCompra
+from core import versiones
+from producto.models import Producto
+from proveedor.models import Proveedor
+
+
+@dataclass
+class ResultadoClonacion:
+    proveedores_creados: int = 0
+    proveedores_existentes: int = 0
+    productos_creados: int = 0
+    productos_existentes: int = 0
+
+
+def clonar(tienda_destino_id: int, proveedor_id: int | None = None, tienda_origen_id: int | None = None) -> ResultadoClonacion:
+    """Copia a `tienda_destino_id` el proveedor `proveedor_id` o todos los de `tienda_origen_id`."""
+    if (proveedor_id is None) == (tienda_origen_id is None):
+        raise ValueError("Indicar el proveedor o la tienda de origen (sólo uno)")
+    if proveedor_id is not None:
+        origen = Proveedor.objects.filter(id=proveedor_id)
+        filtro, filtro_params = "s.id = %s", [proveedor_id]
+    else:
+        origen = Proveedor.objects.filter(tienda_id=tienda_origen_id)
+        filtro, filtro_params = "s.tienda_id = %s", [tienda_origen_id]
+
+    connection = connections[Producto.objects.db]
+    qn = connection.ops.quote_name
+    proveedor_table = qn(Proveedor._meta.db_table)
+    producto_table = qn(Producto._meta.db_table)
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    ignorar = connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)
+
+    resultado = ResultadoClonacion()
+    with registrar_escritura(using=connection.alias) as escritura:
+        nombres = list(origen.values_list("nombre", flat=True))
+        existentes = list(
+            Proveedor.objects.filter(tienda_id=tienda_destino_id, nombre__in=nombres).values_list("id", flat=True)
+        )
+        # los ids crecen: lo insertado ahora queda por encima del máximo actual
+        ultimo_producto = Producto.objects.aggregate(ultimo=Max("id"))["ultimo"] or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"{insert} {proveedor_table} (nombre, tienda_id) "
+                f"SELECT s.nombre, %s FROM {proveedor_table} s WHERE {filtro} {ignorar}",
+                [tienda_destino_id, *filtro_params],
+            )
+            resultado.proveedores_creados = cursor.rowcount
+            # cada proveedor de origen va al de igual nombre en el destino; en los que ya
+            # tenían productos, el `orden` copiado se corre detrás de su máximo
+            cursor.execute(
+                f"{insert} {producto_table} (nombre, proveedor_id, orden) "
+                f"SELECT p.nombre, d.id, p.orden + COALESCE(m.maximo, 0) "
+                f"FROM {producto_table} p "
+                f"INNER JOIN {proveedor_table} s ON s.id = p.proveedor_id "
+                f"INNER JOIN {proveedor_table} d ON d.tienda_id = %s AND d.nombre = s.nombre "
+                f"LEFT JOIN (SELECT proveedor_id, MAX(orden) AS maximo FROM {producto_table} "
+                f"WHERE proveedor_id IN ({', '.join(['%s'] * len(existentes)) or 'NULL'}) GROUP BY proveedor_id) m "
+                f"ON m.proveedor_id = d.id "
+                f"WHERE {filtro} ORDER BY p.proveedor_id, p.orden, p.id {ignorar}",
+                [tienda_destino_id, *existentes, *filtro_params],
+            )
+            resultado.productos_creados = cursor.rowcount
+        resultado.proveedores_existentes = len(existentes)
+        resultado.productos_existentes = Producto.objects.filter(proveedor__in=origen).count() - resultado.productos_creados
+
+        nuevos = Producto.objects.filter(id__gt=ultimo_producto, proveedor__tienda_id=tienda_destino_id)
+        for existente in existentes:
+            # sólo los proveedores que ya estaban pueden tener compras
+            DetalleCompra.objects.completar_vacios(
+                proveedor_id=existente, producto_ids=nuevos.filter(proveedor_id=existente).values_list("id", flat=True)
+            )
+        escritura.productos = nuevos
+        escritura.proveedores.update(existentes)
+        versiones.bump("tienda", tienda_destino_id)
+    return resultado
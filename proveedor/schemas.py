@@ -1,14 +1,36 @@
 from ninja import Schema,ModelSchema
 from proveedor.models import Proveedor
+from typing import Optional
+from datetime import date
 
 class ProveedorSchema(ModelSchema):
     class Meta:
         model = Proveedor
         fields = '__all__'
 
+class ProveedorConResumenSchema(ProveedorSchema):
+    # sólo con `con_resumen=true`
+    total_productos: Optional[int] = None
+    total_compras: Optional[int] = None
+    ultima_compra_fecha: Optional[date] = None
+    # suma de `cantidad` de los detalles de la última compra
+    ultima_compra_cantidad: Optional[int] = None
+
 class ProveedorInSchema(Schema):
     nombre: str
     tienda_id: int
 
 class ProveedorUpdateSchema(Schema):
-    nombre: str
\ No newline at end of file
+    nombre: str
+
+class ClonarCatalogoSchema(Schema):
+    tienda_destino_id: int
+    # uno de los dos: un proveedor o todos los de una tienda
+    proveedor_id: Optional[int] = None
+    tienda_origen_id: Optional[int] = None
+
+class ClonarCatalogoResultadoSchema(Schema):
+    proveedores_creados: int
+    proveedores_existentes: int
+    productos_creados: int
+    productos_existentes: int
@@ -1,3 +1,146 @@
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from compra.models import Compra, DetalleCompra
+from core.testing import ApiTestCase
+from producto.models import Producto
+from proveedor.models import Proveedor
+from tienda.models import Tienda
+
+
+class ListarConResumenTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tienda = Tienda.objects.create(nombre="Tienda")
+        self.crear_usuario("admin", superusuario=True)
+        self.token = self.login("admin")
+        self.proveedor = self._post("/proveedor/crear/", {"nombre": "P", "tienda_id": self.tienda.id})["id"]
+        self.vacio = self._post("/proveedor/crear/", {"nombre": "Vacío", "tienda_id": self.tienda.id})["id"]
+        self._post("/producto/crear/lote/", {"proveedor_id": self.proveedor, "nombres": ["a", "b", "c"]})
+        for fecha in ("2026-01-01", "2026-02-01"):
+            self._post("/compra/crear/", {"proveedor_id": self.proveedor, "fecha_compra": fecha})
+        self.url = f"/proveedor/listar/{self.tienda.id}/?con_resumen=true"
+
+    def _post(self, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.api("post", url, data)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_totales_y_ultima_compra(self):
+        DetalleCompra.objects.filter(compra__fecha_compra="2026-02-01").update(cantidad=4)
+        DetalleCompra.objects.filter(compra__fecha_compra="2026-01-01").update(cantidad=9)
+        proveedores = {p["id"]: p for p in self.api("get", self.url).json()}
+
+        self.assertEqual(proveedores[self.proveedor]["total_productos"], 3)
+        self.assertEqual(proveedores[self.proveedor]["total_compras"], 2)
+        self.assertEqual(proveedores[self.proveedor]["ultima_compra_fecha"], "2026-02-01")
+        self.assertEqual(proveedores[self.proveedor]["ultima_compra_cantidad"], 12)
+        self.assertEqual(proveedores[self.vacio]["total_productos"], 0)
+        self.assertEqual(proveedores[self.vacio]["total_compras"], 0)
+        self.assertIsNone(proveedores[self.vacio]["ultima_compra_fecha"])
+
+    def test_304_sin_consultas(self):
+        etag = self.api("get", self.url)["ETag"]
+        with self.assertNumQueries(0):
+            respuesta = self.api("get", self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_escritura_en_un_proveedor_cambia_el_etag(self):
+        etag = self.api("get", self.url)["ETag"]
+        detalle = DetalleCompra.objects.filter(compra__proveedor_id=self.proveedor).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api("patch", f"/compra/detalle/editar/{detalle.id}/", {"cantidad": 5})
+
+        respuesta = self.api("get", self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], etag)
+        # sin resumen la respuesta no depende de los detalles: el ETag no cambia
+        sin_resumen = f"/proveedor/listar/{self.tienda.id}/"
+        etag = self.api("get", sin_resumen)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api("patch", f"/compra/detalle/editar/{detalle.id}/", {"cantidad": 6})
+        self.assertEqual(self.api("get", sin_resumen, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ClonarCatalogoTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.origen = Tienda.objects.create(nombre="Origen")
+        self.destino = Tienda.objects.create(nombre="Destino")
+        self.crear_usuario("admin", superusuario=True)
+        self.token = self.login("admin")
+        self.p = self._proveedor(self.origen, "P", ["a", "b", "c"])
+        self.q = self._proveedor(self.origen, "Q", ["x"])
+        # orden elegido a mano: la copia debe respetarlo, no el de alta
+        Producto.objects.filter(proveedor=self.p, nombre="a").update(orden=5000)
+
+    def _proveedor(self, tienda, nombre, productos):
+        proveedor = Proveedor.objects.create(nombre=nombre, tienda=tienda)
+        Producto.objects.bulk_create(
+            Producto(nombre=producto, proveedor=proveedor, orden=(i + 1) * 1024) for i, producto in enumerate(productos)
+        )
+        return proveedor
+
+    def _clonar(self, token=None, **payload):
+        return self.api("post", "/proveedor/clonar/", {"tienda_destino_id": self.destino.id, **payload}, token)
+
+    def _catalogo(self, tienda):
+        return {
+            proveedor.nombre: "".join(proveedor.producto_set.order_by("orden", "id").values_list("nombre", flat=True))
+            for proveedor in Proveedor.objects.filter(tienda=tienda)
+        }
+
+    def test_tienda_completa(self):
+        respuesta = self._clonar(tienda_origen_id=self.origen.id)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json(), {
+            "proveedores_creados": 2, "proveedores_existentes": 0, "productos_creados": 4, "productos_existentes": 0,
+        })
+        self.assertEqual(self._catalogo(self.destino), {"P": "bca", "Q": "x"})
+        self.assertEqual(self._catalogo(self.origen), {"P": "bca", "Q": "x"})
+        # el índice de búsqueda ve las copias
+        encontrados = self.api("get", f"/producto/buscar/?q=x&tienda_id={self.destino.id}").json()
+        self.assertEqual([p["tienda_id"] for p in encontrados], [self.destino.id])
+
+    def test_nombres_que_ya_existen(self):
+        existente = self._proveedor(self.destino, "P", ["c", "z"])
+        compra = Compra.objects.create(proveedor=existente, fecha_compra="2026-01-01")
+        DetalleCompra.objects.crear_vacios_para_compra(compra)
+
+        respuesta = self._clonar(proveedor_id=self.p.id)
+        self.assertEqual(respuesta.json(), {
+            "proveedores_creados": 0, "proveedores_existentes": 1, "productos_creados": 2, "productos_existentes": 1,
+        })
+        # los que faltaban, detrás de los suyos y en el orden del origen
+        self.assertEqual(self._catalogo(self.destino), {"P": "czba"})
+        self.assertEqual(
+            sorted(DetalleCompra.objects.filter(compra=compra).values_list("producto__nombre", "cantidad", "inventario_anterior")),
+            [("a", 0, 0), ("b", 0, 0), ("c", 0, 0), ("z", 0, 0)],
+        )
+        # repetir la copia no cambia nada
+        self.assertEqual(self._clonar(proveedor_id=self.p.id).json()["productos_creados"], 0)
+
+    def test_consultas_no_dependen_del_catalogo(self):
+        def consultas(productos):
+            tienda = Tienda.objects.create(nombre=f"Origen {productos}")
+            self._proveedor(tienda, f"R{productos}", [f"p{i}" for i in range(productos)])
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self._clonar(tienda_origen_id=tienda.id)
+            self.assertEqual(respuesta.json()["productos_creados"], productos)
+            return len(capturadas)
+
+        consultas(1)  # calienta sesión y permisos
+        self.assertEqual(consultas(3), consultas(80))
+
+    def test_validacion_y_permisos(self):
+        self.assertEqual(self._clonar().status_code, 400)
+        self.assertEqual(self._clonar(proveedor_id=self.p.id, tienda_origen_id=self.origen.id).status_code, 400)
+        self.assertEqual(self._clonar(proveedor_id=999999).status_code, 404)
+        self.assertEqual(self._clonar(tienda_origen_id=999999).status_code, 404)
+
+        self.crear_usuario("solo_destino", tiendas=[self.destino])
+        self.crear_usuario("sin_productos", tiendas=[self.origen, self.destino], puede_gestionar_productos=False)
+        self.assertEqual(self._clonar(self.login("solo_destino"), proveedor_id=self.p.id).status_code, 403)
+        self.assertEqual(self._clonar(self.login("sin_productos"), proveedor_id=self.p.id).status_code, 403)
+        self.assertFalse(Proveedor.objects.filter(tienda=self.destino).exists())
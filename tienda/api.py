@@ -1,26 +1,48 @@
 from ninja import Router
 from tienda.models import Tienda
-from tienda.schemas import TiendaSchema, TiendaInSchema
+from tienda.schemas import TiendaSchema, TiendaInSchema, DashboardSchema
+from tienda import dashboard
 from core.schemas import ErrorSchema
+from core.pagination import paginate_optional
+from django.http import HttpResponse
+from typing import Optional
 from ninja.errors import HttpError
-from usuario.permisions import require_superadmin, _get_user_from_request, get_allowed_tiendas
+from usuario.permisions import require_superadmin, require_view_inventory, get_permission_context
+from usuario.models import PermisosUsuarioTienda
+from usuario import permisos_cache
+from proveedor.models import Proveedor
+from core import versiones
 
 tienda_router = Router(tags=["Tiendas"])
 
 
 @tienda_router.get("/listar/", response=list[TiendaSchema])
-def listar_tiendas(request):
+def listar_tiendas(request, response: HttpResponse, limit: Optional[int] = None, cursor: Optional[str] = None):
     """
     Lista todas las tiendas disponibles.
+
+    Con `limit` y/o `cursor` pagina por keyset; ver cabeceras `X-Next-Cursor` / `X-Prev-Cursor`.
     """
     # Listado filtrado por tiendas permitidas
-    user = _get_user_from_request(request)
-    allowed = get_allowed_tiendas(user)
+    allowed = get_permission_context(request).get_allowed_tiendas()
     if allowed is None:
         tiendas = Tienda.objects.all()
     else:
         tiendas = Tienda.objects.filter(id__in=allowed)
-    return tiendas
+    return paginate_optional(tiendas, ("id",), response, limit, cursor)
+@tienda_router.get("/dashboard/{tienda_id}/", response={200: DashboardSchema, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+@require_view_inventory()
+def dashboard_tienda(request, tienda_id: int):
+    """
+    Datos de la pantalla de inicio de la tienda: sus proveedores con la última compra
+    de cada uno y sus totales, los productos sin stock y los cambios de hoy.
+
+    Cantidad fija de consultas, sin importar cuántos proveedores tenga la tienda.
+    """
+    tienda = Tienda.objects.filter(id=tienda_id).first()
+    if tienda is None:
+        return 404, {"message": "Tienda no encontrada"}
+    return {"tienda": tienda, **dashboard.resumen(tienda_id)}
 @tienda_router.post("/crear/", response={200: TiendaSchema, 400: ErrorSchema})
 @require_superadmin()
 def crear_tienda(request, tienda_in: TiendaInSchema):
@@ -50,5 +72,11 @@ def eliminar_tienda(request, tienda_id: int):
     Elimina una tienda existente.
     """
     tienda = Tienda.objects.get(id=tienda_id)
+    # los permisos sobre la tienda se borran en cascada: invalidar la caché de sus usuarios
+    usuario_ids = list(PermisosUsuarioTienda.objects.filter(tienda_id=tienda_id).values_list("usuario_id", flat=True))
+    proveedor_ids = list(Proveedor.objects.filter(tienda_id=tienda_id).values_list("id", flat=True))
     tienda.delete()
+    permisos_cache.bump_version(*usuario_ids)
+    versiones.bump("tienda", tienda_id)
+    versiones.bump("proveedor", *proveedor_ids)
     return {"mensaje": "Tienda eliminada correctamente."}
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""Datos de la pantalla de inicio de una tienda, en un número fijo de consultas.
+
+- Proveedores con su última compra y los totales de sus detalles: una consulta con
+  `ROW_NUMBER() OVER (PARTITION BY proveedor_id ORDER BY fecha_compra DESC)` sobre
+  las compras de la tienda, sin importar cuántos proveedores tenga.
+- Productos sin stock: los de `StockProducto` cuyo último inventario fue 0 y que no
+  se compraron en esa misma compra.
+- Cambios de hoy (zona horaria del proyecto): objetos distintos por modelo en el
+  registro de `Cambio`.
+"""
+from datetime import datetime, time
+
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from compra.models import Cambio, Compra, DetalleCompra, StockProducto
+from compra.reportes import _as_date
+from proveedor.models import Proveedor
+
+
+def _proveedores(tienda_id: int) -> list[dict]:
+    qn = connection.ops.quote_name
+    sql = f"""
+        WITH ultimas AS (
+            SELECT
+                c.id, c.proveedor_id, c.fecha_compra,
+                ROW_NUMBER() OVER (PARTITION BY c.proveedor_id ORDER BY c.fecha_compra DESC) AS fila
+            FROM {qn(Compra._meta.db_table)} c
+            INNER JOIN {qn(Proveedor._meta.db_table)} pr ON pr.id = c.proveedor_id
+            WHERE pr.tienda_id = %s
+        )
+        SELECT
+            pr.id, pr.nombre, u.id, u.fecha_compra,
+            COUNT(d.id),
+            COALESCE(SUM(CASE WHEN d.cantidad > 0 THEN 1 ELSE 0 END), 0),
+            COALESCE(SUM(d.cantidad), 0),
+            COALESCE(SUM(d.inventario_anterior), 0)
+        FROM {qn(Proveedor._meta.db_table)} pr
+        LEFT JOIN ultimas u ON u.proveedor_id = pr.id AND u.fila = 1
+        LEFT JOIN {qn(DetalleCompra._meta.db_table)} d ON d.compra_id = u.id
+        WHERE pr.tienda_id = %s
+        GROUP BY pr.id, pr.nombre, u.id, u.fecha_compra
+        ORDER BY pr.id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tienda_id, tienda_id])
+        rows = cursor.fetchall()
+
+    proveedores = []
+    for prov_id, nombre, compra_id, fecha, detalles, comprados, cantidad, inventario in rows:
+        ultima = None
+        if compra_id is not None:
+            ultima = {
+                "id": compra_id,
+                "fecha_compra": _as_date(fecha),
+                "detalles": detalles,
+                "productos_comprados": comprados,
+                "cantidad_total": int(cantidad),
+                "inventario_total": int(inventario),
+            }
+        proveedores.append({"id": prov_id, "nombre": nombre, "ultima_compra": ultima})
+    return proveedores
+
+
+def _sin_stock(tienda_id: int) -> list[dict]:
+    # inventario 0 en la compra más reciente y nada comprado en esa misma compra
+    return list(
+        StockProducto.objects.filter(producto__proveedor__tienda_id=tienda_id, inventario=0)
+        .filter(Q(fecha_ultima_compra__isnull=True) | Q(fecha_ultima_compra__lt=F("fecha_inventario")))
+        .order_by("producto__proveedor_id", "producto__orden", "producto_id")
+        .values(
+            "producto_id", "fecha_inventario", "fecha_ultima_compra",
+            nombre=F("producto__nombre"), proveedor_id=F("producto__proveedor_id"),
+        )
+    )
+
+
+def _cambios_hoy(tienda_id: int, desde: datetime) -> dict:
+    cambios = {f"{modelo}s": 0 for modelo, _ in Cambio.MODELOS}
+    cambios["eliminados"] = 0
+    filas = (
+        Cambio.objects.filter(tienda_id=tienda_id, fecha__gte=desde)
+        .values("modelo", "eliminado")
+        .annotate(objetos=Count("objeto_id", distinct=True))
+        .order_by()
+    )
+    for fila in filas:
+        clave = "eliminados" if fila["eliminado"] else f"{fila['modelo']}s"
+        cambios[clave] += fila["objetos"]
+    return cambios
+
+
+def resumen(tienda_id: int) -> dict:
+    """Proveedores con su última compra, productos sin stock y cambios de hoy.
+
+    A lo sumo tres consultas, sea cual sea el número de proveedores.
+    """
+    hoy = timezone.localdate()
+    return {
+        "fecha": hoy,
+        "proveedores": _proveedores(tienda_id),
+        "sin_stock": _sin_stock(tienda_id),
+        "cambios_hoy": _cambios_hoy(tienda_id, timezone.make_aware(datetime.combine(hoy, time.min))),
+    }
@@ -1,3 +1,6 @@
+from datetime import date
+from typing import Optional
+
 from ninja import Schema,ModelSchema
 from tienda.models import Tienda
 
@@ -7,4 +10,37 @@ class TiendaSchema(ModelSchema):
         fields = '__all__'
 
 class TiendaInSchema(Schema):
-    nombre: str
\ No newline at end of file
+    nombre: str
+
+class DashboardCompraSchema(Schema):
+    id: int
+    fecha_compra: date
+    detalles: int
+    productos_comprados: int
+    cantidad_total: int
+    inventario_total: int
+
+class DashboardProveedorSchema(Schema):
+    id: int
+    nombre: str
+    ultima_compra: Optional[DashboardCompraSchema] = None
+
+class DashboardSinStockSchema(Schema):
+    producto_id: int
+    nombre: str
+    proveedor_id: int
+    fecha_inventario: Optional[date] = None
+    fecha_ultima_compra: Optional[date] = None
+
+class DashboardCambiosSchema(Schema):
+    productos: int
+    compras: int
+    detalles: int
+    eliminados: int
+
+class DashboardSchema(Schema):
+    tienda: TiendaSchema
+    fecha: date
+    proveedores: list[DashboardProveedorSchema]
+    sin_stock: list[DashboardSinStockSchema]
+    cambios_hoy: DashboardCambiosSchema
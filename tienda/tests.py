@@ -1,3 +1,70 @@
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from core.testing import ApiTestCase
+from tienda.models import Tienda
+
+
+class DashboardTiendaTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.crear_usuario("admin", superusuario=True)
+        self.token = self.login("admin")
+
+    def _post(self, url, data):
+        respuesta = self.api("post", url, data)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def _tienda(self, nombre, proveedores):
+        tienda = Tienda.objects.create(nombre=nombre)
+        for i in range(proveedores):
+            proveedor = self._post("/proveedor/crear/", {"nombre": f"P{i}", "tienda_id": tienda.id})
+            self._post("/producto/crear/lote/", {"proveedor_id": proveedor["id"], "nombres": ["a", "b", "c"]})
+            for fecha in ("2026-01-01", "2026-02-01"):
+                self._post("/compra/crear/", {"proveedor_id": proveedor["id"], "fecha_compra": fecha})
+        return tienda
+
+    def _dashboard(self, tienda):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.api("get", f"/tienda/dashboard/{tienda.id}/")
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json(), len(consultas)
+
+    def test_consultas_no_dependen_de_proveedores(self):
+        chica = self._tienda("Chica", 1)
+        grande = self._tienda("Grande", 12)
+        self._dashboard(chica)  # calienta la caché de sesión y permisos
+
+        datos_chica, consultas_chica = self._dashboard(chica)
+        datos_grande, consultas_grande = self._dashboard(grande)
+
+        self.assertEqual(consultas_chica, consultas_grande)
+        with self.assertNumQueries(consultas_grande):
+            self._dashboard(grande)
+        self.assertEqual(len(datos_chica["proveedores"]), 1)
+        self.assertEqual(len(datos_grande["proveedores"]), 12)
+
+    def test_ultima_compra_por_proveedor(self):
+        tienda = self._tienda("Tienda", 3)
+        datos, _ = self._dashboard(tienda)
+        for proveedor in datos["proveedores"]:
+            self.assertEqual(proveedor["ultima_compra"]["fecha_compra"], "2026-02-01")
+            self.assertEqual(proveedor["ultima_compra"]["detalles"], 3)
+        # detalles (0, 0): los tres productos de cada proveedor quedaron sin stock
+        self.assertEqual(len(datos["sin_stock"]), 9)
+        self.assertEqual(datos["cambios_hoy"]["compras"], 6)
+
+    def test_permiso_antes_que_la_tienda(self):
+        tienda = self._tienda("Tienda", 1)
+        self.crear_usuario("sin_inventario", tiendas=[tienda], puede_ver_inventario_compras=False)
+        self.crear_usuario("con_inventario", tiendas=[tienda], puede_ver_inventario_compras=True)
+        sin_inventario = self.login("sin_inventario")
+        con_inventario = self.login("con_inventario")
+
+        self.assertEqual(self.api("get", f"/tienda/dashboard/{tienda.id}/", token=con_inventario).status_code, 200)
+        self.assertEqual(self.api("get", f"/tienda/dashboard/{tienda.id}/", token=sin_inventario).status_code, 403)
+        # una tienda inexistente no se distingue de una ajena
+        self.assertEqual(self.api("get", "/tienda/dashboard/999999/", token=con_inventario).status_code, 403)
+        self.assertEqual(self.api("get", "/tienda/dashboard/999999/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/tienda/dashboard/{tienda.id}/").status_code, 401)
@@ -10,6 +10,7 @@ from usuario.schemas.permisosSchema import (
 )
 from core.schemas import ErrorSchema
 from usuario.permisions import require_superadmin
+from usuario import permisos_cache
 
 permisos_router = Router(tags=["Permisos Usuario-Tienda"])
 
@@ -54,6 +55,7 @@ def crear_permiso(request: HttpRequest, payload: PermisosUsuarioTiendaInSchema):
 		puede_editar_compras=payload.puede_editar_compras,
 		puede_ver_inventario_compras=payload.puede_ver_inventario_compras,
 	)
+	permisos_cache.bump_version(usuario_id)
 
 	return permiso
 
@@ -72,6 +74,7 @@ def actualizar_permiso(request: HttpRequest, permiso_id: int, payload: PermisosU
 	permiso.puede_editar_compras = payload.puede_editar_compras
 	permiso.puede_ver_inventario_compras = payload.puede_ver_inventario_compras
 	permiso.save()
+	permisos_cache.bump_version(permiso.usuario_id)
 	return permiso
 
 
@@ -84,5 +87,12 @@ def eliminar_permiso(request: HttpRequest, permiso_id: int):
 		return 404, {"message": "Permiso no encontrado"}
 
 	permiso.delete()
+	permisos_cache.bump_version(permiso.usuario_id)
 	return {"message": "Permiso eliminado"}
 
+
+@permisos_router.get("cache/stats/", response={200: dict, 401: ErrorSchema})
+@require_superadmin()
+def estadisticas_cache_permisos(request: HttpRequest):
+	"""Aciertos/fallos de la caché de permisos en el worker que atiende la petición."""
+	return permisos_cache.get_stats()
@@ -1,9 +1,10 @@
 from ninja import Router
 from django.contrib.auth.hashers import check_password, make_password
-from django.http import HttpRequest
-import uuid
+from django.http import HttpRequest, HttpResponse
 
 from usuario.models import Usuario
+from usuario.auth import create_session, revoke_session, revoke_user
+from usuario import permisos_cache
 from usuario.schemas.usuarios_loginSchema import (
 	LoginSchema,
 	TokenSchema,
@@ -13,6 +14,8 @@ from usuario.schemas.usuarios_loginSchema import (
 	SuperUserResetPasswordSchema,
 )
 from core.schemas import ErrorSchema
+from core.pagination import paginate_optional
+from typing import Optional
 
 usuario_router = Router(tags=["Usuarios y Login"])
 
@@ -28,13 +31,14 @@ def _get_user_from_request(request):
 	return getattr(request, "auth", None)
 
 @usuario_router.get('/listar/', response={200: list[UserOutSchema], 401: ErrorSchema})
-def listar_usuarios(request: HttpRequest):
+def listar_usuarios(request: HttpRequest, response: HttpResponse, limit: Optional[int] = None, cursor: Optional[str] = None):
+	"""Lista los usuarios. Con `limit` y/o `cursor` pagina por keyset (cabeceras `X-Next-Cursor` / `X-Prev-Cursor`)."""
 	admin = _get_superadmin_from_request(request)
 	if not admin:
 		return 401, {"message": "Se requiere superadmin"}
 
 	usuarios = Usuario.objects.all()
-	return list(usuarios)
+	return list(paginate_optional(usuarios, ("id",), response, limit, cursor))
 
 
 @usuario_router.post("/login/", response={200: TokenSchema, 400: ErrorSchema},auth=None)
@@ -42,9 +46,9 @@ def login(request: HttpRequest, payload: LoginSchema):
 	user = Usuario.objects.filter(username=payload.username).first()
 	if not user or not check_password(payload.password, user.password):
 		return 400, {"message": "Credenciales inválidas"}
-	token = uuid.uuid4().hex
-	user.token = token
-	user.save(update_fields=["token"])
+	sesion = create_session(user)
+	# el token vive en `SesionUsuario`; se expone en la respuesta como atributo de la instancia
+	user.token = sesion.token
 	# Devolver la instancia ORM para que el `TokenSchema` (ModelSchema) la serialice correctamente
 	return user
 
@@ -105,8 +109,10 @@ def logout(request: HttpRequest):
 	if not user:
 		return 401, {"message": "Token inválido o no proporcionado"}
 
-	user.token = None
-	user.save(update_fields=["token"])
+	# cerrar sólo la sesión usada en este request; las demás sesiones del usuario siguen activas
+	token = getattr(request, "auth_token", None)
+	if token:
+		revoke_session(token)
 	return {"message": "Logout correcto"}
 
 @usuario_router.delete("/eliminar/{usuario_id}/", response={200: dict, 401: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
@@ -123,4 +129,6 @@ def eliminar_usuario(request: HttpRequest, usuario_id: int):
 		return 403, {"message": "No se puede eliminar un superusuario"}
 
 	usuario.delete()
+	revoke_user(usuario_id)
+	permisos_cache.bump_version(usuario_id)
 	return {"message": "Usuario eliminado correctamente"}
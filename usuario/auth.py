@@ -1,5 +1,166 @@
+from collections import OrderedDict
+from datetime import timedelta
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
 from ninja.security import HttpBearer
-from usuario.models import Usuario
+from usuario.models import Usuario, SesionUsuario
+
+
+# Duración de una sesión desde el login
+SESSION_TTL = getattr(settings, "AUTH_SESSION_TTL", 60 * 60 * 24 * 30)
+# Tamaño y vigencia (segundos) de la caché en proceso token -> usuario
+TOKEN_CACHE_SIZE = getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 1024)
+TOKEN_CACHE_TTL = getattr(settings, "AUTH_TOKEN_CACHE_TTL", 60)
+# Caché compartida entre workers donde se publican las revocaciones
+REVOCACION_CACHE_ALIAS = getattr(settings, "AUTH_REVOCACION_CACHE_ALIAS", "default")
+# Cada cuántos segundos, como mucho, un worker vuelve a mirar si un token cacheado
+# fue revocado: es lo que puede tardar un logout en valer en los demás workers
+REVOCACION_INTERVALO = getattr(settings, "AUTH_REVOCACION_INTERVALO", 5)
+
+
+class TokenCache:
+    """Caché LRU acotada con TTL para resolver tokens sin ir a la base de datos.
+
+    Cada worker tiene la suya y un `invalidate` sólo afecta al proceso actual. Para
+    que un logout o un usuario eliminado valgan en todos los workers, las
+    revocaciones se publican además en la caché compartida (`revoke_session`,
+    `revoke_user`) y los aciertos se contrastan con ellas cada `REVOCACION_INTERVALO`
+    segundos como mucho, no en cada request.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        """Devuelve `(usuario, leido, revisado)` o `None`.
+
+        `leido` es el `time.time_ns()` de cuando se leyó la sesión de la BD y
+        `revisado` el `time.monotonic()` de la última vez que se buscaron revocaciones.
+        """
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is None:
+                return None
+            user, expira, cached_until, leido, revisado = entry
+            if time.monotonic() >= cached_until or timezone.now() >= expira:
+                del self._data[token]
+                return None
+            self._data.move_to_end(token)
+            return user, leido, revisado
+
+    def set(self, token: str, user: Usuario, expira, leido: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._data[token] = (user, expira, now + self.ttl, leido, now)
+            self._data.move_to_end(token)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def marcar_revisado(self, token: str) -> None:
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is not None:
+                self._data[token] = (*entry[:-1], time.monotonic())
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._data.pop(token, None)
+
+    def invalidate_user(self, usuario_id: int) -> None:
+        with self._lock:
+            for token in [t for t, (u, *_) in self._data.items() if u.id == usuario_id]:
+                del self._data[token]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+token_cache = TokenCache()
+
+
+def _revocaciones():
+    return caches[REVOCACION_CACHE_ALIAS]
+
+
+def _token_revocado_key(token: str) -> str:
+    return f"auth:revocado:{token}"
+
+
+def _usuario_revocado_key(usuario_id: int) -> str:
+    return f"auth:revocado:usuario:{usuario_id}"
+
+
+def _publicar_revocacion(key: str) -> None:
+    # basta con que la marca dure lo que una entrada de `token_cache`: las
+    # anteriores a ella caducan antes (`REVOCACION_INTERVALO` < `TOKEN_CACHE_TTL`)
+    _revocaciones().set(key, time.time_ns(), TOKEN_CACHE_TTL + 1)
+
+
+def _revocado(token: str, usuario_id: int, leido: int) -> bool:
+    """Si hay una revocación publicada posterior a la lectura `leido` de la sesión."""
+    keys = [_token_revocado_key(token), _usuario_revocado_key(usuario_id)]
+    marcas = _revocaciones().get_many(keys)
+    return any(marca >= leido for marca in marcas.values())
+
+
+def create_session(user: Usuario) -> SesionUsuario:
+    """Abre una nueva sesión para `user` sin cerrar las que ya tenga."""
+    now = timezone.now()
+    # limpiar sesiones caducadas del usuario aprovechando el login
+    SesionUsuario.objects.filter(usuario=user, expira__lte=now).delete()
+    return SesionUsuario.objects.create(
+        usuario=user,
+        token=uuid.uuid4().hex,
+        expira=now + timedelta(seconds=SESSION_TTL),
+    )
+
+
+def revoke_session(token: str) -> None:
+    """Elimina la sesión de `token`; deja de valer en todos los workers inmediatamente."""
+    SesionUsuario.objects.filter(token=token).delete()
+    token_cache.invalidate(token)
+    _publicar_revocacion(_token_revocado_key(token))
+
+
+def revoke_user(usuario_id: int) -> None:
+    """Invalida en todos los workers los tokens cacheados del usuario (p. ej. al eliminarlo)."""
+    token_cache.invalidate_user(usuario_id)
+    _publicar_revocacion(_usuario_revocado_key(usuario_id))
+
+
+def get_user_for_token(token: str) -> Usuario | None:
+    """Resuelve el `Usuario` de un token vigente, usando la caché antes que la BD."""
+    if not token:
+        return None
+    entry = token_cache.get(token)
+    if entry is not None:
+        user, leido, revisado = entry
+        if time.monotonic() - revisado < REVOCACION_INTERVALO:
+            return user
+        if not _revocado(token, user.id, leido):
+            token_cache.marcar_revisado(token)
+            return user
+        token_cache.invalidate(token)
+    # tomado antes de leer: una revocación concurrente con la lectura queda posterior
+    leido = time.time_ns()
+    sesion = (
+        SesionUsuario.objects.select_related("usuario")
+        .filter(token=token, expira__gt=timezone.now())
+        .first()
+    )
+    if not sesion:
+        return None
+    token_cache.set(token, sesion.usuario, sesion.expira, leido)
+    return sesion.usuario
 
 
 class AuthBearer(HttpBearer):
@@ -12,7 +173,9 @@ class AuthBearer(HttpBearer):
         if not token:
             return None
         # token recibido ya es la parte después de 'Bearer '
-        user = Usuario.objects.filter(token=token).first()
+        user = get_user_for_token(token)
         if not user:
             return None
-        return user
\ No newline at end of file
+        # guardar el token para que logout pueda cerrar exactamente esta sesión
+        request.auth_token = token
+        return user
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:57
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copiar_tokens(apps, schema_editor):
+    # Conservar los tokens vigentes como sesiones para no forzar un nuevo login
+    Usuario = apps.get_model('usuario', 'Usuario')
+    SesionUsuario = apps.get_model('usuario', 'SesionUsuario')
+    expira = timezone.now() + timedelta(days=30)
+    SesionUsuario.objects.bulk_create([
+        SesionUsuario(usuario_id=u.id, token=u.token, expira=expira)
+        for u in Usuario.objects.exclude(token__isnull=True).exclude(token='')
+        if len(u.token) <= 64
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0002_permisosusuariotienda_puede_editar_compras'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SesionUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('expira', models.DateTimeField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones', to='usuario.usuario')),
+            ],
+            options={
+                'db_table': 'sesion_usuario',
+            },
+        ),
+        migrations.RunPython(copiar_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='usuario',
+            name='token',
+        ),
+    ]
@@ -4,7 +4,6 @@ from django.db import models
 class Usuario(models.Model):
     username = models.CharField(max_length=150, unique=True)
     password = models.CharField(max_length=128)
-    token = models.CharField(max_length=255, blank=True, null=True)
     es_superusuario = models.BooleanField(default=False)
     
     @property
@@ -32,3 +31,17 @@ class PermisosUsuarioTienda(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["usuario", "tienda"], name="unique_usuario_por_tienda"),
         ]
+
+
+class SesionUsuario(models.Model):
+    """Sesión (token Bearer) de un usuario. Un usuario puede tener varias activas."""
+    usuario = models.ForeignKey(Usuario, related_name='sesiones', on_delete=models.CASCADE)
+    token = models.CharField(max_length=64, unique=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField()
+
+    class Meta:
+        db_table = 'sesion_usuario'
+
+    def __str__(self):
+        return f"{self.usuario_id}:{self.token[:8]}"
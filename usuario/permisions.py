@@ -1,7 +1,11 @@
 from functools import wraps
-import json
+import inspect
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpRequest
-from usuario.models import Usuario, PermisosUsuarioTienda
+from usuario.models import Usuario
+from usuario.auth import get_user_for_token
+from usuario import permisos_cache
 
 
 def _get_user_from_request(request: HttpRequest) -> Usuario | None:
@@ -20,22 +24,69 @@ def _get_user_from_request(request: HttpRequest) -> Usuario | None:
 	else:
 		token = auth.strip()
 
-	return Usuario.objects.filter(token=token).first()
+	return get_user_for_token(token)
+
+
+class PermissionContext:
+	"""Permisos del usuario autenticado, resueltos una sola vez por request.
+
+	Guarda los permisos del usuario indexados por `tienda_id` (`{tienda_id: {permiso: bool}}`)
+	para responder `has_permission` / `get_allowed_tiendas` desde memoria.
+	"""
+
+	def __init__(self, user: Usuario | None, permisos: dict | None = None):
+		self.user = user
+		self.permisos = permisos or {}
+
+	@classmethod
+	def for_user(cls, user: Usuario | None) -> "PermissionContext":
+		# Superusuarios no necesitan filas de permisos: tienen acceso a todo
+		if not user or getattr(user, "es_superusuario", False):
+			return cls(user)
+		return cls(user, permisos_cache.get_permisos(user.id))
+
+	@property
+	def es_superusuario(self) -> bool:
+		return bool(self.user and getattr(self.user, "es_superusuario", False))
+
+	def has_permission(self, tienda_id: int, perm_attr: str) -> bool:
+		if not self.user:
+			return False
+		if self.es_superusuario:
+			return True
+		permiso = self.permisos.get(tienda_id)
+		if not permiso:
+			return False
+		return bool(permiso.get(perm_attr, False))
+
+	def get_allowed_tiendas(self) -> list | None:
+		if not self.user:
+			return []
+		if self.es_superusuario:
+			return None
+		return list(self.permisos)
+
+
+def get_permission_context(request: HttpRequest) -> PermissionContext:
+	"""Devuelve el `PermissionContext` del request, construyéndolo la primera vez.
+
+	El contexto se guarda en el propio request, de modo que serializar cientos de
+	detalles o encadenar decoradores no repite consultas de usuario ni de permisos.
+	"""
+	ctx = getattr(request, "_permission_context", None)
+	if ctx is None:
+		ctx = PermissionContext.for_user(_get_user_from_request(request))
+		request._permission_context = ctx
+	return ctx
 
 
 def has_permission(user: Usuario, tienda_id: int, perm_attr: str) -> bool:
 	"""Comprueba si `user` tiene el permiso `perm_attr` para la `tienda_id`.
 
-	Si `user.es_superusuario` devuelve True.
+	Si `user.es_superusuario` devuelve True. Dentro de una vista es preferible
+	`get_permission_context(request).has_permission(...)`, que no repite consultas.
 	"""
-	if not user:
-		return False
-	if getattr(user, "es_superusuario", False):
-		return True
-	permiso = PermisosUsuarioTienda.objects.filter(usuario=user, tienda_id=tienda_id).first()
-	if not permiso:
-		return False
-	return bool(getattr(permiso, perm_attr, False))
+	return PermissionContext.for_user(user).has_permission(tienda_id, perm_attr)
 
 
 def get_allowed_tiendas(user: Usuario) -> list | None:
@@ -43,112 +94,104 @@ def get_allowed_tiendas(user: Usuario) -> list | None:
 
 	Si el usuario es superusuario devuelve `None` para indicar acceso a todas las tiendas.
 	"""
-	if not user:
-		return []
-	if getattr(user, "es_superusuario", False):
-		return None
-	rows = PermisosUsuarioTienda.objects.filter(usuario=user).values_list("tienda_id", flat=True)
-	return list(rows)
-
-
-def _extract_tienda_id(request: HttpRequest, kwargs: dict, tienda_kw: str = "tienda_id") -> int | None:
-	# 1) buscar en kwargs (ruta)
-	if tienda_kw in kwargs:
-		return kwargs[tienda_kw]
-	# 2) buscar en query params
-	try:
-		val = request.GET.get(tienda_kw)
-		if val:
-			return int(val)
-	except Exception:
-		pass
-	# 3) intentar leer body JSON (POST/PUT)
-	try:
-		if request.body:
-			data = json.loads(request.body)
-			if isinstance(data, dict):
-				# Si el cliente incluye directamente el 'tienda_id' en el body
-				if tienda_kw in data:
-					return int(data[tienda_kw])
-				# Si el cliente pasó un 'proveedor_id' en el body, intentar derivar la tienda
-				if 'proveedor_id' in data:
-					try:
-						from proveedor.models import Proveedor as _ProveedorModel
-						prov = _ProveedorModel.objects.filter(id=int(data.get('proveedor_id'))).first()
-						if prov:
-							return prov.tienda_id
-					except Exception:
-						pass
-	except Exception:
-		pass
-	# 4) intentar derivar tienda a partir de identificadores relacionados (detalle, compra, proveedor)
-	try:
-		# Importar modelos localmente para evitar ciclos en importaciones
-		from compra.models import DetalleCompra
-		from compra.models import Compra
-		from proveedor.models import Proveedor
-		from producto.models import Producto
-
-		# Si nos pasan detalle_id podemos obtener la compra -> proveedor -> tienda
-		if "detalle_id" in kwargs:
-			try:
-				detalle = DetalleCompra.objects.select_related("compra__proveedor").get(id=kwargs.get("detalle_id"))
-				return detalle.compra.proveedor.tienda_id
-			except Exception:
-				pass
-
-		# Si nos pasan compra_id
-		if "compra_id" in kwargs:
-			try:
-				compra = Compra.objects.select_related("proveedor").get(id=kwargs.get("compra_id"))
-				return compra.proveedor.tienda_id
-			except Exception:
-				pass
-
-		# Si nos pasan proveedor_id
-		if "proveedor_id" in kwargs:
-			try:
-				prov = Proveedor.objects.get(id=kwargs.get("proveedor_id"))
-				return prov.tienda_id
-			except Exception:
-				pass
-
-		# Si nos pasan producto_id (derivar via Producto -> Proveedor -> tienda)
-		if "producto_id" in kwargs:
-			try:
-				prod = Producto.objects.select_related("proveedor").get(id=kwargs.get("producto_id"))
-				return prod.proveedor.tienda_id
-			except Exception:
-				pass
-	except Exception:
-		# Si no se pueden importar los modelos o falla, retornamos None
-		pass
-	return None
-
-
-def require_permission(perm_attr: str, tienda_kw: str = "tienda_id"):
+	return PermissionContext.for_user(user).get_allowed_tiendas()
+
+
+# Cómo llegar a `tienda_id` desde cada tipo de identificador: (modelo, lookup)
+_TIENDA_LOOKUPS = {
+	"tienda": None,
+	"proveedor": ("proveedor.Proveedor", "tienda_id"),
+	"producto": ("producto.Producto", "proveedor__tienda_id"),
+	"compra": ("compra.Compra", "proveedor__tienda_id"),
+	"detalle": ("compra.DetalleCompra", "compra__proveedor__tienda_id"),
+}
+
+
+class TiendaVia:
+	"""Declara de dónde sale la tienda de una ruta protegida.
+
+	`kind` es el tipo de identificador (`tienda`, `proveedor`, `producto`, `compra`,
+	`detalle`) y `param` el argumento de la vista que lo contiene. Si el identificador
+	viene en el body, `param` es el argumento del schema y `field` su atributo:
+
+	  TiendaVia("detalle", "detalle_id")                 # ruta /detalle/{detalle_id}/
+	  TiendaVia("proveedor", "compra_in", "proveedor_id") # body ya parseado por Ninja
+
+	La tienda se resuelve con una única consulta (ninguna si `kind` es `tienda`).
+	"""
+
+	def __init__(self, kind: str, param: str, field: str | None = None):
+		if kind not in _TIENDA_LOOKUPS:
+			raise ImproperlyConfigured(f"TiendaVia: tipo desconocido '{kind}'")
+		self.kind = kind
+		self.param = param
+		self.field = field
+
+	def __repr__(self):
+		target = f"{self.param}.{self.field}" if self.field else self.param
+		return f"TiendaVia({self.kind!r} <- {target})"
+
+	@property
+	def not_found_status(self) -> int:
+		# identificadores de la ruta -> 404; identificadores del body -> payload inválido
+		return 400 if self.field else 404
+
+	def validate(self, func) -> None:
+		"""Comprueba al declarar la ruta que `func` recibe el argumento (y campo) indicado."""
+		params = inspect.signature(func).parameters
+		if self.param not in params:
+			raise ImproperlyConfigured(f"{func.__qualname__}: {self!r} pero la vista no tiene argumento '{self.param}'")
+		if self.field:
+			fields = getattr(params[self.param].annotation, "model_fields", None)
+			if fields is None or self.field not in fields:
+				raise ImproperlyConfigured(f"{func.__qualname__}: {self!r} pero el schema de '{self.param}' no tiene campo '{self.field}'")
+
+	def resolve(self, kwargs: dict) -> int | None:
+		value = kwargs.get(self.param)
+		if self.field:
+			value = getattr(value, self.field, None)
+		if value is None:
+			return None
+		lookup = _TIENDA_LOOKUPS[self.kind]
+		if lookup is None:
+			return value
+		model_label, path = lookup
+		model = apps.get_model(model_label)
+		return model.objects.filter(pk=value).values_list(path, flat=True).first()
+
+
+def require_permission(perm_attr: str, via: TiendaVia | None = None):
 	"""Decorador que exige que el usuario tenga `perm_attr` en la tienda indicada.
 
+	`via` declara cómo obtener la tienda (ver `TiendaVia`); por defecto se espera un
+	argumento `tienda_id` en la vista. Una declaración que no encaja con la firma de
+	la vista lanza `ImproperlyConfigured` al importar el router, no en cada request.
+
 	Uso:
-	  @require_permission('puede_gestionar_productos')
-	  def view(request, tienda_id, ...):
+	  @require_permission('puede_gestionar_productos', TiendaVia("producto", "producto_id"))
+	  def view(request, producto_id, ...):
 		  ...
 	"""
+	via = via or TiendaVia("tienda", "tienda_id")
 
 	def decorator(func):
+		via.validate(func)
+
 		@wraps(func)
 		def wrapper(request: HttpRequest, *args, **kwargs):
-			user = _get_user_from_request(request)
-			if not user:
+			ctx = get_permission_context(request)
+			if not ctx.user:
 				return 401, {"message": "Token inválido o no proporcionado"}
 
-			tienda_id = _extract_tienda_id(request, kwargs, tienda_kw)
+			tienda_id = via.resolve(kwargs)
 			if tienda_id is None:
-				return 400, {"message": f"Falta '{tienda_kw}' (ruta, query o body)"}
+				return via.not_found_status, {"message": f"No se encontró la tienda a partir de '{via.field or via.param}'"}
 
-			if not has_permission(user, tienda_id, perm_attr):
+			if not ctx.has_permission(tienda_id, perm_attr):
 				return 403, {"message": "No autorizado para esta operación"}
 
+			# la vista puede reutilizar la tienda ya resuelta sin volver a consultarla
+			request.tienda_id = tienda_id
 			return func(request, *args, **kwargs)
 
 		return wrapper
@@ -157,28 +200,28 @@ def require_permission(perm_attr: str, tienda_kw: str = "tienda_id"):
 
 
 # Decoradores específicos para conveniencia
-def require_manage_products(tienda_kw: str = "tienda_id"):
-	return require_permission("puede_gestionar_productos", tienda_kw)
+def require_manage_products(via: TiendaVia | None = None):
+	return require_permission("puede_gestionar_productos", via)
 
 
-def require_manage_providers(tienda_kw: str = "tienda_id"):
-	return require_permission("puede_gestionar_proveedores", tienda_kw)
+def require_manage_providers(via: TiendaVia | None = None):
+	return require_permission("puede_gestionar_proveedores", via)
 
 
-def require_manage_purchases(tienda_kw: str = "tienda_id"):
-	return require_permission("puede_gestionar_compras", tienda_kw)
+def require_manage_purchases(via: TiendaVia | None = None):
+	return require_permission("puede_gestionar_compras", via)
 
 
-def require_view_inventory(tienda_kw: str = "tienda_id"):
-	return require_permission("puede_ver_inventario_compras", tienda_kw)
+def require_view_inventory(via: TiendaVia | None = None):
+	return require_permission("puede_ver_inventario_compras", via)
 
 
 def require_superadmin():
 	def decorator(func):
 		@wraps(func)
 		def wrapper(request: HttpRequest, *args, **kwargs):
-			user = _get_user_from_request(request)
-			if not user or not getattr(user, "es_superusuario", False):
+			ctx = get_permission_context(request)
+			if not ctx.es_superusuario:
 				return 401, {"message": "Se requiere superadmin"}
 			return func(request, *args, **kwargs)
 
@@ -187,7 +230,7 @@ def require_superadmin():
 	return decorator
 
 
-def require_edit_purchases(tienda_kw: str = "tienda_id"):
+def require_edit_purchases(via: TiendaVia | None = None):
 	"""Decorador para permitir edición de compras (usa `puede_editar_compras`)."""
-	return require_permission("puede_editar_compras", tienda_kw)
+	return require_permission("puede_editar_compras", via)
 
@@ -0,0 +1,94 @@
+"""Caché compartida entre workers de los permisos por tienda de cada usuario.
+
+Las entradas viven en el backend de caché de Django (`PERMISOS_CACHE_ALIAS`) y su
+clave incluye un número de versión por usuario. Cualquier alta, cambio o baja de
+`PermisosUsuarioTienda` debe llamar a `bump_version`: las entradas con la versión
+anterior dejan de leerse y caducan solas, así que ningún worker sirve permisos viejos.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from usuario.models import PermisosUsuarioTienda
+
+
+PERM_FIELDS = [f.name for f in PermisosUsuarioTienda._meta.fields if f.name.startswith("puede_")]
+
+CACHE_ALIAS = getattr(settings, "PERMISOS_CACHE_ALIAS", "default")
+CACHE_TIMEOUT = getattr(settings, "PERMISOS_CACHE_TIMEOUT", 60 * 60)
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+	return caches[CACHE_ALIAS]
+
+
+def _version_key(usuario_id: int) -> str:
+	return f"permisos:version:{usuario_id}"
+
+
+def _entry_key(usuario_id: int, version: int) -> str:
+	return f"permisos:{usuario_id}:v{version}"
+
+
+def _new_version() -> int:
+	# Valor basado en el reloj: distinto de cualquier versión anterior sin tener que
+	# leerla, y nunca 1 si la clave se pierde (expulsión, reinicio), para no
+	# reutilizar entradas antiguas.
+	return time.time_ns()
+
+
+def get_version(usuario_id: int) -> int:
+	cache = _cache()
+	version = cache.get(_version_key(usuario_id))
+	if version is None:
+		version = _new_version()
+		if not cache.add(_version_key(usuario_id), version, None):
+			version = cache.get(_version_key(usuario_id), version)
+	return version
+
+
+def bump_version(*usuario_ids: int) -> None:
+	"""Invalida los permisos cacheados de los usuarios indicados."""
+	cache = _cache()
+	for usuario_id in usuario_ids:
+		# `set` de un valor nuevo y no `incr`: en backends como FileBasedCache `incr`
+		# es leer y escribir, y dos cambios simultáneos podrían dejar una sola versión
+		cache.set(_version_key(usuario_id), _new_version(), None)
+
+
+def _record(hit: bool) -> None:
+	with _stats_lock:
+		_stats["hits" if hit else "misses"] += 1
+
+
+def get_permisos(usuario_id: int) -> dict[int, dict[str, bool]]:
+	"""Devuelve `{tienda_id: {permiso: bool}}` del usuario, leyendo la BD sólo si falla la caché."""
+	cache = _cache()
+	key = _entry_key(usuario_id, get_version(usuario_id))
+	permisos = cache.get(key)
+	if permisos is not None:
+		_record(True)
+		return permisos
+	_record(False)
+	rows = PermisosUsuarioTienda.objects.filter(usuario_id=usuario_id).values("tienda_id", *PERM_FIELDS)
+	permisos = {row.pop("tienda_id"): row for row in rows}
+	cache.set(key, permisos, CACHE_TIMEOUT)
+	return permisos
+
+
+def get_stats() -> dict:
+	"""Contadores de aciertos/fallos de este worker desde su arranque (o último reset)."""
+	with _stats_lock:
+		hits, misses = _stats["hits"], _stats["misses"]
+	total = hits + misses
+	return {"hits": hits, "misses": misses, "hit_rate": (hits / total) if total else None}
+
+
+def reset_stats() -> None:
+	with _stats_lock:
+		_stats["hits"] = 0
+		_stats["misses"] = 0
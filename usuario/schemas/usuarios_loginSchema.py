@@ -23,6 +23,7 @@ class LoginSchema(Schema):
 
 
 class TokenSchema(ModelSchema):
+    token: str
     permisos: Optional[list[PermisosUsuarioTiendaSchema]] = None
     class Meta:
         model = Usuario
@@ -32,4 +33,4 @@ class UserOutSchema(ModelSchema):
     permisos: Optional[list[PermisosUsuarioTiendaSchema]] = None
     class Meta:
         model = Usuario
-        exclude = ['password', 'token']
\ No newline at end of file
+        exclude = ['password']
\ No newline at end of file
@@ -1,3 +1,215 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from compra.models import Compra, DetalleCompra
+from core.testing import ApiTestCase
+from producto.models import Producto
+from proveedor.models import Proveedor
+from tienda.models import Tienda
+from usuario import auth, permisos_cache
+from usuario.models import PermisosUsuarioTienda, SesionUsuario
+from usuario.permisions import TiendaVia, get_permission_context, require_permission
+
+
+class TiendaViaTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.propia = Tienda.objects.create(nombre="Propia")
+        self.ajena = Tienda.objects.create(nombre="Ajena")
+        self.crear_usuario("limitado", tiendas=[self.propia])
+        self.detalle_propio = self._detalle(self.propia)
+        self.detalle_ajeno = self._detalle(self.ajena)
+        self.token = self.login("limitado")
+
+    def _detalle(self, tienda):
+        proveedor = Proveedor.objects.create(nombre="P", tienda=tienda)
+        producto = Producto.objects.create(nombre="a", proveedor=proveedor, orden=1024)
+        compra = Compra.objects.create(proveedor=proveedor, fecha_compra="2026-01-01")
+        return DetalleCompra.objects.create(compra=compra, producto=producto, cantidad=1, inventario_anterior=1)
+
+    def test_detalle_de_otra_tienda_es_403(self):
+        respuesta = self.api("patch", f"/compra/detalle/editar/{self.detalle_ajeno.id}/", {"cantidad": 5})
+        self.assertEqual(respuesta.status_code, 403)
+        self.detalle_ajeno.refresh_from_db()
+        self.assertEqual(self.detalle_ajeno.cantidad, 1)
+
+        respuesta = self.api("delete", f"/compra/detalle/eliminar/{self.detalle_ajeno.id}/")
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertTrue(DetalleCompra.objects.filter(id=self.detalle_ajeno.id).exists())
+
+    def test_detalle_de_tienda_propia(self):
+        respuesta = self.api("patch", f"/compra/detalle/editar/{self.detalle_propio.id}/", {"cantidad": 5})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()["cantidad"], 5)
+
+    def test_detalle_inexistente_es_404(self):
+        respuesta = self.api("patch", "/compra/detalle/editar/999999/", {"cantidad": 5})
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_tienda_desde_el_body(self):
+        proveedor_ajeno = self.detalle_ajeno.compra.proveedor_id
+        respuesta = self.api("post", "/compra/crear/", {"proveedor_id": proveedor_ajeno, "fecha_compra": "2026-02-01"})
+        self.assertEqual(respuesta.status_code, 403)
+        # identificador inexistente en el body: payload inválido, no 404
+        respuesta = self.api("post", "/compra/crear/", {"proveedor_id": 999999, "fecha_compra": "2026-02-01"})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_declaracion_que_no_encaja_con_la_vista(self):
+        with self.assertRaises(ImproperlyConfigured):
+            @require_permission("puede_editar_compras", TiendaVia("detalle", "detalle_id"))
+            def vista(request, compra_id: int):
+                pass
+        with self.assertRaises(ImproperlyConfigured):
+            TiendaVia("deposito", "deposito_id")
+
+
+class PermissionContextTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.propia = Tienda.objects.create(nombre="Propia")
+        self.ajena = Tienda.objects.create(nombre="Ajena")
+        self.crear_usuario("admin", superusuario=True)
+        self.crear_usuario("limitado", tiendas=[self.propia], puede_ver_inventario_compras=False)
+        self.token = self.login("limitado")
+
+    def _request(self, token):
+        return RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_una_resolucion_por_request(self):
+        request = self._request(self.token)
+        ctx = get_permission_context(request)
+        with self.assertNumQueries(0):
+            self.assertIs(get_permission_context(request), ctx)
+            self.assertTrue(ctx.has_permission(self.propia.id, "puede_editar_compras"))
+            self.assertFalse(ctx.has_permission(self.propia.id, "puede_ver_inventario_compras"))
+            self.assertFalse(ctx.has_permission(self.ajena.id, "puede_editar_compras"))
+            self.assertEqual(ctx.get_allowed_tiendas(), [self.propia.id])
+
+    def test_superusuario_y_anonimo(self):
+        admin = get_permission_context(self._request(self.login("admin")))
+        self.assertTrue(admin.has_permission(self.ajena.id, "puede_ver_inventario_compras"))
+        self.assertIsNone(admin.get_allowed_tiendas())
+
+        anonimo = get_permission_context(RequestFactory().get("/"))
+        self.assertFalse(anonimo.has_permission(self.propia.id, "puede_editar_compras"))
+        self.assertEqual(anonimo.get_allowed_tiendas(), [])
+
+    def test_consultas_no_dependen_de_las_compras(self):
+        proveedor = Proveedor.objects.create(nombre="P", tienda=self.propia)
+        for nombre in ("a", "b", "c"):
+            Producto.objects.create(nombre=nombre, proveedor=proveedor, orden=1024)
+
+        def consultas(n_compras):
+            for dia in range(Compra.objects.count() + 1, n_compras + 1):
+                compra = Compra.objects.create(proveedor=proveedor, fecha_compra=f"2026-01-{dia:02d}")
+                DetalleCompra.objects.crear_vacios_para_compra(compra)
+            # URL distinta cada vez: sin ETag cacheado en el cliente
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.api("get", f"/compra/rango/{proveedor.id}/?limit=20&n={n_compras}")
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(len(respuesta.json()), n_compras)
+            # inventario enmascarado en cada detalle sin volver a consultar permisos
+            self.assertEqual({d["inventario_anterior"] for c in respuesta.json() for d in c["detalles"]}, {"?"})
+            return len(capturadas)
+
+        consultas(1)  # calienta sesión y permisos
+        self.assertEqual(consultas(2), consultas(12))
+
+
+class SesionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = self.crear_usuario("usuario")
+        self.crear_usuario("admin", superusuario=True)
+
+    def _listar(self, token):
+        return self.api("get", "/tienda/listar/", token=token).status_code
+
+    def test_varias_sesiones_y_logout_de_una(self):
+        primera, segunda = self.login("usuario"), self.login("usuario")
+        self.assertNotEqual(primera, segunda)
+        self.assertEqual(SesionUsuario.objects.filter(usuario=self.usuario).count(), 2)
+
+        self.assertEqual(self.api("post", "/usuario/logout/", token=primera).status_code, 200)
+        self.assertEqual(self._listar(primera), 401)
+        self.assertEqual(auth.get_user_for_token(segunda), self.usuario)
+
+    def test_sesion_vencida(self):
+        token = self.login("usuario")
+        SesionUsuario.objects.filter(token=token).update(expira=timezone.now() - timedelta(seconds=1))
+        auth.token_cache.clear()
+        self.assertIsNone(auth.get_user_for_token(token))
+        # el próximo login limpia las sesiones vencidas del usuario
+        self.login("usuario")
+        self.assertFalse(SesionUsuario.objects.filter(token=token).exists())
+
+    def test_token_cacheado_sin_consultas(self):
+        token = self.login("usuario")
+        auth.token_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(auth.get_user_for_token(token), self.usuario)
+        with self.assertNumQueries(0):
+            self.assertEqual(auth.get_user_for_token(token), self.usuario)
+
+    def test_revocacion_de_otro_worker(self):
+        token = self.login("usuario")
+        self.assertEqual(auth.get_user_for_token(token), self.usuario)
+        # otro worker cerró la sesión: sólo borró la fila y publicó la revocación
+        SesionUsuario.objects.filter(token=token).delete()
+        auth._publicar_revocacion(auth._token_revocado_key(token))
+
+        # dentro del intervalo se sigue usando el acierto de la caché local
+        self.assertEqual(auth.get_user_for_token(token), self.usuario)
+        with mock.patch.object(auth, "REVOCACION_INTERVALO", 0):
+            self.assertIsNone(auth.get_user_for_token(token))
+
+    def test_usuario_eliminado_pierde_todas_sus_sesiones(self):
+        tokens = [self.login("usuario"), self.login("usuario")]
+        for token in tokens:
+            self.assertEqual(self._listar(token), 200)
+        respuesta = self.api("delete", f"/usuario/eliminar/{self.usuario.id}/", token=self.login("admin"))
+        self.assertEqual(respuesta.status_code, 200)
+        for token in tokens:
+            self.assertEqual(self._listar(token), 401)
+
+
+class PermisosCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tienda = Tienda.objects.create(nombre="Tienda")
+        self.usuario = self.crear_usuario("usuario", tiendas=[self.tienda])
+        self.crear_usuario("admin", superusuario=True)
+        self.token = self.login("admin")
+
+    def test_segunda_lectura_desde_la_cache(self):
+        with self.assertNumQueries(1):
+            permisos = permisos_cache.get_permisos(self.usuario.id)
+        self.assertTrue(permisos[self.tienda.id]["puede_ver_inventario_compras"])
+        with self.assertNumQueries(0):
+            self.assertEqual(permisos_cache.get_permisos(self.usuario.id), permisos)
+
+    def test_cambio_de_permisos_invalida_la_entrada(self):
+        permisos_cache.get_permisos(self.usuario.id)
+        permiso = PermisosUsuarioTienda.objects.get(usuario=self.usuario)
+        valores = dict.fromkeys(permisos_cache.PERM_FIELDS, True) | {"puede_ver_inventario_compras": False}
+        respuesta = self.api("put", f"/usuario/permisos/actualizar/{permiso.id}/", valores)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertFalse(permisos_cache.get_permisos(self.usuario.id)[self.tienda.id]["puede_ver_inventario_compras"])
+
+        respuesta = self.api("delete", f"/usuario/permisos/eliminar/{permiso.id}/")
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(permisos_cache.get_permisos(self.usuario.id), {})
+
+    def test_version_perdida_no_reutiliza_entradas_viejas(self):
+        permisos_cache.get_permisos(self.usuario.id)
+        PermisosUsuarioTienda.objects.filter(usuario=self.usuario).delete()
+        # expulsada la clave de versión (sin bump): la nueva no puede coincidir con la anterior
+        caches[permisos_cache.CACHE_ALIAS].delete(permisos_cache._version_key(self.usuario.id))
+        self.assertEqual(permisos_cache.get_permisos(self.usuario.id), {})